@@ -0,0 +1,201 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+from framestore import FLAG_BITRATE_SWITCH, FLAG_FLEXIBLE_DATA_RATE, MAX_PAYLOAD_FD, FrameBatch
+from instrumentation import metrics
+
+"""接收流水线的无界面吞吐量基准测试"""
+
+# 在 offscreen 平台上运行真实的 MainWindow / 模型 / 视图，
+# 由一个生产者线程按指定的速率生成合成帧，经 FrameReader.deliver() 走与真实设备相同的排队信号路径。
+# 每个场景结束后输出：持续吞吐量、每批延迟的百分位数（从生成到模型更新完成）、峰值 RSS 和丢弃的帧数。
+# 峰值 RSS 在场景运行期间采样（生产者每生成一批、GUI 线程每处理一轮事件各读一次 /proc/self/statm），
+# 因此是这个场景自己的峰值；ru_maxrss 是整个进程的峰值，只能在报告的最后给出一次。
+# 结果以 JSON 格式输出，便于比较不同版本之间的性能回退。
+#
+# 用法：python benchmark.py [--rates 1000 10000 100000] [--payload-sizes 8 64] [--duration 3] [--output result.json]
+
+DEFAULT_RATES = [1000, 5000, 10000, 20000, 50000, 100000]  # 帧/秒
+DEFAULT_PAYLOAD_SIZES = [8, 64]  # CAN 和 CAN FD
+BATCH_INTERVAL = 0.01  # 生产者每 10 ms 生成一批帧
+
+
+# 生成 count 帧合成数据，ID 在 150 个周期性 ID 之间循环
+def synthetic_batch(first_number, count, payload_size, timestamp):
+    numbers = np.arange(first_number, first_number + count, dtype=np.int64)
+    payload = np.zeros((count, MAX_PAYLOAD_FD), np.uint8)
+    payload[:, :payload_size] = (numbers[:, None] + np.arange(payload_size)) & 0xFF
+    flags = FLAG_FLEXIBLE_DATA_RATE | FLAG_BITRATE_SWITCH if payload_size > 8 else 0
+    return FrameBatch(numbers, timestamp + np.arange(count, dtype=np.int64),
+                      (0x100 + numbers % 150).astype(np.uint32),
+                      np.full(count, flags, np.uint8), np.full(count, payload_size, np.uint8),
+                      payload, received_at=time.perf_counter())
+
+
+def current_rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def percentile(values, p):
+    return round(float(np.percentile(values, p)) * 1000, 3) if values else None
+
+
+class Producer(threading.Thread):
+    """按固定速率生成合成帧并交给 FrameReader.deliver() 的线程。"""
+
+    def __init__(self, reader, rate, payload_size, duration):
+        super().__init__(daemon=True)
+        self.m_reader = reader
+        self.m_rate = rate
+        self.m_payloadSize = payload_size
+        self.m_duration = duration
+        self.m_created = []  # (第一帧的序号, 最后一帧的序号, 生成时间)
+        self.m_produced = 0
+        self.m_peakRss = 0
+
+    def run(self):
+        per_batch = max(1, int(round(self.m_rate * BATCH_INTERVAL)))
+        start = time.perf_counter()
+        deadline = start + self.m_duration
+        next_time = start
+        number = 1
+        while next_time < deadline:
+            now = time.perf_counter()
+            if now < next_time:
+                time.sleep(next_time - now)
+            batch = synthetic_batch(number, per_batch, self.m_payloadSize, int(next_time * 1e6))
+            self.m_created.append((number, number + per_batch - 1, time.perf_counter()))
+            self.m_reader.deliver(batch)
+            number += per_batch
+            self.m_produced += per_batch
+            self.m_peakRss = max(self.m_peakRss, current_rss_kb())
+            next_time += BATCH_INTERVAL
+
+
+def run_scenario(app, window, rate, payload_size, duration):
+    from PySide6.QtCore import QEventLoop
+
+    model = window.m_model
+    model.clear()
+    reader = window.m_reader
+    dropped_before = reader.statistics()["dropped"]
+    metrics.reset()
+
+    # 包装模型的 update()，记录每一批帧从生成到显示完成的延迟
+    latencies = []
+    producer = Producer(reader, rate, payload_size, duration)
+    original_update = type(model).update
+    cursor = [0]
+
+    def timed_update():
+        original_update(model)
+        rows = model.rowCount()
+        if not rows:
+            return
+        last_number = int(model.m_frames.number[model.m_frames.physical(rows - 1)])
+        now = time.perf_counter()
+        created = producer.m_created
+        while cursor[0] < len(created) and created[cursor[0]][1] <= last_number:
+            latencies.append(now - created[cursor[0]][2])
+            cursor[0] += 1
+
+    model.update = timed_update
+    start = time.perf_counter()
+    peak_rss = current_rss_kb()
+    producer.start()
+    # 生产者结束后继续运行，直到所有排队的帧都被模型取走并显示
+    while producer.is_alive() or reader.statistics()["queue_depth"] or model.need_update():
+        app.processEvents(QEventLoop.AllEvents, 10)
+        peak_rss = max(peak_rss, current_rss_kb())
+        if time.perf_counter() - start > duration * 10 + 10:
+            break  # 防止流水线卡死时基准测试无法结束
+    elapsed = time.perf_counter() - start
+    del model.update
+
+    dropped = dropped_frames(reader, dropped_before)
+    end_rss = current_rss_kb()
+    return {
+        "rate": rate,
+        "payload_size": payload_size,
+        "duration_s": round(elapsed, 3),
+        "produced_frames": producer.m_produced,
+        "dropped_frames": dropped,
+        "throughput_fps": round((producer.m_produced - dropped) / elapsed, 1),
+        "batches": len(latencies),
+        "latency_ms": {"p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+                       "p99": percentile(latencies, 99),
+                       "max": percentile(latencies, 100)},
+        "peak_rss_kb": max(peak_rss, producer.m_peakRss, end_rss),
+        "end_rss_kb": end_rss,
+        "refresh": window.m_refreshScheduler.statistics(),
+        "metrics": metrics.snapshot()["histograms"],
+    }
+
+
+def dropped_frames(reader, dropped_before):
+    return reader.statistics()["dropped"] - dropped_before
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Receive pipeline throughput benchmark")
+    parser.add_argument("--rates", type=int, nargs="+", default=DEFAULT_RATES,
+                        help="frame rates to test, frames per second")
+    parser.add_argument("--payload-sizes", type=int, nargs="+", default=DEFAULT_PAYLOAD_SIZES,
+                        help="payload sizes to test, 8 for CAN and up to 64 for CAN FD")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per scenario")
+    parser.add_argument("--queue-limit", type=int, default=1000, help="ring buffer size of the model")
+    parser.add_argument("--filter", default="",
+                        help="software filter expression applied before the model, see filterengine")
+    parser.add_argument("--record", help="also record every frame to this binary log file, see recorder")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    from mainwindow import MainWindow
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = MainWindow()
+    window.m_model.set_queue_limit(args.queue_limit)
+    window.m_filterEdit.setText(args.filter)
+    window._filter_changed()
+    window.show()
+    recorder = None
+    if args.record:
+        from recorder import LogRecorder
+        recorder = LogRecorder(args.record)
+        recorder.start()
+        window.m_reader.set_recorder(recorder)
+
+    results = []
+    for payload_size in args.payload_sizes:
+        for rate in args.rates:
+            results.append(run_scenario(app, window, rate, payload_size, args.duration))
+
+    report = {"queue_limit": args.queue_limit, "filter": args.filter,
+              "recorder": recorder.stop() if recorder else None,
+              "process_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              "scenarios": results}
+    window.close()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
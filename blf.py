@@ -0,0 +1,472 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE,
+                        FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_LOCAL_ECHO,
+                        FLAG_REMOTE, FD_LENGTHS, MAX_PAYLOAD_FD, FrameBatch)
+from recorder import LogFormatError
+
+# Vector BLF（Binary Logging Format）的读写。
+#
+# 文件由 144 字节的文件头和一串对象组成，每个对象以 "LOBJ" 开头。CAN 帧对象通常打包在日志容器（LOG_CONTAINER）中，
+# 容器的内容用 zlib 压缩，一个对象可能跨越两个容器。对象之后补 object_size % 4 个字节的填充（与 python-can 一致）。
+#
+# 写入（BlfEncoder）：与 recorder.BinaryLogEncoder 的接口相同，由 LogRecorder 在写线程中调用，压缩不会占用 GUI 线程。
+# 同一批帧按类型（经典帧 CAN_MESSAGE、CAN FD 帧 CAN_FD_MESSAGE、错误帧 CAN_ERROR_EXT）各用一个 numpy 结构化数组整批填写，
+# 再按原来的顺序拼成对象流；对象流每满 CONTAINER_SIZE 字节压缩为一个容器。
+#
+# 读取（BlfReader）：打开时只用 mmap 扫描顶层对象的头部，建立容器的位置表，不解压。
+# 容器在需要时才解压和解析：batches() 顺序读取整个文件；fetch_more()/batch() 供按需浏览的模型（见 logfilemodel）使用，
+# 最近用过的容器解析结果保存在有上限的 LRU 缓存中。解析时只逐个读取对象头，各字段按类型整列取出。
+
+FILE_SIGNATURE = b"LOGG"
+OBJECT_SIGNATURE = b"LOBJ"
+FILE_HEADER_SIZE = 144
+_FILE_HEADER = struct.Struct("<4sLBBBBBBBBQQLL8H8H")
+_OBJECT_BASE = struct.Struct("<4sHHLL")  # 签名、头部大小、头部版本、对象大小、对象类型
+_CONTAINER = struct.Struct("<H6xL4x")  # 压缩方法、解压后的大小
+
+NO_COMPRESSION = 0
+ZLIB_DEFLATE = 2
+
+CAN_MESSAGE = 1
+CAN_ERROR = 2
+LOG_CONTAINER = 10
+CAN_ERROR_EXT = 73
+CAN_MESSAGE2 = 86
+CAN_FD_MESSAGE = 100
+CAN_FD_MESSAGE_64 = 101
+
+TIME_TEN_MICS = 0x1  # 对象时间戳的单位为 10 微秒
+TIME_ONE_NANS = 0x2  # 对象时间戳的单位为纳秒
+
+CAN_MSG_EXT = 0x80000000  # ID 中的扩展帧标志
+DIR_TX = 0x01
+REMOTE_FLAG = 0x80
+FD_EDL = 0x1
+FD_BRS = 0x2
+FD_ESI = 0x4
+FD64_REMOTE = 0x0010
+FD64_EDL = 0x1000
+FD64_BRS = 0x2000
+FD64_ESI = 0x4000
+
+CONTAINER_SIZE = 128 * 1024  # 每个容器压缩前的字节数
+COMPRESSION_LEVEL = 6
+CONTAINER_CACHE = 64  # 按需浏览时缓存解析结果的容器个数
+FETCH_ROWS = 10000  # fetch_more() 每次至少新解析的帧数
+
+_OBJECT_HEADER = [("signature", "S4"), ("header_size", "<u2"), ("header_version", "<u2"),
+                  ("object_size", "<u4"), ("object_type", "<u4"), ("time_flags", "<u4"),
+                  ("client_index", "<u2"), ("object_version", "<u2"), ("timestamp", "<u8")]
+_OBJECT_HEADER_SIZE = 32
+CAN_MESSAGE_DTYPE = np.dtype(_OBJECT_HEADER + [
+    ("channel", "<u2"), ("flags", "u1"), ("dlc", "u1"), ("can_id", "<u4"), ("data", "u1", (8,))])
+CAN_FD_MESSAGE_DTYPE = np.dtype(_OBJECT_HEADER + [
+    ("channel", "<u2"), ("flags", "u1"), ("dlc", "u1"), ("can_id", "<u4"), ("frame_length", "<u4"),
+    ("bit_count", "u1"), ("fd_flags", "u1"), ("valid_bytes", "u1"), ("reserved", "V5"),
+    ("data", "u1", (MAX_PAYLOAD_FD,))])
+CAN_ERROR_EXT_DTYPE = np.dtype(_OBJECT_HEADER + [
+    ("channel", "<u2"), ("length", "<u2"), ("flags", "<u4"), ("ecc", "u1"), ("position", "u1"),
+    ("dlc", "u1"), ("reserved1", "V1"), ("frame_length", "<u4"), ("can_id", "<u4"),
+    ("flags_ext", "<u2"), ("reserved2", "V2"), ("data", "u1", (8,))])
+
+
+def _systemtime(microseconds):
+    date = datetime.fromtimestamp(microseconds / 1000000)
+    return (date.year, date.month, date.isoweekday() % 7, date.day, date.hour, date.minute,
+            date.second, date.microsecond // 1000)
+
+
+def _from_systemtime(values):
+    year, month, _, day, hour, minute, second, milliseconds = values
+    if not year:
+        return 0
+    try:
+        date = datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return 0
+    return int(date.timestamp()) * 1000000 + milliseconds * 1000
+
+
+def _object_header(records, object_type, timestamps):
+    records["signature"] = OBJECT_SIGNATURE
+    records["header_size"] = _OBJECT_HEADER_SIZE
+    records["header_version"] = 1
+    records["object_size"] = records.dtype.itemsize
+    records["object_type"] = object_type
+    records["time_flags"] = TIME_ONE_NANS
+    records["timestamp"] = timestamps
+    records["channel"] = 1
+
+
+class BlfEncoder():
+    """BLF 格式的编码器，接口见 recorder.BinaryLogEncoder。
+
+    对象的时间戳为相对于文件头中开始时间（第一帧的时间戳截断到毫秒）的纳秒数。
+    文件头在结束时由 finish() 改写，写入文件大小、对象个数和开始、结束时间。
+    """
+
+    def __init__(self, compression_level=COMPRESSION_LEVEL):
+        self.m_level = compression_level
+        self.m_buffer = bytearray()  # 还没有压缩的对象流
+        self.m_start = None
+        self.m_stop = 0
+        self.m_objects = 0
+        self.m_uncompressed = FILE_HEADER_SIZE
+
+    def begin(self):
+        return self._file_header(0)
+
+    def _file_header(self, file_size):
+        start = self.m_start or 0
+        header = _FILE_HEADER.pack(FILE_SIGNATURE, FILE_HEADER_SIZE, 0, 0, 0, 0, 2, 6, 8, 1,
+                                   file_size, self.m_uncompressed, self.m_objects, 0,
+                                   *_systemtime(start), *_systemtime(max(self.m_stop, start)))
+        return header.ljust(FILE_HEADER_SIZE, b"\0")
+
+    def encode(self, batch):
+        count = len(batch)
+        if not count:
+            return b""
+        if self.m_start is None:
+            first = int(batch.timestamp[0])
+            self.m_start = first - first % 1000
+        self.m_stop = int(batch.timestamp[-1])
+        timestamps = np.maximum(batch.timestamp - self.m_start, 0) * 1000
+        flags = batch.flags
+        direction = np.where(flags & FLAG_LOCAL_ECHO, DIR_TX, 0).astype(np.uint8)
+        can_id = batch.can_id.astype(np.uint32) | np.where(flags & FLAG_EXTENDED, CAN_MSG_EXT, 0).astype(np.uint32)
+        error = (flags & FLAG_ERROR_FRAME) != 0
+        fd = ((flags & FLAG_FLEXIBLE_DATA_RATE) != 0) & ~error
+        classic = ~(error | fd)
+
+        parts = []  # (掩码, 记录数组)
+        if classic.any():
+            records = np.zeros(int(classic.sum()), CAN_MESSAGE_DTYPE)
+            _object_header(records, CAN_MESSAGE, timestamps[classic])
+            records["flags"] = direction[classic] | np.where(flags[classic] & FLAG_REMOTE, REMOTE_FLAG, 0)
+            records["dlc"] = batch.dlc[classic]
+            records["can_id"] = can_id[classic]
+            records["data"] = batch.payload[classic, :8]
+            parts.append((classic, records))
+        if fd.any():
+            records = np.zeros(int(fd.sum()), CAN_FD_MESSAGE_DTYPE)
+            _object_header(records, CAN_FD_MESSAGE, timestamps[fd])
+            records["flags"] = direction[fd]
+            records["dlc"] = np.searchsorted(FD_LENGTHS, batch.dlc[fd])
+            records["can_id"] = can_id[fd]
+            records["fd_flags"] = (FD_EDL | np.where(flags[fd] & FLAG_BITRATE_SWITCH, FD_BRS, 0)
+                                   | np.where(flags[fd] & FLAG_ERROR_STATE, FD_ESI, 0))
+            records["valid_bytes"] = batch.dlc[fd]
+            records["data"] = batch.payload[fd]
+            parts.append((fd, records))
+        if error.any():
+            records = np.zeros(int(error.sum()), CAN_ERROR_EXT_DTYPE)
+            _object_header(records, CAN_ERROR_EXT, timestamps[error])
+            records["length"] = np.minimum(batch.dlc[error], 8)
+            records["dlc"] = np.minimum(batch.dlc[error], 8)
+            records["can_id"] = batch.can_id[error]
+            records["data"] = batch.payload[error, :8]
+            parts.append((error, records))
+
+        # 三种对象的大小都是 4 的倍数，不需要填充；按帧的顺序把各自的字节放到对象流中
+        if len(parts) == 1:
+            stream = parts[0][1].view(np.uint8)
+        else:
+            sizes = np.zeros(count, np.int64)
+            for mask, records in parts:
+                sizes[mask] = records.dtype.itemsize
+            offsets = np.cumsum(sizes) - sizes
+            stream = np.empty(int(sizes.sum()), np.uint8)
+            for mask, records in parts:
+                size = records.dtype.itemsize
+                stream[offsets[mask][:, None] + np.arange(size)] = records.view(np.uint8).reshape(-1, size)
+        self.m_objects += count
+        self.m_buffer += stream.tobytes()
+        return self._containers(CONTAINER_SIZE)
+
+    # 把对象流中满 size 字节的部分压缩为容器，返回容器的字节
+    def _containers(self, size):
+        output = []
+        while self.m_buffer and len(self.m_buffer) >= size:
+            data = bytes(self.m_buffer[:CONTAINER_SIZE])
+            del self.m_buffer[:CONTAINER_SIZE]
+            compressed = zlib.compress(data, self.m_level)
+            object_size = _OBJECT_BASE.size + _CONTAINER.size + len(compressed)
+            output.append(_OBJECT_BASE.pack(OBJECT_SIGNATURE, _OBJECT_BASE.size, 1, object_size, LOG_CONTAINER))
+            output.append(_CONTAINER.pack(ZLIB_DEFLATE, len(data)))
+            output.append(compressed)
+            output.append(b"\0" * (object_size % 4))
+            self.m_uncompressed += _OBJECT_BASE.size + _CONTAINER.size + len(data)
+        return b"".join(output)
+
+    def end(self):
+        return self._containers(1)
+
+    # 所有内容写完后改写文件头
+    def finish(self, f):
+        file_size = f.seek(0, 2)
+        f.seek(0)
+        f.write(self._file_header(file_size))
+        f.seek(0, 2)
+
+
+# 从 raw 的 positions + offset 处各取一个 dtype 类型的值
+def _gather(raw, positions, offset, dtype):
+    dtype = np.dtype(dtype)
+    if dtype.itemsize == 1:
+        return raw[positions + offset].view(dtype)
+    return raw[(positions + offset)[:, None] + np.arange(dtype.itemsize)].view(dtype).reshape(-1)
+
+
+def _gather_bytes(raw, positions, offset, width):
+    return raw[(positions + offset)[:, None] + np.arange(width)]
+
+
+class BlfReader():
+    """BLF 文件的读取器。打开时只扫描容器的位置，容器的内容在读取对应的帧时才解压。"""
+
+    def __init__(self, file_name):
+        self.m_file = open(file_name, "rb")
+        try:
+            self.m_map = mmap.mmap(self.m_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # 空文件
+            self.m_file.close()
+            raise LogFormatError("file is too short")
+        if len(self.m_map) < _FILE_HEADER.size or self.m_map[:4] != FILE_SIGNATURE:
+            self.close()
+            raise LogFormatError("not a BLF file")
+        fields = _FILE_HEADER.unpack_from(self.m_map, 0)
+        self.m_headerSize = fields[1]
+        self.m_objectCount = fields[12]
+        self.m_start = _from_systemtime(fields[14:22])
+        # 容器表：(数据在文件中的偏移, 长度, 压缩方法)；不在容器中的顶层对象按未压缩的容器处理
+        self.m_containers = self._scan()
+
+        # 按需浏览的状态：已经解析过的前 m_decoded 个容器中的帧
+        self.m_decoded = 0
+        self.m_rowStarts = [0]  # 第 k 个容器中第一帧的行号，最后一项为已知的总行数
+        self.m_carry = [b""]  # 跨入第 k 个容器的不完整对象的字节
+        self.m_skip = [0]  # 第 k 个容器开头需要跳过的填充字节数
+        self.m_cache = OrderedDict()  # 容器下标 -> FrameBatch
+
+    def close(self):
+        self.m_map.close()
+        self.m_file.close()
+
+    def start_time(self):
+        return self.m_start
+
+    def _scan(self):
+        containers = []
+        data = self.m_map
+        pos = self.m_headerSize
+        end = len(data)
+        while pos + _OBJECT_BASE.size <= end:
+            signature, header_size, _, object_size, object_type = _OBJECT_BASE.unpack_from(data, pos)
+            if signature != OBJECT_SIGNATURE or object_size < _OBJECT_BASE.size:
+                found = data.find(OBJECT_SIGNATURE, pos + 1) # 损坏的数据：找下一个对象
+                if found < 0:
+                    break
+                pos = found
+                continue
+            if pos + object_size > end:
+                break # 文件末尾不完整的对象（例如记录被中断）
+            if object_type == LOG_CONTAINER:
+                method, _ = _CONTAINER.unpack_from(data, pos + header_size)
+                offset = pos + header_size + _CONTAINER.size
+                containers.append((offset, pos + object_size - offset, method))
+            else:
+                containers.append((pos, object_size + object_size % 4, NO_COMPRESSION))
+            pos += object_size + object_size % 4
+        return containers
+
+    def _container_data(self, k):
+        offset, size, method = self.m_containers[k]
+        data = self.m_map[offset:offset + size]
+        if method == ZLIB_DEFLATE:
+            return zlib.decompress(data)
+        if method == NO_COMPRESSION:
+            return data
+        raise LogFormatError(f"unsupported compression method {method}")
+
+    # 解析第 k 个容器（加上从前一个容器跨入的字节），返回 (帧, 跨入下一个容器的字节, 下一个容器开头要跳过的字节数)
+    def _decode(self, k, carry, skip):
+        data = carry + self._container_data(k)[skip:] if carry else self._container_data(k)[skip:]
+        objects = []  # (对象类型, 位置, 头部大小)
+        pos = 0
+        end = len(data)
+        unpack = _OBJECT_BASE.unpack_from
+        while pos + _OBJECT_BASE.size <= end:
+            signature, header_size, _, object_size, object_type = unpack(data, pos)
+            if signature != OBJECT_SIGNATURE or object_size < _OBJECT_BASE.size:
+                found = data.find(OBJECT_SIGNATURE, pos + 1)
+                if found < 0:
+                    pos = end
+                    break
+                pos = found
+                continue
+            if pos + object_size > end:
+                break
+            objects.append((object_type, pos, header_size))
+            pos += object_size
+            if object_type != CAN_FD_MESSAGE_64:
+                pos += object_size % 4
+        next_carry = data[pos:] if pos < end else b""
+        next_skip = pos - end if pos > end else 0
+        return self._frames(data, objects), next_carry, next_skip
+
+    # 按对象类型整列取出各个字段，组成 FrameBatch（帧序号由调用者设置）
+    def _frames(self, data, objects):
+        if not objects:
+            return FrameBatch.empty()
+        raw = np.frombuffer(data, np.uint8)
+        types = np.array([o[0] for o in objects], np.int64)
+        positions = np.array([o[1] for o in objects], np.int64)
+        bodies = positions + np.array([o[2] for o in objects], np.int64)
+        keep = np.isin(types, (CAN_MESSAGE, CAN_MESSAGE2, CAN_FD_MESSAGE, CAN_FD_MESSAGE_64,
+                               CAN_ERROR, CAN_ERROR_EXT))
+        types, positions, bodies = types[keep], positions[keep], bodies[keep]
+        count = len(types)
+
+        # 对象头中的时间戳（两个版本的对象头中偏移量相同）
+        time_flags = _gather(raw, positions, 16, "<u4")
+        stamps = _gather(raw, positions, 24, "<u8").astype(np.int64)
+        timestamps = np.where(time_flags == TIME_TEN_MICS, stamps * 10, stamps // 1000) + self.m_start
+
+        can_id = np.zeros(count, np.uint32)
+        flags = np.zeros(count, np.uint8)
+        dlc = np.zeros(count, np.uint8)
+        payload = np.zeros((count, MAX_PAYLOAD_FD), np.uint8)
+
+        rows = np.flatnonzero((types == CAN_MESSAGE) | (types == CAN_MESSAGE2))
+        if len(rows):
+            b = bodies[rows]
+            message_flags = raw[b + 2]
+            ids = _gather(raw, b, 4, "<u4")
+            can_id[rows] = ids & ~np.uint32(CAN_MSG_EXT)
+            flags[rows] = (np.where(ids & CAN_MSG_EXT, FLAG_EXTENDED, 0)
+                           | np.where(message_flags & DIR_TX, FLAG_LOCAL_ECHO, 0)
+                           | np.where(message_flags & REMOTE_FLAG, FLAG_REMOTE, 0))
+            lengths = np.minimum(raw[b + 3], 8)
+            lengths[(message_flags & REMOTE_FLAG) != 0] = 0
+            dlc[rows] = lengths
+            payload[rows, :8] = _gather_bytes(raw, b, 8, 8)
+
+        rows = np.flatnonzero(types == CAN_FD_MESSAGE)
+        if len(rows):
+            b = bodies[rows]
+            message_flags = raw[b + 2]
+            fd_flags = raw[b + 13]
+            ids = _gather(raw, b, 4, "<u4")
+            can_id[rows] = ids & ~np.uint32(CAN_MSG_EXT)
+            flags[rows] = (np.where(ids & CAN_MSG_EXT, FLAG_EXTENDED, 0)
+                           | np.where(message_flags & DIR_TX, FLAG_LOCAL_ECHO, 0)
+                           | np.where(message_flags & REMOTE_FLAG, FLAG_REMOTE, 0)
+                           | np.where(fd_flags & FD_EDL, FLAG_FLEXIBLE_DATA_RATE, 0)
+                           | np.where(fd_flags & FD_BRS, FLAG_BITRATE_SWITCH, 0)
+                           | np.where(fd_flags & FD_ESI, FLAG_ERROR_STATE, 0))
+            dlc[rows] = np.minimum(raw[b + 14], MAX_PAYLOAD_FD)
+            payload[rows] = _gather_bytes(raw, b, 20, MAX_PAYLOAD_FD)
+
+        rows = np.flatnonzero(types == CAN_FD_MESSAGE_64)
+        if len(rows):
+            b = bodies[rows]
+            ids = _gather(raw, b, 4, "<u4")
+            message_flags = _gather(raw, b, 12, "<u4")
+            can_id[rows] = ids & ~np.uint32(CAN_MSG_EXT)
+            flags[rows] = (np.where(ids & CAN_MSG_EXT, FLAG_EXTENDED, 0)
+                           | np.where(raw[b + 34] == 1, FLAG_LOCAL_ECHO, 0)
+                           | np.where(message_flags & FD64_REMOTE, FLAG_REMOTE, 0)
+                           | np.where(message_flags & FD64_EDL, FLAG_FLEXIBLE_DATA_RATE, 0)
+                           | np.where(message_flags & FD64_BRS, FLAG_BITRATE_SWITCH, 0)
+                           | np.where(message_flags & FD64_ESI, FLAG_ERROR_STATE, 0))
+            lengths = np.minimum(raw[b + 2], MAX_PAYLOAD_FD)
+            dlc[rows] = lengths
+            # 数据的长度不固定，可能到达对象流的末尾，逐行拷贝
+            for row, start, length in zip(rows.tolist(), (b + 40).tolist(), lengths.tolist()):
+                payload[row, :length] = raw[start:start + length]
+
+        rows = np.flatnonzero(types == CAN_ERROR_EXT)
+        if len(rows):
+            b = bodies[rows]
+            can_id[rows] = _gather(raw, b, 16, "<u4") & np.uint32(0x1FFFFFFF)
+            flags[rows] = FLAG_ERROR_FRAME
+            dlc[rows] = np.minimum(raw[b + 10], 8)
+            payload[rows, :8] = _gather_bytes(raw, b, 24, 8)
+        flags[types == CAN_ERROR] = FLAG_ERROR_FRAME
+
+        return FrameBatch(np.zeros(count, np.int64), timestamps, can_id, flags, dlc, payload)
+
+    # 顺序读取整个文件，逐个容器返回帧，帧序号从 first_number 开始
+    def batches(self, first_number=1):
+        carry = b""
+        skip = 0
+        for k in range(len(self.m_containers)):
+            batch, carry, skip = self._decode(k, carry, skip)
+            if len(batch):
+                batch.number = np.arange(first_number, first_number + len(batch), dtype=np.int64)
+                first_number += len(batch)
+                yield batch
+
+    # 以下供按需浏览使用：行号从 0 开始，只有解析过的容器中的帧才有行号
+
+    # 已知的帧数
+    def row_count(self):
+        return self.m_rowStarts[-1]
+
+    def can_fetch_more(self):
+        return self.m_decoded < len(self.m_containers)
+
+    # 继续解析后面的容器，直到新得到至少 rows 帧或到达文件末尾，返回新得到的帧数
+    def fetch_more(self, rows=FETCH_ROWS):
+        before = self.row_count()
+        while self.can_fetch_more() and self.row_count() - before < rows:
+            k = self.m_decoded
+            batch, carry, skip = self._decode(k, self.m_carry[k], self.m_skip[k])
+            self._cache(k, batch)
+            self.m_carry.append(carry)
+            self.m_skip.append(skip)
+            self.m_rowStarts.append(self.m_rowStarts[-1] + len(batch))
+            self.m_decoded += 1
+        return self.row_count() - before
+
+    def _cache(self, k, batch):
+        batch.number = np.arange(self.m_rowStarts[k] + 1, self.m_rowStarts[k] + 1 + len(batch),
+                                 dtype=np.int64)
+        self.m_cache[k] = batch
+        if len(self.m_cache) > CONTAINER_CACHE:
+            self.m_cache.popitem(last=False)
+
+    def _decoded_batch(self, k):
+        batch = self.m_cache.get(k)
+        if batch is None:
+            batch, _, _ = self._decode(k, self.m_carry[k], self.m_skip[k])
+            self._cache(k, batch)
+        else:
+            self.m_cache.move_to_end(k)
+        return batch
+
+    # 返回行 [start, stop) 的帧，这些行必须已经由 fetch_more() 解析过
+    def batch(self, start, stop):
+        stop = min(stop, self.row_count())
+        parts = []
+        k = bisect_right(self.m_rowStarts, start) - 1
+        while start < stop and k < self.m_decoded:
+            first = self.m_rowStarts[k]
+            last = self.m_rowStarts[k + 1]
+            if last > start:
+                parts.append(self._decoded_batch(k).slice(start - first, min(stop, last) - first))
+                start = min(stop, last)
+            k += 1
+        return FrameBatch.concatenate(parts)
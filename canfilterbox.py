@@ -0,0 +1,155 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+
+from PySide6.QtCore import Slot
+from PySide6.QtWidgets import (QAbstractItemView, QComboBox, QHBoxLayout, QHeaderView,
+                               QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout,
+                               QWidget)
+from PySide6.QtSerialBus import QCanBusDevice, QCanBusFrame
+
+from framestore import FLAG_ERROR_FRAME, FLAG_EXTENDED, FLAG_REMOTE
+
+# 驱动层接收过滤器（QCanBusDevice.RawFilterKey）的编辑框。
+# 每一行是一个 QCanBusDevice.Filter：帧 ID、ID 掩码、帧类型和帧格式。
+# 当 (帧ID & 掩码) == (过滤器ID & 掩码)，并且类型和格式都匹配时，帧被接收；
+# 列表中任意一个过滤器匹配即可，列表为空时接收所有帧。
+# 支持 RawFilterKey 的后端（例如 SocketCAN）在驱动中丢弃不需要的帧，这些帧根本不会到达应用程序。
+
+FILTER_COLUMN_ID = 0
+FILTER_COLUMN_MASK = 1
+FILTER_COLUMN_TYPE = 2
+FILTER_COLUMN_FORMAT = 3
+
+# 下拉框中显示的文本、设置中保存的名字和对应的枚举值
+filter_types = [("Any", "any", QCanBusFrame.InvalidFrame),
+                ("Data", "data", QCanBusFrame.DataFrame),
+                ("Remote", "remote", QCanBusFrame.RemoteRequestFrame)]
+filter_formats = [("Base + Ext", "both", QCanBusDevice.Filter.MatchBaseAndExtendedFormat),
+                  ("Base", "base", QCanBusDevice.Filter.MatchBaseFormat),
+                  ("Extended", "extended", QCanBusDevice.Filter.MatchExtendedFormat)]
+
+
+def make_filter(frame_id, mask, frame_type=QCanBusFrame.InvalidFrame,
+                frame_format=QCanBusDevice.Filter.MatchBaseAndExtendedFormat):
+    f = QCanBusDevice.Filter()
+    f.frameId = frame_id
+    f.frameIdMask = mask
+    f.type = frame_type
+    f.format = frame_format
+    return f
+
+
+# 过滤器与字符串之间的转换，用于 QSettings 中的保存和恢复，格式为 "ID:掩码:类型:格式"，例如 "100:7ff:data:base"
+def filter_to_text(f):
+    type_name = next((name for _, name, value in filter_types if value == f.type), "any")
+    format_name = next((name for _, name, value in filter_formats if value == f.format), "both")
+    return f"{f.frameId:x}:{f.frameIdMask:x}:{type_name}:{format_name}"
+
+
+def filter_from_text(text):
+    try:
+        frame_id, mask, type_name, format_name = text.split(":")
+        frame_type = next(value for _, name, value in filter_types if name == type_name)
+        frame_format = next(value for _, name, value in filter_formats if name == format_name)
+        return make_filter(int(frame_id, 16), int(mask, 16), frame_type, frame_format)
+    except (ValueError, StopIteration):
+        return None
+
+
+# 在接收线程中按过滤器列表筛选一批帧，返回布尔掩码。
+# 用于不支持 RawFilterKey 的后端，语义与驱动层过滤相同；错误帧不受 RawFilterKey 影响，总是保留
+def filter_batch_mask(batch, filters):
+    if not filters:
+        return np.ones(len(batch), bool)
+    is_extended = (batch.flags & FLAG_EXTENDED) != 0
+    is_remote = (batch.flags & FLAG_REMOTE) != 0
+    result = (batch.flags & FLAG_ERROR_FRAME) != 0
+    for f in filters:
+        matched = (batch.can_id & f.frameIdMask) == (f.frameId & f.frameIdMask)
+        if f.type == QCanBusFrame.DataFrame:
+            matched &= ~is_remote
+        elif f.type == QCanBusFrame.RemoteRequestFrame:
+            matched &= is_remote
+        if f.format == QCanBusDevice.Filter.MatchBaseFormat:
+            matched &= ~is_extended
+        elif f.format == QCanBusDevice.Filter.MatchExtendedFormat:
+            matched &= is_extended
+        result |= matched
+    return result
+
+
+class CanFilterBox(QWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_table = QTableWidget(0, 4, self)
+        self.m_table.setHorizontalHeaderLabels(["ID (hex)", "Mask (hex)", "Type", "Format"])
+        self.m_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.m_table.verticalHeader().hide()
+        self.m_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.m_table.setToolTip("A frame is accepted when (ID & Mask) == (Filter ID & Mask); "
+                                "an empty list accepts every frame")
+
+        self.m_addButton = QPushButton("Add", self)
+        self.m_removeButton = QPushButton("Remove", self)
+        self.m_addButton.clicked.connect(self._add_clicked)
+        self.m_removeButton.clicked.connect(self._remove_clicked)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(self.m_addButton)
+        buttons.addWidget(self.m_removeButton)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.m_table)
+        layout.addLayout(buttons)
+
+    @Slot()
+    def _add_clicked(self):
+        self.add_filter(make_filter(0, 0x7FF, QCanBusFrame.InvalidFrame,
+                                    QCanBusDevice.Filter.MatchBaseFormat))
+
+    @Slot()
+    def _remove_clicked(self):
+        rows = sorted({index.row() for index in self.m_table.selectedIndexes()}, reverse=True)
+        for row in rows:
+            self.m_table.removeRow(row)
+
+    def add_filter(self, f):
+        row = self.m_table.rowCount()
+        self.m_table.insertRow(row)
+        self.m_table.setItem(row, FILTER_COLUMN_ID, QTableWidgetItem(f"{f.frameId:x}"))
+        self.m_table.setItem(row, FILTER_COLUMN_MASK, QTableWidgetItem(f"{f.frameIdMask:x}"))
+        type_box = QComboBox()
+        for text, _, value in filter_types:
+            type_box.addItem(text, value)
+        type_box.setCurrentIndex(max(type_box.findData(f.type), 0))
+        self.m_table.setCellWidget(row, FILTER_COLUMN_TYPE, type_box)
+        format_box = QComboBox()
+        for text, _, value in filter_formats:
+            format_box.addItem(text, value)
+        format_box.setCurrentIndex(max(format_box.findData(f.format), 0))
+        self.m_table.setCellWidget(row, FILTER_COLUMN_FORMAT, format_box)
+
+    def set_filters(self, filters):
+        self.m_table.setRowCount(0)
+        for f in filters:
+            self.add_filter(f)
+
+    # 返回编辑框中的过滤器列表，ID 或掩码不是有效十六进制数的行被忽略
+    def filters(self):
+        result = []
+        for row in range(self.m_table.rowCount()):
+            try:
+                frame_id = int(self.m_table.item(row, FILTER_COLUMN_ID).text(), 16)
+                mask = int(self.m_table.item(row, FILTER_COLUMN_MASK).text(), 16)
+            except (AttributeError, ValueError):
+                continue
+            if not (0 <= frame_id <= 0x1FFFFFFF and 0 <= mask <= 0x1FFFFFFF):
+                continue
+            result.append(make_filter(frame_id, mask,
+                                      self.m_table.cellWidget(row, FILTER_COLUMN_TYPE).currentData(),
+                                      self.m_table.cellWidget(row, FILTER_COLUMN_FORMAT).currentData()))
+        return result
@@ -0,0 +1,121 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+import sqlite3
+
+import numpy as np
+
+from recorder import FSYNC_ALWAYS, FSYNC_NEVER, LogRecorder
+
+# SQLite 捕获库：把接收到的帧写入 SQLite 数据库，可以用 SQL 查询多天的捕获（见 sqlconsole）。
+#
+# 表结构：
+#   frames(number INTEGER PRIMARY KEY, timestamp, can_id, flags, dlc, payload BLOB)
+#     timestamp 为 Unix 微秒，flags 见 framestore 中的标志位，payload 只保存 dlc 个字节
+#   索引 frames_id_time(can_id, timestamp)，按 ID 和时间范围的查询只读索引中的一段
+# 同一个数据库可以多次记录，新的帧追加在后面，number 继续递增。
+#
+# 写入（SqliteRecorder）与 recorder.LogRecorder 相同：接收线程只在锁内追加批次的引用，
+# 写线程每次醒来（积累了 WRITE_FRAMES 帧或过了 flush_interval 秒）把积累的所有帧在一个事务中用 executemany() 插入，
+# 写得慢时最多丢弃帧而不会阻塞接收线程。
+# 数据库使用 WAL 模式：提交只追加到 -wal 文件，查询（例如 SQL 控制台）可以与记录同时进行，互不阻塞。
+# fsync 策略对应 synchronous：always 为 FULL（每次提交都落盘），interval 为 NORMAL（只在检查点落盘，
+# 断电时可能丢失最后几次提交，但数据库不会损坏），never 为 OFF。
+
+CAPTURE_DB_FILTER = "SQLite databases (*.db *.sqlite)"
+CAPTURE_DB_EXTENSIONS = (".db", ".sqlite")
+CACHE_KIB = 65536  # 页面缓存的大小，索引的热点部分留在缓存中
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    number INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    can_id INTEGER NOT NULL,
+    flags INTEGER NOT NULL,
+    dlc INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_id_time ON frames (can_id, timestamp);
+"""
+_INSERT = "INSERT INTO frames (timestamp, can_id, flags, dlc, payload) VALUES (?, ?, ?, ?, ?)"
+
+
+def is_capture_db(file_name):
+    return os.path.splitext(file_name)[1].lower() in CAPTURE_DB_EXTENSIONS
+
+
+# 每一行的有效载荷（dlc 个字节）的 bytes。长度相同的行拼接在一起只调用一次 tobytes()，再按固定宽度切开
+def payload_blobs(payload, dlc):
+    result = [b""] * len(dlc)
+    for length in np.unique(dlc).tolist():
+        if not length:
+            continue
+        rows = np.flatnonzero(dlc == length)
+        block = np.ascontiguousarray(payload[rows, :length]).tobytes()
+        for i, row in enumerate(rows.tolist()):
+            result[row] = block[i * length:(i + 1) * length]
+    return result
+
+
+class SqliteRecorder(LogRecorder):
+    """把帧写入 SQLite 数据库的记录器，接口与 LogRecorder 相同。
+
+    统计中的 bytes 为数据库（包括还在 WAL 文件中的提交）增长的字节数。
+    """
+
+    def __init__(self, file_name, **kwargs):
+        super().__init__(file_name, **kwargs)
+        self.m_connection = None
+        self.m_size = 0
+
+    def _database_size(self):
+        page_count = self.m_connection.execute("PRAGMA page_count").fetchone()[0]
+        return page_count * self.m_connection.execute("PRAGMA page_size").fetchone()[0]
+
+    # 连接在 GUI 线程中建立（出错时由 start() 抛出），之后只在写线程中使用
+    def _open(self):
+        synchronous = "FULL" if self.m_fsync == FSYNC_ALWAYS else "OFF" if self.m_fsync == FSYNC_NEVER else "NORMAL"
+        try:
+            self.m_connection = sqlite3.connect(self.m_fileName, isolation_level=None, check_same_thread=False)
+            self.m_connection.execute("PRAGMA journal_mode = WAL")
+            self.m_connection.execute(f"PRAGMA synchronous = {synchronous}")
+            self.m_connection.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+            self.m_connection.executescript(_SCHEMA)
+            self.m_size = self._database_size()
+        except sqlite3.Error as e:
+            if self.m_connection is not None:
+                self.m_connection.close()
+            raise OSError(str(e)) from e
+        return 0
+
+    # 所有批次在一个事务中插入
+    def _write(self, batches):
+        connection = self.m_connection
+        try:
+            connection.execute("BEGIN")
+            for batch in batches:
+                connection.executemany(_INSERT, zip(batch.timestamp.tolist(), batch.can_id.tolist(),
+                                                    batch.flags.tolist(), batch.dlc.tolist(),
+                                                    payload_blobs(batch.payload, batch.dlc)))
+            connection.execute("COMMIT")
+            size = self._database_size()
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise OSError(str(e)) from e
+        written = max(size - self.m_size, 0)
+        self.m_size = size
+        return written
+
+    # 结束时把 WAL 合并回数据库，让只有数据库文件的拷贝也是完整的
+    def _close(self, ok):
+        try:
+            if ok:
+                self.m_connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.m_connection.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            raise OSError(str(e)) from e
+        finally:
+            self.m_connection.close()
+        return 0
@@ -3,9 +3,10 @@
 
 from PySide6.QtCore import QSettings, Qt, Slot
 from PySide6.QtGui import QIntValidator
-from PySide6.QtWidgets import QDialog
+from PySide6.QtWidgets import QDialog, QLabel
 from PySide6.QtSerialBus import QCanBus, QCanBusDevice
 
+from canfilterbox import CanFilterBox, filter_from_text, filter_to_text
 from ui_connectdialog import Ui_ConnectDialog
 
 
@@ -68,6 +69,12 @@ class ConnectDialog(QDialog):
 
         self.m_ui.dataBitrateBox.set_flexible_date_rate_enabled(True)
 
+        # 驱动层接收过滤器的编辑框，放在“具体配置”中数据比特率的下面
+        self.m_rawFilterLabel = QLabel("Raw Filters", self.m_ui.configurationBox)
+        self.m_rawFilterBox = CanFilterBox(self.m_ui.configurationBox)
+        self.m_ui.gridLayout_4.addWidget(self.m_rawFilterLabel, 3, 0, 1, 1, Qt.AlignTop)
+        self.m_ui.gridLayout_4.addWidget(self.m_rawFilterBox, 3, 1, 1, 1)
+
         #括号里面的都是函数
         self.m_ui.okButton.clicked.connect(self.ok)
         self.m_ui.cancelButton.clicked.connect(self.cancel)
@@ -123,6 +130,9 @@ class ConnectDialog(QDialog):
                         self.configuration_value(QCanBusDevice.CanFdKey))
             qs.setValue("DataBitRate",
                         self.configuration_value(QCanBusDevice.DataBitRateKey))
+            # 过滤器以 "ID:掩码:类型:格式" 字符串的列表保存
+            filters = self.raw_configuration_value(QCanBusDevice.RawFilterKey) or []
+            qs.setValue("RawFilters", [filter_to_text(f) for f in filters])
         qs.endGroup()
 
 
@@ -149,6 +159,11 @@ class ConnectDialog(QDialog):
             self.m_ui.bitrateBox.setCurrentText(qs.value("BitRate"))
             self.m_ui.canFdBox.setCurrentText(qs.value("CanFd"))
             self.m_ui.dataBitrateBox.setCurrentText(qs.value("DataBitRate"))
+            texts = qs.value("RawFilters", [])
+            if isinstance(texts, str): # QSettings 把只有一个元素的列表读成字符串
+                texts = [texts]
+            filters = [filter_from_text(t) for t in texts or []]
+            self.m_rawFilterBox.set_filters([f for f in filters if f is not None])
 
         qs.endGroup() # 结束设置组的读取
         self.update_settings() # 参数更新到 UI界面中
@@ -204,6 +219,13 @@ class ConnectDialog(QDialog):
             return "unspecified"
         return str(result)
 
+    # 返回配置项原本的值（不转换为字符串），例如 RawFilterKey 的过滤器列表
+    def raw_configuration_value(self, key):
+        for k, v in self.m_currentSettings.configurations:
+            if k == key:
+                return v
+        return None
+
     # revert_settings 函数是用于将程序中的当前设置 同步更改到用户界面上。
     # 与 update_settings 函数恰好相反，
     # update_settings 函数是从用户界面读取设置更改程序中的设置，
@@ -240,6 +262,8 @@ class ConnectDialog(QDialog):
         value = self.configuration_value(QCanBusDevice.DataBitRateKey)
         self.m_ui.dataBitrateBox.setCurrentText(value)
 
+        self.m_rawFilterBox.set_filters(self.raw_configuration_value(QCanBusDevice.RawFilterKey) or [])
+
     # 例如，Loopback、ReceiveOwnKey、ErrorFilter和BitRate等设置项，
     # 如果这些设置项被设定了的话，则会将这些设置项添加到配置键值对的列表中。
     def update_settings(self):
@@ -282,9 +306,11 @@ class ConnectDialog(QDialog):
             #         item = (QCanBusDevice.ErrorFilterKey, error_filter)
             #         self.m_currentSettings.configurations.append(item)
 
-            # # process raw filter list
-            # if self.m_ui.rawFilterEdit.text():
-            #     pass  # TODO current ui not sufficient to reflect this param
+            # process raw filter list
+            filters = self.m_rawFilterBox.filters()
+            if filters:
+                item = (QCanBusDevice.RawFilterKey, filters)
+                self.m_currentSettings.configurations.append(item)
 
             # process bitrate
             bitrate = self.m_ui.bitrateBox.bit_rate()
@@ -0,0 +1,228 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import heapq
+import sys
+from threading import Condition, Thread
+from time import perf_counter, sleep
+
+from PySide6.QtCore import QByteArray
+from PySide6.QtSerialBus import QCanBusFrame
+
+from framestore import FLAG_BITRATE_SWITCH, FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_REMOTE
+from instrumentation import LatencyHistogram, metrics
+
+# 周期发送：按发送表周期性地发送多条报文（例如台架上几十条 10/20/100 ms 的报文）。
+#
+# 发送表的每一行是一个字典（见 new_message）：key（行的唯一标识）、frame_id、payload（bytes）、
+# flags（framestore 中的标志位，只用扩展帧、FD、BRS 和远程帧）、period（秒）、enabled。
+#
+# 调度在自己的线程中进行，与 replay.LogReplayer 相同：离下一个发送时刻还远时睡眠，最后 SPIN_TIME 秒内忙等，
+# 忙等时调用 sleep(0) 让出 GIL。所有报文的下一个发送时刻放在一个堆中，每次醒来把已经到时间的报文
+# （包括 SEND_WINDOW 秒内将要到时间的）一起通过一次 FrameReader.write_frames() 交给接收线程写出。
+# 每条报文的第 n 次发送时刻 = 开始时刻 + n * period，不会因为某次晚发而累积漂移；
+# 落后超过一个周期时跳过错过的周期（计入 missed），不连续补发。
+#
+# 周期抖动：接收线程记录每一帧 writeFrame() 成功返回的时刻，同一条报文相邻两次实际发送的间隔
+# 与要求的间隔之差的绝对值就是周期抖动，每条报文一个直方图。
+#
+# 定时的限制：调度线程和接收线程都是 Python 线程，要拿到 GIL 才能运行。GUI 线程绘制快速滚动的日志时一直持有 GIL，
+# 其它线程要等到解释器的切换间隔（默认 5 ms）才能拿到，调度线程和接收线程都会因此晚醒。
+# 发送期间把切换间隔降到 SWITCH_INTERVAL，停止后恢复；切换间隔是整个解释器的设置，发送期间所有线程都更频繁地切换，
+# GUI 和接收的吞吐量略有下降。即使这样也只能减小而不能消除等待，操作系统的调度也会带来延迟：
+# 机器空闲时周期抖动通常在 JITTER_LIMIT 以内，GUI 繁忙（例如大流量时滚动日志）时可以达到几毫秒。
+# 抖动必须保证在 1 ms 以内时应当使用设备或驱动本身的周期发送功能；statistics() 中的 late 记录超过限制的发送。
+#
+# 运行中可以用 set_messages() 修改发送表：新的行从下一次醒来开始发送，周期未变的行保持原来的相位。
+
+SPIN_TIME = 0.001  # 离发送时刻不到这么多秒时忙等
+SEND_WINDOW = 0.0002  # 这么多秒内将要到时间的报文与已经到时间的报文一起发送
+MAX_IN_FLIGHT = 256  # 已交给接收线程但还没有写出的帧数上限，超过时这一轮的帧不发送（计入 overruns）
+SWITCH_INTERVAL = 0.0002  # 发送期间解释器的线程切换间隔，单位秒
+JITTER_LIMIT = 0.001  # 周期抖动超过这么多秒的发送计为迟到
+MIN_PERIOD = 0.001
+
+
+def new_message(key, frame_id=0x100, payload=b"", flags=0, period=0.1, enabled=True):
+    return {"key": key, "frame_id": frame_id, "payload": bytes(payload), "flags": flags,
+            "period": max(period, MIN_PERIOD), "enabled": enabled}
+
+
+def message_frame(message):
+    flags = message["flags"]
+    if flags & FLAG_REMOTE:
+        frame = QCanBusFrame(QCanBusFrame.RemoteRequestFrame)
+        frame.setFrameId(message["frame_id"])
+    else:
+        frame = QCanBusFrame(message["frame_id"], QByteArray(message["payload"]))
+    frame.setExtendedFrameFormat(bool(flags & FLAG_EXTENDED))
+    if flags & FLAG_FLEXIBLE_DATA_RATE and not flags & FLAG_REMOTE:
+        frame.setFlexibleDataRateFormat(True)
+        frame.setBitrateSwitch(bool(flags & FLAG_BITRATE_SWITCH))
+    return frame
+
+
+class CyclicTransmitter():
+    """按发送表周期性地把帧写到设备上的调度器。
+
+    start()/stop()/set_messages()/statistics() 在 GUI 线程中调用，写出的结果由接收线程回调。
+    """
+
+    def __init__(self, reader):
+        self.m_reader = reader
+        self.m_thread = None
+        self.m_switchInterval = None  # start() 之前的线程切换间隔
+
+        # 以下成员由 m_condition 的锁保护
+        self.m_condition = Condition()
+        self.m_messages = {}  # key -> (报文, QCanBusFrame)，只含启用的行
+        self.m_version = 0  # 发送表每次修改加一，调度线程据此重建堆
+        self.m_stopping = False
+        self.m_running = False
+        self.m_handed = 0
+        self.m_sent = 0
+        self.m_failed = 0
+        self.m_overruns = 0
+        self.m_stats = {}  # key -> 每条报文的统计，见 _message_stats
+        self.m_error = ""
+
+    def set_messages(self, messages):
+        table = {message["key"]: (dict(message), message_frame(message)) for message in messages if message["enabled"]}
+        with self.m_condition:
+            self.m_messages = table
+            self.m_version += 1
+            self.m_condition.notify()
+
+    def start(self):
+        self.m_running = True
+        self.m_switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.m_switchInterval, SWITCH_INTERVAL))
+        self.m_thread = Thread(target=self._run, name="CyclicTransmitter", daemon=True)
+        self.m_thread.start()
+
+    # 停止发送并等待调度线程结束，返回最终的统计
+    def stop(self):
+        with self.m_condition:
+            self.m_stopping = True
+            self.m_condition.notify()
+        if self.m_thread is not None:
+            self.m_thread.join()
+            self.m_thread = None
+        if self.m_switchInterval is not None:
+            sys.setswitchinterval(self.m_switchInterval)
+            self.m_switchInterval = None
+        return self.statistics()
+
+    def is_running(self):
+        with self.m_condition:
+            return self.m_running
+
+    def _message_stats(self, key):
+        stats = self.m_stats.get(key)
+        if stats is None:
+            stats = self.m_stats[key] = {"sent": 0, "missed": 0, "late": 0, "jitter": LatencyHistogram(),
+                                         "last_due": None, "last_time": None}
+        return stats
+
+    def _in_flight(self):
+        return max(self.m_handed - self.m_sent - self.m_failed, 0)
+
+    # 总的统计和每条报文（key）的统计：发送次数、跳过的周期、迟到次数和周期抖动
+    def statistics(self):
+        with self.m_condition:
+            return {"running": self.m_running,
+                    "sent": self.m_sent,
+                    "failed": self.m_failed,
+                    "overruns": self.m_overruns,
+                    "messages": {key: {"sent": stats["sent"], "missed": stats["missed"], "late": stats["late"],
+                                       "jitter": stats["jitter"].snapshot()}
+                                 for key, stats in self.m_stats.items()},
+                    "error": self.m_error}
+
+    # 调度线程
+    def _run(self):
+        try:
+            self._schedule()
+        finally:
+            with self.m_condition:
+                self.m_running = False
+
+    # 按新的发送表重建堆：周期未变的报文保持原来的下一个发送时刻，其它的从 now 开始
+    def _rebuild(self, heap, now):
+        with self.m_condition:
+            table = self.m_messages
+            version = self.m_version
+        previous = {key: (due, period) for due, key, period in heap}
+        heap.clear()
+        for key, (message, _) in table.items():
+            period = message["period"]
+            due, old_period = previous.get(key, (now, None))
+            heap.append((due if old_period == period else now, key, period))
+        heapq.heapify(heap)
+        return table, version
+
+    def _schedule(self):
+        heap = []  # (下一个发送时刻, key, period)
+        table, version = self._rebuild(heap, perf_counter())
+        while True:
+            with self.m_condition:
+                if self.m_stopping:
+                    return
+                changed = self.m_version != version
+            if changed:
+                table, version = self._rebuild(heap, perf_counter())
+            if not heap:
+                with self.m_condition:
+                    self.m_condition.wait_for(lambda: self.m_stopping or self.m_version != version)
+                continue
+            due = heap[0][0]
+            wait = due - perf_counter()
+            if wait > SPIN_TIME:
+                with self.m_condition:
+                    self.m_condition.wait_for(lambda: self.m_stopping or self.m_version != version, wait - SPIN_TIME)
+                continue
+            while perf_counter() < due:
+                sleep(0)  # 让出 GIL
+            # 取出所有已经到时间的报文，一次交给接收线程
+            now = perf_counter()
+            keys = []
+            dues = []
+            frames = []
+            missed = []
+            while heap and heap[0][0] <= now + SEND_WINDOW:
+                frame_due, key, period = heapq.heappop(heap)
+                keys.append(key)
+                dues.append(frame_due)
+                frames.append(table[key][1])
+                skipped = max(int((now - frame_due) / period), 0)
+                if skipped:
+                    missed.append((key, skipped))
+                heapq.heappush(heap, (frame_due + (skipped + 1) * period, key, period))
+            with self.m_condition:
+                for key, skipped in missed:
+                    self._message_stats(key)["missed"] += skipped
+                if self._in_flight() + len(frames) > MAX_IN_FLIGHT:
+                    self.m_overruns += len(frames)
+                    continue
+                self.m_handed += len(frames)
+            self.m_reader.write_frames(frames, lambda times, keys=keys, dues=dues: self._frames_sent(keys, dues, times))
+
+    # 接收线程中调用：times 为前 len(times) 帧实际写出的时刻
+    def _frames_sent(self, keys, dues, times):
+        sent = len(times)
+        with self.m_condition:
+            self.m_sent += sent
+            if sent < len(keys):
+                self.m_failed += len(keys) - sent
+                self.m_error = "the device did not accept a frame"
+            for key, due, time in zip(keys, dues, times):
+                stats = self._message_stats(key)
+                stats["sent"] += 1
+                if stats["last_time"] is not None:
+                    jitter = abs((time - stats["last_time"]) - (due - stats["last_due"]))
+                    stats["jitter"].record(jitter)
+                    if jitter > JITTER_LIMIT:
+                        stats["late"] += 1
+                stats["last_due"] = due
+                stats["last_time"] = time
+        metrics.count("cyclic.frames", sent)
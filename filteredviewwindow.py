@@ -0,0 +1,75 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from PySide6.QtCore import QModelIndex, Qt, Slot
+from PySide6.QtWidgets import QLabel, QLineEdit, QVBoxLayout, QWidget
+
+from filterengine import FilterSyntaxError, compile_filter
+from framefilterproxymodel import FrameFilterProxyModel
+from receivedframesview import ReceivedFramesView
+
+# 过滤视图窗口：用一个过滤表达式（语法见 filterengine）观察主窗口中同一个接收模型。
+# 每个窗口有自己的 FrameFilterProxyModel，只对新到达的帧求值，可以同时打开多个窗口观察同一个实时捕获。
+
+
+class FilteredViewWindow(QWidget):
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle("Filtered View")
+        self.resize(700, 400)
+
+        self.m_model = FrameFilterProxyModel(self)
+        self.m_model.setSourceModel(model)
+
+        self.m_filterEdit = QLineEdit(self)
+        self.m_filterEdit.setPlaceholderText("Filter, e.g. id 0x100..0x1ff && data[0] 0x10/0xf0")
+        self.m_filterEdit.setClearButtonEnabled(True)
+        self.m_filterEdit.editingFinished.connect(self._apply_filter)
+        self.m_status = QLabel(self)
+        self.m_view = ReceivedFramesView(self)
+        self.m_view.set_model(self.m_model)
+        self.m_view.id_filter_requested.connect(self._id_filter_requested)
+        self.m_view.status_message.connect(self.m_status.setText)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.m_filterEdit)
+        layout.addWidget(self.m_view)
+        layout.addWidget(self.m_status)
+
+        # 滚动条在最底部时，新接受的帧到达后保持滚动到底部
+        self.m_model.rowsInserted.connect(self._rows_inserted)
+        self._show_count()
+
+    @Slot()
+    def _apply_filter(self):
+        text = self.m_filterEdit.text()
+        try:
+            frame_filter = compile_filter(text)
+        except FilterSyntaxError as e:
+            self.m_filterEdit.setStyleSheet("QLineEdit { color: red; }")
+            self.m_status.setText(f"Filter error: {e}")
+            return
+        self.m_filterEdit.setStyleSheet("")
+        self.m_model.set_filter(frame_filter.mask if frame_filter else None, text)
+        self.setWindowTitle(f"Filtered View - {text}" if text else "Filtered View")
+        self._show_count()
+
+    @Slot(object)
+    def _id_filter_requested(self, key):
+        if key is None:
+            self._apply_filter()
+        else:
+            self.m_model.set_id_filter(key)
+            self._show_count()
+
+    @Slot(QModelIndex, int, int)
+    def _rows_inserted(self, parent, first, last):
+        scroll_bar = self.m_view.verticalScrollBar()
+        if scroll_bar.value() == scroll_bar.maximum():
+            self.m_view.scrollToBottom()
+        self._show_count()
+
+    def _show_count(self):
+        self.m_status.setText(f"{self.m_model.rowCount()} of {self.m_model.sourceModel().rowCount()} frames")
@@ -0,0 +1,229 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import re
+
+import numpy as np
+
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE,
+                        FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_LOCAL_ECHO, FLAG_REMOTE,
+                        MAX_PAYLOAD_FD)
+
+# 软件过滤器：把一个过滤表达式编译为一组 numpy 运算，对整批帧（FrameBatch）一次求出布尔掩码，
+# 而不是对每一帧执行 Python 分支。表达式只在用户修改时编译一次，之后每批帧的代价
+# 只是几次整列的比较和位运算，与帧数基本无关。
+#
+# 表达式语法：
+#   id 0x100            ID 等于 0x100（数字默认为十进制，0x 开头为十六进制）
+#   id 0x100..0x1ff     ID 在闭区间内，也可以写作 0x100-0x1ff
+#   id 0x100/0x7f0      ID 与掩码按位与后相等：(ID & 0x7f0) == (0x100 & 0x7f0)
+#   id >= 0x700         比较运算：== != < <= > >=
+#   id 0x100,0x200      逗号分隔的多个值，任意一个匹配即可
+#   dlc 8, dlc > 4      有效载荷长度，写法同 id
+#   data[0] 0x12/0xf0   第 0 个数据字节，写法同 id；帧不够长时不匹配
+#   type data|remote|error   帧类型
+#   std, ext, fd        标准帧、扩展帧、CAN FD 帧
+#   B, E, L             标志位：比特率切换、错误状态指示器、本地回显（与 Flags 列一致）
+#   && || ! ( )         与、或、非和括号
+#
+# 例如：id 0x100..0x1ff && !(data[0] 0/0x80) || type error
+
+
+class FilterSyntaxError(ValueError):
+    """过滤表达式有语法错误，position 为出错位置在表达式中的下标。"""
+
+    def __init__(self, message, position):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+_TOKEN = re.compile(r"\s*(?:(0[xX][0-9a-fA-F]+|\d+)|(\|\||&&|==|!=|<=|>=|\.\.|[!()<>\[\]/,\-])"
+                    r"|([A-Za-z_]\w*))")
+
+_COMPARISONS = {"==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal,
+                ">": np.greater, ">=": np.greater_equal}
+
+_FLAG_KEYWORDS = {"B": FLAG_BITRATE_SWITCH, "E": FLAG_ERROR_STATE, "L": FLAG_LOCAL_ECHO,
+                  "ext": FLAG_EXTENDED, "fd": FLAG_FLEXIBLE_DATA_RATE}
+
+_FIELD_LIMITS = {"id": 0x1FFFFFFF, "dlc": MAX_PAYLOAD_FD, "data": 0xFF}
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.lastindex is None:
+            position += len(text[position:]) - len(text[position:].lstrip())
+            raise FilterSyntaxError(f"unexpected character '{text[position]}'", position)
+        number, symbol, word = match.groups()
+        start = match.start(match.lastindex)
+        if number is not None:
+            tokens.append(("number", int(number, 0), start))
+        elif symbol is not None:
+            tokens.append(("symbol", symbol, start))
+        else:
+            tokens.append(("word", word, start))
+        position = match.end()
+    tokens.append(("end", None, len(text)))
+    return tokens
+
+
+class _Parser():
+    """递归下降解析器，把表达式直接翻译为 predicate(batch) -> 布尔数组 的闭包。"""
+
+    def __init__(self, text):
+        self.m_tokens = _tokenize(text)
+        self.m_index = 0
+
+    def _peek(self):
+        return self.m_tokens[self.m_index]
+
+    def _next(self):
+        token = self.m_tokens[self.m_index]
+        self.m_index += 1
+        return token
+
+    def _accept(self, value):
+        if self._peek()[1] == value and self._peek()[0] in ("symbol", "word"):
+            return self._next()
+        return None
+
+    def _expect(self, value):
+        token = self._accept(value)
+        if token is None:
+            raise FilterSyntaxError(f"expected '{value}'", self._peek()[2])
+        return token
+
+    def _number(self, limit):
+        kind, value, position = self._next()
+        if kind != "number":
+            raise FilterSyntaxError("expected a number", position)
+        if value > limit:
+            raise FilterSyntaxError(f"value {value:#x} out of range", position)
+        return value
+
+    def parse(self):
+        predicate = self._or()
+        kind, value, position = self._peek()
+        if kind != "end":
+            raise FilterSyntaxError(f"unexpected '{value}'", position)
+        return predicate
+
+    def _or(self):
+        terms = [self._and()]
+        while self._accept("||"):
+            terms.append(self._and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda batch: np.logical_or.reduce([term(batch) for term in terms])
+
+    def _and(self):
+        terms = [self._not()]
+        while self._accept("&&"):
+            terms.append(self._not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda batch: np.logical_and.reduce([term(batch) for term in terms])
+
+    def _not(self):
+        if self._accept("!"):
+            term = self._not()
+            return lambda batch: ~term(batch)
+        return self._primary()
+
+    def _primary(self):
+        if self._accept("("):
+            predicate = self._or()
+            self._expect(")")
+            return predicate
+        kind, word, position = self._next()
+        if kind != "word":
+            raise FilterSyntaxError("expected a condition", position)
+        if word == "id":
+            return self._values(lambda batch: batch.can_id, _FIELD_LIMITS["id"])
+        if word == "dlc":
+            return self._values(lambda batch: batch.dlc, _FIELD_LIMITS["dlc"])
+        if word == "data":
+            self._expect("[")
+            i = self._number(MAX_PAYLOAD_FD - 1)
+            self._expect("]")
+            match = self._values(lambda batch: batch.payload[:, i], _FIELD_LIMITS["data"])
+            return lambda batch: match(batch) & (batch.dlc > i)
+        if word == "type":
+            return self._frame_type()
+        if word == "std":
+            return lambda batch: (batch.flags & FLAG_EXTENDED) == 0
+        if word in _FLAG_KEYWORDS:
+            bit = _FLAG_KEYWORDS[word]
+            return lambda batch: (batch.flags & bit) != 0
+        raise FilterSyntaxError(f"unknown condition '{word}'", position)
+
+    def _frame_type(self):
+        kind, word, position = self._next()
+        if word == "data":
+            return lambda batch: (batch.flags & (FLAG_REMOTE | FLAG_ERROR_FRAME)) == 0
+        if word == "remote":
+            return lambda batch: (batch.flags & FLAG_REMOTE) != 0
+        if word == "error":
+            return lambda batch: (batch.flags & FLAG_ERROR_FRAME) != 0
+        raise FilterSyntaxError("expected data, remote or error", position)
+
+    # 解析字段后面的一个或多个（逗号分隔）取值条件：比较、区间或掩码
+    def _values(self, column, limit):
+        terms = [self._value(column, limit)]
+        while self._accept(","):
+            terms.append(self._value(column, limit))
+        if len(terms) == 1:
+            return terms[0]
+        return lambda batch: np.logical_or.reduce([term(batch) for term in terms])
+
+    def _value(self, column, limit):
+        kind, symbol, _ = self._peek()
+        if kind == "symbol" and symbol in _COMPARISONS:
+            self._next()
+            compare = _COMPARISONS[symbol]
+            value = self._number(limit)
+            return lambda batch: compare(column(batch), value)
+        value = self._number(limit)
+        if self._accept("..") or self._accept("-"):
+            high = self._number(limit)
+            return lambda batch: (column(batch) >= value) & (column(batch) <= high)
+        if self._accept("/"):
+            mask = self._number(limit)
+            return lambda batch: (column(batch) & mask) == (value & mask)
+        return lambda batch: column(batch) == value
+
+
+class FrameFilter():
+    """编译好的过滤表达式。mask(batch) 返回匹配帧的布尔掩码，apply(batch) 返回只含匹配帧的批次。"""
+
+    def __init__(self, text):
+        self.m_text = text
+        self.m_predicate = _Parser(text).parse()
+
+    def text(self):
+        return self.m_text
+
+    def mask(self, batch):
+        result = self.m_predicate(batch)
+        if np.ndim(result) == 0:  # 只含常量条件时也返回与批次等长的数组
+            result = np.full(len(batch), bool(result))
+        return result
+
+    def apply(self, batch):
+        if not len(batch):
+            return batch
+        mask = self.mask(batch)
+        if mask.all():
+            return batch
+        return batch.select(mask)
+
+
+# 编译过滤表达式，空表达式返回 None（不过滤）；语法错误时抛出 FilterSyntaxError
+def compile_filter(text):
+    if not text.strip():
+        return None
+    return FrameFilter(text)
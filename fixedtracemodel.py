@@ -0,0 +1,223 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from enum import IntEnum
+
+import numpy as np
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSize, Qt
+
+from framestore import FLAG_ERROR_FRAME, MAX_PAYLOAD_FD, FrameBatch, id_keys
+from receivedframesmodel import (clipboard_text_role, format_flags, format_payload,
+                                 format_timestamp)
+
+# 固定（per-ID 覆盖）模式的表格模型：每个 CAN ID 只占一行。
+# 同一个 ID 的新帧到达时原地更新这一行的最新数据、计数、周期和时间差，
+# 行数只取决于总线上不同 ID 的个数，而不会随着流量增长。
+#
+# 周期（Period）为该 ID 所有帧间隔的平均值，时间差（Delta）为最近两帧之间的间隔，单位都是毫秒。
+
+MAX_ACCUMULATED_FRAMES = 65536  # 累积的帧超过这么多时不等 update()，直接合并到表格中
+
+
+class FixedTraceModelColumns(IntEnum):
+    can_id = 0
+    flags = 1
+    DLC = 2
+    data = 3
+    count = 4
+    period = 5
+    delta = 6
+    timestamp = 7
+    column_count = 8
+
+
+column_titles = ["CAN-ID", "Flags", "DLC", "Data", "Count", "Period", "Delta", "Timestamp"]
+column_widths = [70, 40, 30, 200, 60, 60, 60, 130]
+column_alignment = [Qt.AlignRight | Qt.AlignVCenter, Qt.AlignCenter,
+                    Qt.AlignRight | Qt.AlignVCenter, Qt.AlignLeft | Qt.AlignVCenter,
+                    Qt.AlignRight | Qt.AlignVCenter, Qt.AlignRight | Qt.AlignVCenter,
+                    Qt.AlignRight | Qt.AlignVCenter, Qt.AlignRight | Qt.AlignVCenter]
+
+
+class FixedTraceModel(QAbstractTableModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_rows = {}  # 键 -> 行号
+        self.m_framesAccumulator = []
+        self.m_accumulatedFrames = 0
+        self.m_errorTexts = {}  # 行号 -> 最近一个错误帧的解释文本
+        self._allocate(256)
+        self.m_rowCount = 0
+
+    def _allocate(self, capacity):
+        old = getattr(self, "m_columns", None)
+        columns = {"can_id": np.zeros(capacity, np.uint32), "flags": np.zeros(capacity, np.uint8),
+                   "dlc": np.zeros(capacity, np.uint8), "count": np.zeros(capacity, np.int64),
+                   "first_timestamp": np.zeros(capacity, np.int64),
+                   "timestamp": np.zeros(capacity, np.int64), "delta": np.zeros(capacity, np.int64),
+                   "payload": np.zeros((capacity, MAX_PAYLOAD_FD), np.uint8)}
+        if old is not None:
+            for name, column in old.items():
+                columns[name][:len(column)] = column
+        self.m_columns = columns
+        self.m_capacity = capacity
+
+    def headerData(self, section, orientation, role):
+        if orientation != Qt.Horizontal:
+            return None
+        if role == Qt.DisplayRole:
+            return column_titles[section]
+        if role == Qt.SizeHintRole:
+            return QSize(column_widths[section], 25)
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.m_rowCount
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else FixedTraceModelColumns.column_count
+
+    def data(self, index, role):
+        row = index.row()
+        column = index.column()
+        if row >= self.m_rowCount:
+            return None
+        if role == Qt.TextAlignmentRole:
+            return column_alignment[column]
+        if role == Qt.DisplayRole:
+            return self.format_cell(row, column)
+        if role == clipboard_text_role:
+            f = self.format_cell(row, column)
+            return f"[{f}]" if column == FixedTraceModelColumns.DLC else f
+        return None
+
+    def format_cell(self, row, column):
+        c = self.m_columns
+        if column == FixedTraceModelColumns.can_id:
+            return f"{c['can_id'][row]:x}"
+        if column == FixedTraceModelColumns.flags:
+            return format_flags(c["flags"][row])
+        if column == FixedTraceModelColumns.DLC:
+            return f"{c['dlc'][row]}"
+        if column == FixedTraceModelColumns.data:
+            if c["flags"][row] & FLAG_ERROR_FRAME and row in self.m_errorTexts:
+                return self.m_errorTexts[row]
+            return format_payload(c["payload"][row], c["dlc"][row])
+        if column == FixedTraceModelColumns.count:
+            return f"{c['count'][row]}"
+        if column == FixedTraceModelColumns.period:
+            count = c["count"][row]
+            if count < 2:
+                return ""
+            period = (c["timestamp"][row] - c["first_timestamp"][row]) / (count - 1)
+            return f"{period / 1000:.1f}"
+        if column == FixedTraceModelColumns.delta:
+            return f"{c['delta'][row] / 1000:.1f}" if c["count"][row] > 1 else ""
+        if column == FixedTraceModelColumns.timestamp:
+            return format_timestamp(c["timestamp"][row])
+        return None
+
+    # 与 ReceivedFramesModel 相同的接口：先累积，update() 时整批处理。
+    # 视图暂停刷新（例如窗口最小化）时 update() 可能很久不被调用；表格的行数只取决于 ID 的个数，
+    # 所以累积到 MAX_ACCUMULATED_FRAMES 帧时直接合并，累积的数据量保持有界
+    def append_frames(self, batch):
+        if len(batch):
+            self.m_framesAccumulator.append(batch)
+            self.m_accumulatedFrames += len(batch)
+            if self.m_accumulatedFrames >= MAX_ACCUMULATED_FRAMES:
+                self.update()
+
+    def need_update(self):
+        return self.m_framesAccumulator
+
+    def update(self):
+        if not self.m_framesAccumulator:
+            return
+        batch = FrameBatch.concatenate(self.m_framesAccumulator)
+        self.m_framesAccumulator = []
+        self.m_accumulatedFrames = 0
+
+        # 按键稳定排序，每组的最后一帧就是该 ID 在这一批中的最新帧
+        keys = id_keys(batch.can_id, batch.flags)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        group_end = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], group_end))
+        ends = np.concatenate((group_end, [len(sorted_keys)]))
+        last = order[ends - 1]
+        counts = ends - starts
+        second_last = np.where(counts > 1, order[np.maximum(ends - 2, 0)], -1)
+
+        # 新出现的 ID 追加到表格末尾
+        unique_keys = sorted_keys[starts].tolist()
+        new_keys = [k for k in unique_keys if k not in self.m_rows]
+        if new_keys:
+            first_row = self.m_rowCount
+            if first_row + len(new_keys) > self.m_capacity:
+                self._allocate(max(2 * self.m_capacity, first_row + len(new_keys)))
+            self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_keys) - 1)
+            for i, key in enumerate(new_keys):
+                self.m_rows[key] = first_row + i
+            self.m_rowCount += len(new_keys)
+        rows = np.array([self.m_rows[k] for k in unique_keys], np.int64)
+        is_new = rows >= self.m_rowCount - len(new_keys)
+
+        c = self.m_columns
+        old_count = c["count"][rows]
+        old_timestamp = c["timestamp"][rows]
+        new_timestamp = batch.timestamp[last]
+        previous = np.where(second_last >= 0, batch.timestamp[np.maximum(second_last, 0)], old_timestamp)
+
+        # 与旧值比较，找出有效载荷、DLC 或标志位变化了的行
+        payload_changed = is_new | (c["flags"][rows] != batch.flags[last]) \
+            | (c["dlc"][rows] != batch.dlc[last]) \
+            | np.any(c["payload"][rows] != batch.payload[last], axis=1)
+
+        c["can_id"][rows] = batch.can_id[last]
+        c["flags"][rows] = batch.flags[last]
+        c["dlc"][rows] = batch.dlc[last]
+        c["payload"][rows] = batch.payload[last]
+        c["first_timestamp"][rows] = np.where(old_count == 0, batch.timestamp[order[starts]],
+                                              c["first_timestamp"][rows])
+        c["timestamp"][rows] = new_timestamp
+        c["delta"][rows] = np.where((old_count + counts) > 1, new_timestamp - previous, 0)
+        c["count"][rows] = old_count + counts
+        for number, text in batch.error_texts.items():
+            i = int(np.searchsorted(batch.number, number))
+            self.m_errorTexts[self.m_rows[int(keys[i])]] = text
+
+        if new_keys:
+            self.endInsertRows()
+        self._emit_changes(rows[~is_new], payload_changed[~is_new])
+
+    # 只对变化的单元格发出 dataChanged：计数、周期、时间差、时间戳每次都变，
+    # 标志位、DLC 和数据只在内容变化时才发出；行号连续的行合并为一个信号
+    def _emit_changes(self, rows, payload_changed):
+        if not len(rows):
+            return
+        order = np.argsort(rows)
+        rows = rows[order]
+        payload_changed = payload_changed[order]
+        self._emit_runs(rows, FixedTraceModelColumns.count, FixedTraceModelColumns.timestamp)
+        self._emit_runs(rows[payload_changed], FixedTraceModelColumns.flags,
+                        FixedTraceModelColumns.data)
+
+    def _emit_runs(self, rows, first_column, last_column):
+        if not len(rows):
+            return
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        for run in np.split(rows, breaks):
+            self.dataChanged.emit(self.index(int(run[0]), first_column),
+                                  self.index(int(run[-1]), last_column))
+
+    def clear(self):
+        self.beginResetModel()
+        self.m_rows.clear()
+        self.m_errorTexts.clear()
+        self.m_framesAccumulator = []
+        self.m_accumulatedFrames = 0
+        self.m_rowCount = 0
+        for column in self.m_columns.values():
+            column.fill(0)
+        self.endResetModel()
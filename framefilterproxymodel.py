@@ -0,0 +1,212 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+
+from PySide6.QtCore import QAbstractProxyModel, QModelIndex, Qt, Slot
+
+from framestore import id_keys
+from frameindex import PositionArray
+
+# ReceivedFramesModel 的增量过滤代理模型，替代 QSortFilterProxyModel。
+#
+# QSortFilterProxyModel 在每次插入时对新行逐行调用 Python 的 filterAcceptsRow()，
+# 在头部删除行时还要重建整个映射，行数一多就跟不上总线的速率。这里的代理：
+# - 只对新追加的行求值，谓词（predicate(batch) -> 布尔数组，例如 filterengine.FrameFilter.mask）
+#   对这些行整批求值一次；
+# - 保存被接受的行的"绝对位置"（第几个被追加到源模型的帧，见 frameindex），
+#   源模型从头部淘汰 n 行时只把 m_evicted 加 n，再从映射头部丢弃过期的位置，已有的映射不用修改；
+# - 代理行 i 对应的源行为 m_positions[i] - m_evicted，源行到代理行是一次二分查找。
+# 多个代理可以同时观察同一个源模型，每个代理的代价只与新到达的帧数和它接受的帧数有关。
+#
+# 源模型只在末尾插入、只从头部删除，代理相应地也只在末尾插入、只从头部删除。
+
+REBUILD_CHUNK = 1 << 20  # 重建映射时每次求值的行数，限制临时数组占用的内存
+
+
+class FrameFilterProxyModel(QAbstractProxyModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_predicate = None  # None 表示不接受任何行
+        self.m_description = ""
+        self.m_key = None  # 按 ID 过滤时的报文键，见 framestore.id_key
+        self.m_positions = PositionArray()  # 被接受的行的绝对位置，递增
+        self.m_evicted = 0  # 源模型已从头部淘汰的行数
+        self.m_pendingRemoval = 0
+
+    def setSourceModel(self, model):
+        old = self.sourceModel()
+        if old is not None:
+            old.rowsAboutToBeRemoved.disconnect(self._source_rows_about_to_be_removed)
+            old.rowsRemoved.disconnect(self._source_rows_removed)
+            old.rowsInserted.disconnect(self._source_rows_inserted)
+            old.modelAboutToBeReset.disconnect(self.beginResetModel)
+            old.modelReset.disconnect(self._source_reset)
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.rowsAboutToBeRemoved.connect(self._source_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._source_rows_removed)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        self._rebuild()
+        self.endResetModel()
+
+    """
+    设置过滤谓词并对源模型中已有的行重新求值一次。
+
+    参数:
+    - predicate: predicate(batch) 返回与批次等长的布尔数组，None 表示不接受任何行。
+    - description: 显示用的过滤条件说明。
+    """
+    def set_filter(self, predicate, description=""):
+        self.beginResetModel()
+        self.m_predicate = predicate
+        self.m_description = description
+        self.m_key = None
+        self._rebuild()
+        self.endResetModel()
+
+    # 只显示某一个 ID 的帧；已有的行直接取自源模型的按 ID 行索引，不用逐行求值
+    def set_id_filter(self, key):
+        self.beginResetModel()
+        self.m_key = key
+        self.m_description = "" if key is None else f"ID key {key:#x}"
+        self.m_predicate = None if key is None else \
+            (lambda batch: id_keys(batch.can_id, batch.flags) == key)
+        self.m_positions.clear()
+        model = self.sourceModel()
+        if model is not None and key is not None:
+            self.m_evicted = 0
+            self.m_positions.extend(model.m_idIndex.rows(key))
+        self.endResetModel()
+
+    def key(self):
+        return self.m_key
+
+    def description(self):
+        return self.m_description
+
+    # 从头计算映射，只在设置过滤条件或源模型重置时调用；按块整批求值
+    def _rebuild(self):
+        self.m_positions.clear()
+        self.m_evicted = 0
+        model = self.sourceModel()
+        if model is None or self.m_predicate is None:
+            return
+        rows = model.rowCount()
+        for start in range(0, rows, REBUILD_CHUNK):
+            stop = min(start + REBUILD_CHUNK, rows)
+            mask = self.m_predicate(model.m_frames.batch(start, stop))
+            self.m_positions.extend(np.flatnonzero(mask) + start)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.m_positions)
+
+    def columnCount(self, parent=QModelIndex()):
+        model = self.sourceModel()
+        return 0 if parent.isValid() or model is None else model.columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.m_positions)) \
+                or not (0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        return self.sourceModel().headerData(section, orientation, role)
+
+    # 代理行号 -> 源模型的逻辑行号
+    def source_row(self, row):
+        return int(self.m_positions.view()[row]) - self.m_evicted
+
+    # 源模型的逻辑行号 -> 代理行号，该行没有被接受时返回 -1
+    def proxy_row(self, source_row):
+        positions = self.m_positions.view()
+        position = source_row + self.m_evicted
+        i = int(np.searchsorted(positions, position))
+        return i if i < len(positions) and positions[i] == position else -1
+
+    # 第一个源行号 >= source_row 的代理行号，没有则返回 rowCount()
+    def lower_bound(self, source_row):
+        return int(np.searchsorted(self.m_positions.view(), source_row + self.m_evicted))
+
+    def mapToSource(self, proxy_index):
+        model = self.sourceModel()
+        if not proxy_index.isValid() or model is None:
+            return QModelIndex()
+        return model.index(self.source_row(proxy_index.row()), proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = self.proxy_row(source_index.row())
+        return self.index(row, source_index.column()) if row >= 0 else QModelIndex()
+
+    def row_key(self, row):
+        if not (0 <= row < len(self.m_positions)):
+            return None
+        return self.sourceModel().row_key(self.source_row(row))
+
+    # 与第 row 行同 ID 的下一个（上一个）被接受的行：沿源模型的按 ID 行索引查找
+    def find_same_id(self, row, forward=True):
+        if not (0 <= row < len(self.m_positions)):
+            return -1
+        if self.m_key is not None: # 只显示一个 ID 时，相邻的行就是同 ID 的帧
+            row += 1 if forward else -1
+            return row if 0 <= row < len(self.m_positions) else -1
+        model = self.sourceModel()
+        source = self.source_row(row)
+        while True:
+            source = model.find_same_id(source, forward)
+            if source < 0:
+                return -1
+            found = self.proxy_row(source)
+            if found >= 0:
+                return found
+
+    @Slot(QModelIndex, int, int)
+    def _source_rows_about_to_be_removed(self, parent, first, last):
+        if first != 0: # 源模型只从头部删除；其它情况按重置处理
+            self.beginResetModel()
+            self.m_pendingRemoval = -1
+            return
+        removed = int(np.searchsorted(self.m_positions.view(), self.m_evicted + last + 1))
+        self.m_pendingRemoval = removed
+        if removed:
+            self.beginRemoveRows(QModelIndex(), 0, removed - 1)
+
+    @Slot(QModelIndex, int, int)
+    def _source_rows_removed(self, parent, first, last):
+        if self.m_pendingRemoval < 0:
+            self._rebuild()
+            self.endResetModel()
+        else:
+            self.m_evicted += last - first + 1
+            if self.m_pendingRemoval:
+                self.m_positions.drop_before(self.m_evicted)
+                self.endRemoveRows()
+        self.m_pendingRemoval = 0
+
+    # 只对新插入的行整批求值一次
+    @Slot(QModelIndex, int, int)
+    def _source_rows_inserted(self, parent, first, last):
+        if self.m_predicate is None:
+            return
+        mask = self.m_predicate(self.sourceModel().m_frames.batch(first, last + 1))
+        accepted = np.flatnonzero(mask)
+        if not len(accepted):
+            return
+        count = len(self.m_positions)
+        self.beginInsertRows(QModelIndex(), count, count + len(accepted) - 1)
+        self.m_positions.extend(accepted + first + self.m_evicted)
+        self.endInsertRows()
+
+    @Slot()
+    def _source_reset(self):
+        self._rebuild()
+        self.endResetModel()
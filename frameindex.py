@@ -0,0 +1,196 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+
+from framestore import id_keys
+
+# 按 CAN ID 的行索引：对每个报文（见 framestore.id_keys）保存它所有帧的位置，随追加和淘汰增量维护。
+#
+# 位置用"绝对位置"表示：第几个被追加到模型中的帧（从 0 开始），淘汰不会改变已有帧的绝对位置，
+# 逻辑行号 = 绝对位置 - 已淘汰的帧数。因此环形缓冲区从头部淘汰 n 帧时只需把 m_evicted 加 n，
+# 各个 ID 的位置数组不用逐个修改，过期的位置在查询或定期清理时再截掉。
+#
+# 每个 ID 的位置数组是递增的，"下一个/上一个同 ID 的帧"是一次二分查找，
+# "只显示这个 ID"直接得到 k 个行号（k 为该 ID 的帧数），都与总行数无关。
+
+_INITIAL_CAPACITY = 64
+_PRUNE_SLACK = 4096  # 过期位置超过有效行数加上这个数时，清理所有 ID 的位置数组
+
+
+class PositionArray():
+    """递增的绝对位置数组：m_data[m_start:m_size] 有效，按需成倍扩容，从头部丢弃只移动 m_start。"""
+
+    def __init__(self):
+        self.m_data = np.empty(_INITIAL_CAPACITY, np.int64)
+        self.m_start = 0
+        self.m_size = 0
+
+    def __len__(self):
+        return self.m_size - self.m_start
+
+    def extend(self, positions):
+        needed = self.m_size + len(positions)
+        if needed > len(self.m_data):
+            live = self.m_size - self.m_start
+            data = np.empty(max(2 * live + len(positions), _INITIAL_CAPACITY), np.int64)
+            data[:live] = self.m_data[self.m_start:self.m_size]
+            self.m_data = data
+            self.m_start = 0
+            self.m_size = live
+            needed = live + len(positions)
+        self.m_data[self.m_size:needed] = positions
+        self.m_size = needed
+
+    def view(self):
+        return self.m_data[self.m_start:self.m_size]
+
+    def clear(self):
+        self.m_start = 0
+        self.m_size = 0
+
+    # 丢弃小于 first 的位置，返回丢弃的个数
+    def drop_before(self, first):
+        dropped = int(np.searchsorted(self.view(), first))
+        self.m_start += dropped
+        return dropped
+
+
+class TimestampIndex():
+    """记录时间戳不再单调递增的位置。
+
+    正常情况下时间戳随帧序号单调递增，控制器复位、设备重新连接或切换设备后时间戳可能回到较小的值。
+    m_breaks 保存每一段单调递增区间的起始绝对位置（第一段从 0 开始，不记录），
+    在每一段之内可以直接对时间戳列二分查找。
+    """
+
+    def __init__(self):
+        self.m_breaks = []  # 时间戳比前一帧小的帧的绝对位置，递增
+        self.m_appended = 0
+        self.m_evicted = 0
+        self.m_lastTimestamp = None
+
+    # 追加一批帧，返回这一批中新出现的回退位置（绝对位置）
+    def append(self, batch):
+        count = len(batch)
+        if not count:
+            return []
+        timestamps = batch.timestamp
+        backwards = np.flatnonzero(timestamps[1:] < timestamps[:-1]) + 1
+        found = (backwards + self.m_appended).tolist()
+        if self.m_lastTimestamp is not None and timestamps[0] < self.m_lastTimestamp:
+            found.insert(0, self.m_appended)
+        self.m_breaks.extend(found)
+        self.m_appended += count
+        self.m_lastTimestamp = int(timestamps[-1])
+        return found
+
+    def evict(self, count):
+        self.m_evicted = min(self.m_evicted + count, self.m_appended)
+        # 第一段的起点就是第 0 行，不再需要记录
+        while self.m_breaks and self.m_breaks[0] <= self.m_evicted:
+            self.m_breaks.pop(0)
+
+    def clear(self):
+        self.m_breaks.clear()
+        self.m_appended = 0
+        self.m_evicted = 0
+        self.m_lastTimestamp = None
+
+    # 当前行中时间戳回退的逻辑行号
+    def break_rows(self):
+        return [position - self.m_evicted for position in self.m_breaks]
+
+    # 各个单调递增区间，按逻辑行号 [(start, stop), ...]
+    def runs(self):
+        starts = [0] + self.break_rows()
+        stops = starts[1:] + [self.m_appended - self.m_evicted]
+        return [(start, stop) for start, stop in zip(starts, stops) if start < stop]
+
+
+class FrameIdIndex():
+
+    def __init__(self):
+        self.m_positions = {}  # 键 -> PositionArray
+        self.m_appended = 0  # 追加过的帧数，即下一帧的绝对位置
+        self.m_evicted = 0  # 从头部淘汰的帧数
+        self.m_stored = 0  # 所有 ID 保存的位置总数（包括还没有清理的过期位置）
+
+    def __len__(self):
+        return self.m_appended - self.m_evicted
+
+    # 把一批帧的位置追加到各自 ID 的位置数组中：整批按键稳定排序后分组，每个 ID 一次数组拷贝
+    def append(self, batch):
+        count = len(batch)
+        if not count:
+            return
+        keys = id_keys(batch.can_id, batch.flags)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(sorted_keys)) + 1, [count]))
+        positions = order + self.m_appended
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            key = int(sorted_keys[start])
+            entry = self.m_positions.get(key)
+            if entry is None:
+                entry = self.m_positions[key] = PositionArray()
+            entry.extend(positions[start:stop])
+        self.m_appended += count
+        self.m_stored += count
+
+    # 从头部淘汰 count 帧
+    def evict(self, count):
+        self.m_evicted = min(self.m_evicted + count, self.m_appended)
+        if self.m_stored > 2 * len(self) + _PRUNE_SLACK:
+            self._prune()
+
+    def _prune(self):
+        for key in list(self.m_positions):
+            entry = self.m_positions[key]
+            self.m_stored -= entry.drop_before(self.m_evicted)
+            if not len(entry):
+                del self.m_positions[key]
+
+    def clear(self):
+        self.m_positions.clear()
+        self.m_appended = 0
+        self.m_evicted = 0
+        self.m_stored = 0
+
+    # 返回 key 的有效绝对位置（numpy 视图，不拷贝）
+    def _live(self, key):
+        entry = self.m_positions.get(key)
+        if entry is None:
+            return np.empty(0, np.int64)
+        self.m_stored -= entry.drop_before(self.m_evicted)
+        return entry.view()
+
+    def keys(self):
+        return [key for key in self.m_positions if len(self._live(key))]
+
+    def count(self, key):
+        return len(self._live(key))
+
+    # key 的所有帧的逻辑行号（递增）
+    def rows(self, key):
+        return self._live(key) - self.m_evicted
+
+    # key 的第 i 帧的逻辑行号
+    def row_at(self, key, i):
+        return int(self._live(key)[i]) - self.m_evicted
+
+    # 逻辑行号小于 row 的 key 帧的个数；row 本身是 key 的帧时，就是它在 rows(key) 中的下标
+    def rank(self, key, row):
+        return int(np.searchsorted(self._live(key), row + self.m_evicted))
+
+    # row 之后（不含 row）第一个 key 帧的逻辑行号，没有则返回 -1
+    def next_row(self, key, row):
+        live = self._live(key)
+        i = int(np.searchsorted(live, row + self.m_evicted, side="right"))
+        return int(live[i]) - self.m_evicted if i < len(live) else -1
+
+    # row 之前（不含 row）最后一个 key 帧的逻辑行号，没有则返回 -1
+    def previous_row(self, key, row):
+        live = self._live(key)
+        i = int(np.searchsorted(live, row + self.m_evicted)) - 1
+        return int(live[i]) - self.m_evicted if i >= 0 else -1
@@ -0,0 +1,411 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from collections import deque
+from threading import Lock
+from time import perf_counter
+
+import numpy as np
+
+from PySide6.QtCore import QByteArray, QObject, QTimer, Signal, Slot
+from PySide6.QtSerialBus import QCanBus, QCanBusDevice, QCanBusFrame
+
+from canfilterbox import filter_batch_mask
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE,
+                        FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_LOCAL_ECHO,
+                        FLAG_REMOTE, MAX_PAYLOAD_FD, FrameBatch)
+from instrumentation import metrics
+
+# FrameReader 是接收线程中的工作对象：
+# 它在自己的 QThread 中创建并拥有 QCanBusDevice，持续地读取设备中的帧，
+# 再把一批一批的帧通过排队（queued）信号交给 GUI 线程中的模型。
+# GUI 线程（绘制、模态对话框等）再忙也不会影响接收，设备后端的缓冲区不会因此溢出。
+#
+# GUI 线程不直接调用设备，而是调用 connect_device()/write_frame() 等公开方法，
+# 这些方法只是发出信号，由接收线程中的槽函数真正执行。
+#
+# 写出的帧先进入后端自己的发送队列（framesToWrite()），真正发送后后端才报告 framesWritten。
+# 后端的发送队列是先进先出的，接收线程为队列中的每一帧记下它的请求者（见 write_frames 的 written），
+# framesWritten 到达时按顺序把发送完成的帧交还给各自的请求者，发送框和周期发送的帧不会算到回放的头上。
+# 有的后端（例如 VirtualCAN、SocketCAN）在 writeFrame() 中就同步报告 framesWritten，所以请求者要在写之前记下。
+
+FLUSH_INTERVAL = 20  # 接收线程向 GUI 线程提交一批帧的间隔，单位毫秒
+MAX_QUEUED_FRAMES = 1000000  # 已提交但 GUI 线程还没有取走的帧数上限，超过后丢弃新的帧
+
+
+# 将 frame 的各种属性压缩为一个整数标志位，存入帧存储的 flags 列。
+# 位的定义见 framestore 中的 FLAG_* 常量。
+def frame_flag_bits(frame):
+    result = 0
+    if frame.hasBitrateSwitch(): # (就是区分CAN 还是 CAN-FD)
+        result |= FLAG_BITRATE_SWITCH
+    if frame.hasErrorStateIndicator(): # 通过错误状态指示器来提醒通信节点发现问题
+        result |= FLAG_ERROR_STATE
+    if frame.hasLocalEcho():
+        result |= FLAG_LOCAL_ECHO
+    if frame.hasExtendedFrameFormat():
+        result |= FLAG_EXTENDED
+    if frame.hasFlexibleDataRateFormat():
+        result |= FLAG_FLEXIBLE_DATA_RATE
+    frame_type = frame.frameType()
+    if frame_type == QCanBusFrame.RemoteRequestFrame:
+        result |= FLAG_REMOTE
+    elif frame_type == QCanBusFrame.ErrorFrame:
+        result |= FLAG_ERROR_FRAME
+    return result
+
+
+# 一次遍历把 readAllFrames() 返回的一批 QCanBusFrame 转换为列式的 FrameBatch。
+# 每一列先收集到 Python list 中再一次性转换为 numpy 数组，有效载荷补齐到 64 字节后拼接为一块内存，
+# 这样每帧的 Python 开销只有几次方法调用，其余的工作都由 numpy 整批完成。
+# first_number 为第一帧的序号；错误帧用 device.interpretErrorFrame() 解释
+def frames_to_batch(frames, first_number, device=None):
+    count = len(frames)
+    timestamps = [0] * count
+    can_ids = [0] * count
+    flags = [0] * count
+    dlcs = [0] * count
+    payloads = [b""] * count
+    error_texts = {}
+    for i, frame in enumerate(frames):
+        stamp = frame.timeStamp()
+        timestamps[i] = stamp.seconds() * 1000000 + stamp.microSeconds()
+        can_ids[i] = frame.frameId()
+        bits = frame_flag_bits(frame)
+        flags[i] = bits
+        payload = frame.payload().data()[:MAX_PAYLOAD_FD]
+        dlcs[i] = len(payload)
+        payloads[i] = payload.ljust(MAX_PAYLOAD_FD, b"\0")
+        if bits & FLAG_ERROR_FRAME and device is not None: # 如果是错误帧，则使用interpretErrorFrame方法解释错误帧
+            error_texts[first_number + i] = device.interpretErrorFrame(frame)
+    payload_matrix = np.frombuffer(b"".join(payloads), np.uint8).reshape(count, MAX_PAYLOAD_FD)
+    return FrameBatch(np.arange(first_number, first_number + count, dtype=np.int64),
+                      np.array(timestamps, np.int64), np.array(can_ids, np.uint32),
+                      np.array(flags, np.uint8), np.array(dlcs, np.uint8),
+                      payload_matrix.copy(), error_texts, perf_counter())
+
+
+# frames_to_batch 的逆变换：把一批帧转换为可以发送的 QCanBusFrame 列表，用于回放日志。
+# 错误帧不能发送，调用者应先筛选掉；本地回显只是接收时的标志，不设置
+def batch_to_frames(batch):
+    raw = batch.payload.tobytes()
+    frames = []
+    for i, (can_id, bits, dlc) in enumerate(zip(batch.can_id.tolist(), batch.flags.tolist(),
+                                                 batch.dlc.tolist())):
+        if bits & FLAG_REMOTE:
+            frame = QCanBusFrame(QCanBusFrame.RemoteRequestFrame)
+            frame.setFrameId(can_id)
+        else:
+            offset = i * MAX_PAYLOAD_FD
+            frame = QCanBusFrame(can_id, QByteArray(raw[offset:offset + dlc]))
+        frame.setExtendedFrameFormat(bool(bits & FLAG_EXTENDED))
+        if bits & FLAG_FLEXIBLE_DATA_RATE:
+            frame.setFlexibleDataRateFormat(True)
+            frame.setBitrateSwitch(bool(bits & FLAG_BITRATE_SWITCH))
+            frame.setErrorStateIndicator(bool(bits & FLAG_ERROR_STATE))
+        frames.append(frame)
+    return frames
+
+
+class FrameReader(QObject):
+
+    # 发给 GUI 线程的信号
+    frames_received = Signal(object)  # 一批帧（FrameBatch）
+    device_connected = Signal(dict)  # 连接成功，参数为设备的配置和信息
+    connection_failed = Signal(str)  # 连接失败，参数为错误信息
+    device_disconnected = Signal()
+    error_occurred = Signal(str)
+    frames_written = Signal(int)
+    bus_status_changed = Signal(object)  # QCanBusDevice.CanBusStatus
+
+    # 内部使用的请求信号，由 GUI 线程发出，在接收线程中执行
+    _connect_requested = Signal(str, str, list)
+    _disconnect_requested = Signal()
+    _write_requested = Signal(QCanBusFrame)
+    _write_frames_requested = Signal(object, object, object, int)
+    _reset_requested = Signal()
+    _bus_status_requested = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_can_device = None
+        self.m_pending = []  # 已读取但还没有提交给 GUI 线程的批次（FrameBatch）
+        self.m_softwareFilters = []  # 后端不支持 RawFilterKey 时，在接收线程中应用的过滤器
+        self.m_recorder = None  # 磁盘记录器（recorder.LogRecorder），记录交给 GUI 线程之前的每一批帧
+        self.m_triggerCapture = None  # 触发记录（triggercapture.TriggerCapture），与磁盘记录器同时收到每一批帧
+        self.m_number_frames_received = 0
+        self.m_writeRequests = deque()  # 因后端的发送队列已满而等待写出的 write_frames() 请求
+        self.m_writeOwners = deque()  # 后端发送队列中每一帧的 written 回调，发送框写的帧为 None
+        self.m_writing = False  # 正在写出请求，framesWritten 同步到达时不重入
+
+        # 统计数据，GUI 线程和接收线程都会访问，用锁保护
+        self.m_lock = Lock()
+        self.m_queuedFrames = 0
+        self.m_maxQueuedFrames = 0
+        self.m_droppedFrames = 0
+        self.m_deliveredFrames = 0
+
+        # 定时器是 self 的子对象，会随 self 一起被移动到接收线程
+        self.m_flushTimer = QTimer(self)
+        self.m_flushTimer.setInterval(FLUSH_INTERVAL)
+        self.m_flushTimer.timeout.connect(self._flush)
+
+        self._connect_requested.connect(self._connect_device)
+        self._disconnect_requested.connect(self._disconnect_device)
+        self._write_requested.connect(self._write_frame)
+        self._write_frames_requested.connect(self._write_frames)
+        self._reset_requested.connect(self._reset_controller)
+        self._bus_status_requested.connect(self._bus_status)
+
+    # 以下公开方法可以在 GUI 线程中调用，它们只发出请求信号
+
+    def connect_device(self, plugin_name, device_interface_name, configurations):
+        self._connect_requested.emit(plugin_name, device_interface_name, list(configurations))
+
+    def disconnect_device(self):
+        self._disconnect_requested.emit()
+
+    def write_frame(self, frame):
+        self._write_requested.emit(frame)
+
+    # 一次请求写入多帧，可以在任何线程中调用。callback 不为 None 时，写完后在接收线程中调用 callback(times)，
+    # times 为每一帧 writeFrame() 成功返回时的 perf_counter()；设备拒绝某一帧后其余的帧不再写入。
+    # max_queued 不为 0 时，后端的发送队列中已有这么多帧时暂停这个请求，等队列中的帧发送出去后再继续写。
+    # written 不为 None 时，这些帧真正发送后（framesWritten）在接收线程中调用 written(count, time)
+    def write_frames(self, frames, callback=None, written=None, max_queued=0):
+        self._write_frames_requested.emit(frames, callback, written, max_queued)
+
+    def reset_controller(self):
+        self._reset_requested.emit()
+
+    def request_bus_status(self):
+        self._bus_status_requested.emit()
+
+    # 设置或取消（None）磁盘记录器；之后提交的批次都先交给记录器，包括因队列已满被丢弃的批次
+    def set_recorder(self, recorder):
+        self.m_recorder = recorder
+
+    # 设置或取消（None）触发记录，与 set_recorder() 相同
+    def set_trigger_capture(self, capture):
+        self.m_triggerCapture = capture
+
+    # GUI 线程处理完一批帧后调用，用于计算队列深度
+    def batch_consumed(self, count):
+        with self.m_lock:
+            self.m_queuedFrames -= count
+
+    # 返回接收统计：接收、提交、丢弃的帧数，以及当前和最大的队列深度
+    def statistics(self):
+        with self.m_lock:
+            return {"received": self.m_number_frames_received,
+                    "delivered": self.m_deliveredFrames,
+                    "dropped": self.m_droppedFrames,
+                    "queue_depth": self.m_queuedFrames,
+                    "max_queue_depth": self.m_maxQueuedFrames}
+
+    # 以下槽函数都在接收线程中执行
+
+    @Slot(str, str, list)
+    def _connect_device(self, plugin_name, device_interface_name, configurations):
+        self._release_device()
+        device, error_string = QCanBus.instance().createDevice(plugin_name, device_interface_name)
+        if not device:
+            self.connection_failed.emit(f"Error creating device '{plugin_name}', reason: '{error_string}'")
+            return
+
+        self.m_can_device = device
+        self.m_can_device.errorOccurred.connect(self._process_errors)
+        self.m_can_device.framesReceived.connect(self._read_frames)
+        self.m_can_device.framesWritten.connect(self._frames_written)
+        raw_filters = []
+        for k, v in configurations:
+            if k == QCanBusDevice.RawFilterKey:
+                raw_filters = v
+            self.m_can_device.setConfigurationParameter(k, v)
+
+        if not self.m_can_device.connectDevice():
+            e = self.m_can_device.errorString()
+            self._release_device()
+            self.connection_failed.emit(f"Connection error: {e}")
+            return
+
+        info = {
+            "bit_rate": self.m_can_device.configurationParameter(QCanBusDevice.BitRateKey) or 0,
+            "is_can_fd": bool(self.m_can_device.configurationParameter(QCanBusDevice.CanFdKey)),
+            "data_bit_rate": self.m_can_device.configurationParameter(QCanBusDevice.DataBitRateKey) or 0,
+            "has_bus_status": self.m_can_device.hasBusStatus(),
+            "device_info": self.m_can_device.deviceInfo(),
+            "raw_filters": self._apply_raw_filters(raw_filters),
+        }
+        self.m_flushTimer.start()
+        self.device_connected.emit(info)
+
+    @Slot()
+    def _disconnect_device(self):
+        if not self.m_can_device:
+            return
+        self._read_frames()  # 取走断开前剩余的帧
+        self._flush()
+        self.m_can_device.disconnectDevice()
+        self._release_device()
+        self.device_disconnected.emit()
+
+    # 检查后端是否接受了 RawFilterKey：接受时由驱动丢弃不需要的帧；
+    # 否则（例如 PeakCAN、VirtualCAN）在接收线程中按相同的语义筛选，至少不让这些帧进入 GUI 线程。
+    # 返回 "driver"、"software"，没有过滤器时返回 ""
+    def _apply_raw_filters(self, raw_filters):
+        self.m_softwareFilters = []
+        if not raw_filters:
+            return ""
+        if self.m_can_device.configurationParameter(QCanBusDevice.RawFilterKey):
+            return "driver"
+        self.m_softwareFilters = list(raw_filters)
+        return "software"
+
+    def _release_device(self):
+        self.m_flushTimer.stop()
+        self.m_softwareFilters = []
+        self.m_writeOwners.clear()
+        requests = self.m_writeRequests
+        self.m_writeRequests = deque()
+        for _, callback, _, _, times in requests:
+            if callback is not None:
+                callback(times)  # 设备已断开，其余的帧没有写出
+        if self.m_can_device:
+            self.m_can_device.framesReceived.disconnect(self._read_frames)
+            self.m_can_device.deleteLater()
+            self.m_can_device = None
+
+    @Slot(QCanBusFrame)
+    def _write_frame(self, frame):
+        if self.m_can_device:
+            self.m_writeOwners.append(None)
+            if not self.m_can_device.writeFrame(frame):
+                self.m_writeOwners.pop()
+
+    @Slot(object, object, object, int)
+    def _write_frames(self, frames, callback, written, max_queued):
+        self.m_writeRequests.append((frames, callback, written, max_queued, []))
+        self._write_requests()
+
+    # 按顺序写出等待中的请求；暂停的请求之后，不限制队列长度的请求（例如周期发送）照常写出
+    def _write_requests(self):
+        if self.m_writing:
+            return
+        self.m_writing = True
+        try:
+            waiting = deque()
+            while self.m_writeRequests:
+                request = self.m_writeRequests.popleft()
+                if not self._write_request(request):
+                    waiting.append(request)
+            self.m_writeRequests = waiting
+        finally:
+            self.m_writing = False
+
+    # 写出一个请求中剩余的帧，后端的发送队列已满而暂停时返回 False
+    def _write_request(self, request):
+        frames, callback, written, max_queued, times = request
+        device = self.m_can_device
+        while device and len(times) < len(frames):
+            if max_queued and device.framesToWrite() >= max_queued:
+                return False
+            self.m_writeOwners.append(written)
+            if not device.writeFrame(frames[len(times)]):
+                self.m_writeOwners.pop()
+                break
+            times.append(perf_counter())
+        if callback is not None:
+            callback(times)
+        return True
+
+    @Slot()
+    def _reset_controller(self):
+        if self.m_can_device:
+            self.m_can_device.resetController()
+
+    @Slot()
+    def _bus_status(self):
+        if self.m_can_device and self.m_can_device.hasBusStatus():
+            self.bus_status_changed.emit(self.m_can_device.busStatus())
+
+    @Slot(int)
+    def _frames_written(self, count):
+        now = perf_counter()
+        owners = self.m_writeOwners
+        device = self.m_can_device
+        # 记下的帧比后端队列中的多出来的部分也已经发送（有的后端合并报告），至少按 count 计算
+        queued = device.framesToWrite() if device else 0
+        done = min(len(owners), max(count, len(owners) - queued))
+        run_owner = None
+        run = 0
+        for _ in range(done):
+            owner = owners.popleft()
+            if owner != run_owner:
+                if run_owner is not None:
+                    run_owner(run, now)
+                run_owner = owner
+                run = 0
+            run += 1
+        if run_owner is not None:
+            run_owner(run, now)
+        self.frames_written.emit(count)
+        if self.m_writeRequests:
+            self._write_requests()
+
+    @Slot(QCanBusDevice.CanBusError)
+    def _process_errors(self, error):
+        if error != QCanBusDevice.NoError and self.m_can_device:
+            self.error_occurred.emit(self.m_can_device.errorString())
+
+    # 用 readAllFrames() 一次取出设备中所有可用的帧，整批转换为原始数据：时间戳（微秒）、标志位、ID、有效载荷，
+    # 字符串的格式化推迟到 ReceivedFramesModel.data() 中进行
+    @Slot()
+    def _read_frames(self):
+        device = self.m_can_device
+        if not device:
+            return
+        with metrics.timed("reader.drain"):
+            frames = device.readAllFrames()
+            if not frames:
+                return
+            first_number = self.m_number_frames_received + 1
+            batch = frames_to_batch(frames, first_number, device)
+            if self.m_softwareFilters:
+                batch = batch.select(filter_batch_mask(batch, self.m_softwareFilters))
+                batch = batch.renumbered(first_number)
+        metrics.count("frames.read", len(frames))
+        if not len(batch):
+            return
+        self.m_number_frames_received += len(batch)
+        self.m_pending.append(batch)
+
+    # 把积累的帧拼接为一批提交给 GUI 线程
+    @Slot()
+    def _flush(self):
+        if not self.m_pending:
+            return
+        batch = FrameBatch.concatenate(self.m_pending)
+        self.m_pending = []
+        self.deliver(batch)
+
+    # 把一批帧交给 GUI 线程，并更新队列统计；队列超过上限时丢弃这一批。
+    # 记录器在丢弃之前收到这一批，所以 GUI 线程跟不上时磁盘上的记录仍然是完整的。
+    # 可以在任何线程中调用，例如基准测试用它注入合成的帧
+    def deliver(self, batch):
+        count = len(batch)
+        recorder = self.m_recorder
+        if recorder is not None:
+            recorder.record(batch)
+        capture = self.m_triggerCapture
+        if capture is not None:
+            capture.record(batch)
+        with self.m_lock:
+            if self.m_queuedFrames + count > MAX_QUEUED_FRAMES:
+                self.m_droppedFrames += count
+                metrics.count("frames.dropped", count)
+                return
+            self.m_queuedFrames += count
+            self.m_maxQueuedFrames = max(self.m_maxQueuedFrames, self.m_queuedFrames)
+            self.m_deliveredFrames += count
+        self.frames_received.emit(batch)
@@ -0,0 +1,281 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+
+# 列式（按列存储）的帧存储。
+# 每一列都是一个预先分配好的 numpy 类型数组，而不是每帧一个由 6 个字符串组成的 list：
+#   number     int64   帧序号（表格中的 "#" 列）
+#   timestamp  int64   时间戳，单位为微秒（seconds * 1000000 + microSeconds）
+#   can_id     uint32  帧 ID
+#   flags      uint8   标志位，见下面的 FLAG_* 定义
+#   dlc        uint8   有效载荷长度（字节数）
+#   payload    uint8   固定 64 字节宽的有效载荷矩阵（CAN FD 最大长度）
+# 每帧固定占用 86 字节，追加数据时只是整块的数组拷贝。
+
+MAX_PAYLOAD_FD = 64  # CAN FD 数据帧的最大有效载荷长度
+# CAN FD 的 DLC 编码（下标）对应的有效载荷长度；长度 -> DLC 可以用 numpy.searchsorted(FD_LENGTHS, length)
+FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+# flags 列中每一位的含义
+FLAG_BITRATE_SWITCH = 0x01  # 比特率切换（B）
+FLAG_ERROR_STATE = 0x02     # 错误状态指示器（E）
+FLAG_LOCAL_ECHO = 0x04      # 本地回显（L）
+FLAG_EXTENDED = 0x08        # 扩展帧格式（29 位 ID）
+FLAG_FLEXIBLE_DATA_RATE = 0x10  # CAN FD 帧
+FLAG_REMOTE = 0x20          # 远程请求帧
+FLAG_ERROR_FRAME = 0x40     # 错误帧
+
+ID_KEY_EXTENDED = 1 << 32  # 扩展帧和标准帧的同一个 ID 是不同的报文
+ID_KEY_ERROR = 1 << 33  # 错误帧单独作为一种报文
+
+_COLUMNS = (("number", np.int64), ("timestamp", np.int64), ("can_id", np.uint32),
+            ("flags", np.uint8), ("dlc", np.uint8))
+
+
+# 将帧的 ID 和帧格式合成一个整数键，用于按报文分组（固定模式的行、按 ID 的行索引）
+def id_keys(can_id, flags):
+    keys = can_id.astype(np.int64)
+    keys += np.where(flags & FLAG_EXTENDED, ID_KEY_EXTENDED, 0)
+    keys += np.where(flags & FLAG_ERROR_FRAME, ID_KEY_ERROR, 0)
+    return keys
+
+
+# 单个帧的键，与 id_keys() 一致
+def id_key(can_id, flags):
+    return (int(can_id) + (ID_KEY_EXTENDED if flags & FLAG_EXTENDED else 0)
+            + (ID_KEY_ERROR if flags & FLAG_ERROR_FRAME else 0))
+
+
+class FrameBatch():
+    """一批帧的列式表示，用于在接收端和 FrameStore 之间整块传递数据。"""
+
+    def __init__(self, number, timestamp, can_id, flags, dlc, payload, error_texts=None,
+                 received_at=None):
+        self.number = number
+        self.timestamp = timestamp
+        self.can_id = can_id
+        self.flags = flags
+        self.dlc = dlc
+        self.payload = payload
+        # 错误帧的解释文本很少出现，用 {帧序号: 文本} 的稀疏字典保存
+        self.error_texts = error_texts if error_texts is not None else {}
+        # 从设备读出这批帧的时间（time.perf_counter()），用于统计接收到显示的延迟
+        self.received_at = received_at
+
+    def __len__(self):
+        return len(self.number)
+
+    @classmethod
+    def empty(cls, size=0):
+        columns = [np.zeros(size, dtype) for _, dtype in _COLUMNS]
+        payload = np.zeros((size, MAX_PAYLOAD_FD), np.uint8)
+        return cls(*columns, payload)
+
+    # 返回 [start, stop) 范围内的帧组成的新批次（numpy 切片，不拷贝数据）
+    def slice(self, start, stop):
+        number = self.number[start:stop]
+        error_texts = {}
+        if self.error_texts and len(number):
+            # 帧序号是递增的，只需按首尾序号筛选
+            first, last = number[0], number[-1]
+            error_texts = {k: v for k, v in self.error_texts.items() if first <= k <= last}
+        return FrameBatch(number, self.timestamp[start:stop], self.can_id[start:stop],
+                          self.flags[start:stop], self.dlc[start:stop], self.payload[start:stop],
+                          error_texts, self.received_at)
+
+    # 返回布尔掩码 mask 选中的帧组成的新批次，帧序号保持不变
+    def select(self, mask):
+        number = self.number[mask]
+        error_texts = {}
+        if self.error_texts and len(number):
+            kept = set(number.tolist())
+            error_texts = {k: v for k, v in self.error_texts.items() if k in kept}
+        return FrameBatch(number, self.timestamp[mask], self.can_id[mask], self.flags[mask],
+                          self.dlc[mask], self.payload[mask], error_texts, self.received_at)
+
+    # 从 first_number 开始重新为帧编号，错误帧文本随之改用新的序号
+    def renumbered(self, first_number):
+        number = np.arange(first_number, first_number + len(self), dtype=np.int64)
+        error_texts = {int(number[np.searchsorted(self.number, k)]): v
+                       for k, v in self.error_texts.items()}
+        return FrameBatch(number, self.timestamp, self.can_id, self.flags, self.dlc,
+                          self.payload, error_texts, self.received_at)
+
+    # 将多个批次按顺序拼接为一个批次
+    @classmethod
+    def concatenate(cls, batches):
+        if len(batches) == 1:
+            return batches[0]
+        if not batches:
+            return cls.empty()
+        error_texts = {}
+        for batch in batches:
+            error_texts.update(batch.error_texts)
+        stamps = [b.received_at for b in batches if b.received_at is not None]
+        return cls(np.concatenate([b.number for b in batches]),
+                   np.concatenate([b.timestamp for b in batches]),
+                   np.concatenate([b.can_id for b in batches]),
+                   np.concatenate([b.flags for b in batches]),
+                   np.concatenate([b.dlc for b in batches]),
+                   np.concatenate([b.payload for b in batches]),
+                   error_texts, min(stamps) if stamps else None)
+
+
+class FrameStore():
+    """按列存储帧的容器。
+
+    limit 为 0 时容量不足就成倍扩容；limit 不为 0 时作为环形缓冲区使用：
+    m_head 指向逻辑第 0 行所在的物理位置，逻辑行 row 对应的物理位置为
+    (m_head + row) % m_capacity。从头部删除只移动 m_head，与 limit 的大小无关。
+    """
+
+    def __init__(self, capacity=1024, limit=0):
+        self.m_size = 0
+        self.m_head = 0
+        self.m_limit = limit
+        self.m_errorTexts = {}
+        self.m_errorTextsPruned = 0
+        self.m_columns = None
+        self._allocate(self._bounded(max(capacity, 1)))
+
+    def _bounded(self, capacity):
+        return min(capacity, self.m_limit) if self.m_limit else capacity
+
+    # 重新分配 capacity 行的空间，并把原有数据按逻辑顺序拷贝到新空间的开头
+    def _allocate(self, capacity):
+        old = self.m_columns
+        self.m_columns = {name: np.zeros(capacity, dtype) for name, dtype in _COLUMNS}
+        self.m_columns["payload"] = np.zeros((capacity, MAX_PAYLOAD_FD), np.uint8)
+        if old is not None and self.m_size:
+            offset = 0
+            for start, stop in self.segments():
+                for name, column in old.items():
+                    self.m_columns[name][offset:offset + stop - start] = column[start:stop]
+                offset += stop - start
+        self.m_capacity = capacity
+        self.m_head = 0
+        self.number = self.m_columns["number"]
+        self.timestamp = self.m_columns["timestamp"]
+        self.can_id = self.m_columns["can_id"]
+        self.flags = self.m_columns["flags"]
+        self.dlc = self.m_columns["dlc"]
+        self.payload = self.m_columns["payload"]
+
+    def __len__(self):
+        return self.m_size
+
+    # 逻辑行号 -> 物理行号
+    def physical(self, row):
+        index = self.m_head + row
+        return index - self.m_capacity if index >= self.m_capacity else index
+
+    # 按逻辑顺序返回数据所在的物理区间 [(start, stop), ...]，最多两段
+    def segments(self):
+        end = self.m_head + self.m_size
+        if end <= self.m_capacity:
+            return [(self.m_head, end)] if self.m_size else []
+        return [(self.m_head, self.m_capacity), (0, end - self.m_capacity)]
+
+    # 设置环形缓冲区的容量上限，0 表示不限制。调用前多余的行必须已经被删除
+    def set_limit(self, limit):
+        self.m_limit = limit
+        if limit and self.m_capacity > limit:
+            self._allocate(max(limit, self.m_size))
+
+    # 预留至少 capacity 行的空间
+    def reserve(self, capacity):
+        capacity = self._bounded(capacity)
+        if capacity > self.m_capacity:
+            self._allocate(capacity)
+
+    # 将一批帧追加到末尾，每一列都是一次（环绕时两次）整块拷贝
+    def append(self, batch):
+        count = len(batch)
+        if not count:
+            return
+        needed = self.m_size + count
+        if needed > self.m_capacity:
+            self._allocate(self._bounded(max(needed, 2 * self.m_capacity)))
+        if needed > self.m_capacity:
+            raise ValueError("FrameStore overflow: remove rows before appending")
+        offset = 0
+        tail = self.physical(self.m_size)
+        while offset < count:
+            stop = min(tail + count - offset, self.m_capacity)
+            length = stop - tail
+            self.number[tail:stop] = batch.number[offset:offset + length]
+            self.timestamp[tail:stop] = batch.timestamp[offset:offset + length]
+            self.can_id[tail:stop] = batch.can_id[offset:offset + length]
+            self.flags[tail:stop] = batch.flags[offset:offset + length]
+            self.dlc[tail:stop] = batch.dlc[offset:offset + length]
+            self.payload[tail:stop] = batch.payload[offset:offset + length]
+            offset += length
+            tail = 0
+        self.m_errorTexts.update(batch.error_texts)
+        self.m_size = needed
+
+    # 删除最前面的 count 行：只移动头指针，不搬移数据
+    def remove_front(self, count):
+        count = min(count, self.m_size)
+        if not count:
+            return
+        self.m_size -= count
+        if not self.m_size:
+            self.m_head = 0
+            self.m_errorTexts.clear()
+            return
+        self.m_head = self.physical(count)
+        # 已经被删除的错误帧文本不影响显示，数量明显增长后再统一清理
+        if len(self.m_errorTexts) > 2 * self.m_errorTextsPruned + 64:
+            first = self.number[self.m_head]
+            self.m_errorTexts = {k: v for k, v in self.m_errorTexts.items() if k >= first}
+            self.m_errorTextsPruned = len(self.m_errorTexts)
+
+    # 返回逻辑行 [start, stop) 组成的批次；不跨越环形缓冲区末尾时只是 numpy 视图，不拷贝数据。
+    # 不包含错误帧文本，用于在部分行上整批求值（例如过滤器）
+    def batch(self, start, stop):
+        stop = min(stop, self.m_size)
+        if start >= stop:
+            return FrameBatch.empty()
+        first = self.physical(start)
+        last = self.physical(stop - 1) + 1
+        if first < last:
+            return FrameBatch(self.number[first:last], self.timestamp[first:last],
+                              self.can_id[first:last], self.flags[first:last],
+                              self.dlc[first:last], self.payload[first:last])
+        return FrameBatch.concatenate([self._physical_batch(first, self.m_capacity),
+                                       self._physical_batch(0, last)])
+
+    def _physical_batch(self, start, stop):
+        return FrameBatch(self.number[start:stop], self.timestamp[start:stop],
+                          self.can_id[start:stop], self.flags[start:stop],
+                          self.dlc[start:stop], self.payload[start:stop])
+
+    # 在逻辑行 [start, stop) 中二分查找时间戳 timestamp，这一段中的时间戳必须单调递增。
+    # 返回值与 numpy.searchsorted 相同：side 为 "left" 时是第一个 >= timestamp 的行，
+    # 为 "right" 时是第一个 > timestamp 的行，都没有时返回 stop
+    def search_timestamp(self, start, stop, timestamp, side="left"):
+        stop = min(stop, self.m_size)
+        if start >= stop:
+            return stop
+        first = self.physical(start)
+        last = self.physical(stop - 1) + 1
+        if first < last:
+            return start + int(np.searchsorted(self.timestamp[first:last], timestamp, side))
+        # 跨越环形缓冲区末尾时分为两段，先判断要找的位置落在哪一段
+        head = self.timestamp[first:self.m_capacity]
+        i = int(np.searchsorted(head, timestamp, side))
+        if i < len(head):
+            return start + i
+        return start + len(head) + int(np.searchsorted(self.timestamp[:last], timestamp, side))
+
+    def clear(self):
+        self.m_size = 0
+        self.m_head = 0
+        self.m_errorTexts.clear()
+        self.m_errorTextsPruned = 0
+
+    # 返回错误帧的解释文本，没有则返回 None
+    def error_text(self, number):
+        return self.m_errorTexts.get(number)
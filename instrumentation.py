@@ -0,0 +1,138 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import json
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# 热路径的性能计数：计数器和延迟直方图。
+# 界面卡顿时用它判断时间花在了哪里：接收线程读取（reader.drain）、GUI 线程接收批次（process_received_frames）、
+# 模型更新（model.update）、刷新回调（onAppendFramesTimeout）还是视图绘制（view.paint），
+# 以及帧从被读取到显示出来的延迟（display_latency）。
+#
+# 用法：
+#     with metrics.timed("model.update"):
+#         ...
+#     metrics.count("frames.received", len(batch))
+#
+# 直方图按 2 的幂划分桶（单位微秒），记录一次只是几次整数运算，可以放在每批帧都会经过的路径上。
+
+HISTOGRAM_BUCKETS = 32  # 第 i 个桶的上限为 2**i 微秒，最后一个桶约为 36 分钟
+RECENT_SMOOTHING = 0.1  # 最近耗时的指数移动平均系数，用于实时读数
+
+
+class LatencyHistogram():
+
+    def __init__(self):
+        self.m_buckets = [0] * HISTOGRAM_BUCKETS
+        self.m_count = 0
+        self.m_total = 0.0
+        self.m_max = 0.0
+        self.m_last = 0.0
+        self.m_recent = 0.0
+
+    # 记录一次耗时，单位秒
+    def record(self, seconds):
+        microseconds = int(seconds * 1000000)
+        bucket = min(max(microseconds, 0).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.m_buckets[bucket] += 1
+        self.m_count += 1
+        self.m_total += seconds
+        self.m_last = seconds
+        self.m_recent += RECENT_SMOOTHING * (seconds - self.m_recent)
+        if seconds > self.m_max:
+            self.m_max = seconds
+
+    # 估计第 p 百分位数（取所在桶的上限），单位毫秒
+    def percentile(self, p):
+        if not self.m_count:
+            return 0.0
+        wanted = self.m_count * p / 100
+        seen = 0
+        for bucket, count in enumerate(self.m_buckets):
+            seen += count
+            if seen >= wanted:
+                return min((1 << bucket) / 1000, self.m_max * 1000)
+        return self.m_max * 1000
+
+    def mean_ms(self):
+        return self.m_total / self.m_count * 1000 if self.m_count else 0.0
+
+    def recent_ms(self):
+        return self.m_recent * 1000
+
+    def snapshot(self):
+        return {"count": self.m_count, "mean_ms": round(self.mean_ms(), 3),
+                "last_ms": round(self.m_last * 1000, 3), "recent_ms": round(self.recent_ms(), 3),
+                "p50_ms": round(self.percentile(50), 3), "p90_ms": round(self.percentile(90), 3),
+                "p99_ms": round(self.percentile(99), 3), "max_ms": round(self.m_max * 1000, 3),
+                "buckets_us": {f"<{1 << i}": c for i, c in enumerate(self.m_buckets) if c}}
+
+
+class Metrics():
+    """一组具名的计数器和延迟直方图，可以在接收线程和 GUI 线程中同时使用。"""
+
+    def __init__(self):
+        self.m_lock = Lock()
+        self.m_counters = {}
+        self.m_histograms = {}
+
+    def count(self, name, value=1):
+        with self.m_lock:
+            self.m_counters[name] = self.m_counters.get(name, 0) + value
+
+    def record(self, name, seconds):
+        with self.m_lock:
+            histogram = self.m_histograms.get(name)
+            if histogram is None:
+                histogram = self.m_histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    # 测量 with 语句块的耗时，记录到名为 name 的直方图中
+    @contextmanager
+    def timed(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def histogram(self, name):
+        with self.m_lock:
+            return self.m_histograms.get(name)
+
+    def counter(self, name):
+        with self.m_lock:
+            return self.m_counters.get(name, 0)
+
+    def reset(self):
+        with self.m_lock:
+            self.m_counters.clear()
+            self.m_histograms.clear()
+
+    def snapshot(self):
+        with self.m_lock:
+            return {"counters": dict(self.m_counters),
+                    "histograms": {name: h.snapshot() for name, h in self.m_histograms.items()}}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # 状态栏中显示的简短读数：各阶段最近的平均耗时和显示延迟
+    def summary(self):
+        with self.m_lock:
+            parts = []
+            for name, label in (("reader.drain", "drain"), ("model.update", "update"),
+                                ("view.paint", "paint")):
+                h = self.m_histograms.get(name)
+                if h is not None:
+                    parts.append(f"{label} {h.recent_ms():.2f}ms")
+            h = self.m_histograms.get("display_latency")
+            if h is not None:
+                parts.append(f"latency {h.recent_ms():.0f}ms")
+            return " | ".join(parts)
+
+
+# 整个程序共用的性能计数
+metrics = Metrics()
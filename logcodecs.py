@@ -0,0 +1,450 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import gzip
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE,
+                        FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_LOCAL_ECHO,
+                        FLAG_REMOTE, FD_LENGTHS, MAX_PAYLOAD_FD, FrameBatch)
+from blf import BlfEncoder, BlfReader
+from parquetlog import ParquetEncoder, ParquetReader
+from recorder import RECORD_DTYPE, BinaryLogEncoder, LogFormatError, open_log, read_header, records_to_batch
+
+# 文本日志格式的流式编解码：SocketCAN 的 candump -l 格式和 Vector ASC 格式。
+#
+# 编码器（CandumpEncoder、AscEncoder）与 recorder.BinaryLogEncoder 的接口相同，
+# 既可以交给 LogRecorder 在写线程中实时记录，也可以用 export_log() 导出当前缓存的帧。
+# 编码按批进行：同样长度的有效载荷一次 bytes.hex() 转换后再按行切开，时间戳和 ID 整列转换为 Python 整数。
+#
+# 读取时按 READ_CHUNK 字节一块读入文件，每块只包含完整的行，解析为一个 FrameBatch 后再读下一块，
+# 内存占用与文件大小无关；read_log_file() 逐批返回帧，由调用者决定放到哪里（例如 ReceivedFramesModel）。
+# 二进制的 Vector BLF 格式见 blf，供离线分析用的列式 Parquet 格式见 parquetlog。
+
+READ_CHUNK = 1 << 22  # 读取文本日志时每块的字节数
+EXPORT_CHUNK = 1 << 16  # 导出时每批的帧数
+
+LOG_FILE_FILTERS = ("CAN log files (*.canlog);;candump log files (*.log);;Vector ASC files (*.asc);;"
+                    "Vector BLF files (*.blf);;Parquet files (*.parquet)")
+
+CAN_ERR_FLAG = 0x20000000  # SocketCAN 的错误帧标志，candump 把它写在 ID 中
+CAN_ERR_MASK = 0x1FFFFFFF
+
+_FD_DLC = {length: code for code, length in enumerate(FD_LENGTHS)}  # CAN FD 有效载荷长度 -> DLC 编码
+
+_ASC_DATE_FORMAT = "%a %b %d %I:%M:%S.%f %p %Y"
+
+
+# 批量地把每一行的有效载荷格式化为十六进制字符串，字节之间用 sep 分隔。
+# 长度相同的行拼接在一起只调用一次 bytes.hex()，再按固定宽度切开
+def hex_rows(payload, dlc, sep=""):
+    result = [""] * len(dlc)
+    for length in np.unique(dlc).tolist():
+        if not length:
+            continue
+        rows = np.flatnonzero(dlc == length)
+        block = np.ascontiguousarray(payload[rows, :length]).tobytes()
+        text = (block.hex(sep) if sep else block.hex()).upper()
+        stride = length * (2 + len(sep))
+        width = stride - len(sep)
+        for i, row in enumerate(rows.tolist()):
+            result[row] = text[i * stride:i * stride + width]
+    return result
+
+
+# 把各列的 Python list 组成 FrameBatch；payloads 为每帧的有效载荷（bytes）
+def make_batch(first_number, timestamps, can_ids, flags, payloads):
+    count = len(timestamps)
+    payloads = [p[:MAX_PAYLOAD_FD] for p in payloads]
+    matrix = np.frombuffer(b"".join(p.ljust(MAX_PAYLOAD_FD, b"\0") for p in payloads),
+                           np.uint8).reshape(count, MAX_PAYLOAD_FD)
+    return FrameBatch(np.arange(first_number, first_number + count, dtype=np.int64),
+                      np.array(timestamps, np.int64), np.array(can_ids, np.uint32),
+                      np.array(flags, np.uint8), np.array([len(p) for p in payloads], np.uint8),
+                      matrix.copy())
+
+
+# 按块读取文本文件，每次返回只包含完整行的一块（bytes）
+def _line_blocks(f):
+    rest = b""
+    while True:
+        data = f.read(READ_CHUNK)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        if not end:
+            rest = data
+            continue
+        rest = data[end:]
+        yield data[:end]
+    if rest:
+        yield rest
+
+
+# "秒.小数" -> 微秒，避免经过浮点数
+def _parse_seconds(text):
+    secs, _, fraction = text.partition(".")
+    value = int(secs or "0") * 1000000 + int((fraction + "000000")[:6])
+    return -value if text.startswith("-") else value
+
+
+def _format_seconds(microseconds, width):
+    sign = "-" if microseconds < 0 else ""
+    secs, micros = divmod(abs(microseconds), 1000000)
+    return f"{sign + str(secs):>{width}}.{micros:06d}"
+
+
+class CandumpEncoder():
+    """candump -l 格式：每行 "(秒.微秒) 接口 ID#数据"。
+
+    标准帧的 ID 为 3 位十六进制数，扩展帧为 8 位；CAN FD 帧为 "ID##标志数据"，标志的 1 位为 BRS、2 位为 ESI；
+    远程帧为 "ID#R"；错误帧的 ID 带有 CAN_ERR_FLAG。
+    """
+
+    def __init__(self, interface="can0"):
+        self.m_interface = interface
+
+    def begin(self):
+        return b""
+
+    def encode(self, batch):
+        seconds, micros = np.divmod(batch.timestamp, 1000000)
+        data = hex_rows(batch.payload, batch.dlc)
+        lines = []
+        prefix = f") {self.m_interface} "
+        for sec, us, can_id, bits, payload in zip(seconds.tolist(), micros.tolist(),
+                                                  batch.can_id.tolist(), batch.flags.tolist(), data):
+            if bits & FLAG_ERROR_FRAME:
+                frame = f"{can_id | CAN_ERR_FLAG:08X}#{payload}"
+            else:
+                frame = f"{can_id:08X}" if bits & FLAG_EXTENDED else f"{can_id:03X}"
+                if bits & FLAG_REMOTE:
+                    frame += "#R"
+                elif bits & FLAG_FLEXIBLE_DATA_RATE:
+                    frame += f"##{bits & (FLAG_BITRATE_SWITCH | FLAG_ERROR_STATE):X}{payload}"
+                else:
+                    frame += "#" + payload
+            lines.append(f"({sec}.{us:06d}{prefix}{frame}\n")
+        return "".join(lines).encode("ascii")
+
+    def end(self):
+        return b""
+
+
+_CANDUMP_LINE = re.compile(rb"^\s*\((\d+)\.(\d+)\)\s+\S+\s+([0-9A-Fa-f]+)#(#[0-9A-Fa-f])?(R\d*|[0-9A-Fa-f.]*)",
+                           re.MULTILINE)
+
+
+def read_candump(f, first_number=1):
+    for block in _line_blocks(f):
+        matches = _CANDUMP_LINE.findall(block)
+        if matches:
+            batch = _candump_batch(first_number, *zip(*matches))
+            first_number += len(batch)
+            yield batch
+
+
+# 把一块中匹配到的各列（bytes 的元组）整列转换为 FrameBatch
+def _candump_batch(first_number, secs, fractions, idents, fds, data):
+    count = len(secs)
+    fractions = np.array(fractions)
+    if fractions.dtype.itemsize == 6 and (np.char.str_len(fractions) == 6).all():
+        micros = fractions.astype(np.int64)
+    else:
+        micros = np.array([int((x + b"000000")[:6]) for x in fractions], np.int64)
+    timestamps = np.array(secs).astype(np.int64) * 1000000 + micros
+
+    can_ids = np.array([int(x, 16) for x in idents], np.int64)
+    error = (can_ids & CAN_ERR_FLAG) != 0
+    can_ids &= CAN_ERR_MASK
+    flags = np.where(error, FLAG_ERROR_FRAME,
+                     np.where(np.char.str_len(np.array(idents)) > 3, FLAG_EXTENDED, 0)).astype(np.uint8)
+    data = np.array(data)
+    remote = np.char.startswith(data, b"R")
+    flags[remote] |= FLAG_REMOTE
+    fds = np.array(fds)
+    for row in np.flatnonzero(fds != b"").tolist():
+        flags[row] |= FLAG_FLEXIBLE_DATA_RATE | (int(fds[row][1:], 16) & (FLAG_BITRATE_SWITCH | FLAG_ERROR_STATE))
+
+    data[remote] = b""
+    lengths = np.char.str_len(data)
+    width = data.dtype.itemsize  # 这一块中最长的十六进制数据
+    if (width % 2 or width > 2 * MAX_PAYLOAD_FD or (lengths % 2).any()
+            or (np.char.find(data, b".") >= 0).any()):
+        # 有效载荷中有分隔符或者不是完整的字节时逐行处理，跳过无效的行
+        return make_batch(first_number, *_candump_rows(timestamps, can_ids, flags, data))
+    payload = np.zeros((count, MAX_PAYLOAD_FD), np.uint8)
+    if width:
+        # 每行的十六进制数据补齐到同样的宽度后一次转换
+        text = b"".join(np.char.ljust(data, width, b"0").tolist()).decode("ascii")
+        payload[:, :width // 2] = np.frombuffer(bytes.fromhex(text), np.uint8).reshape(count, width // 2)
+    return FrameBatch(np.arange(first_number, first_number + count, dtype=np.int64), timestamps,
+                      can_ids.astype(np.uint32), flags, (lengths // 2).astype(np.uint8), payload)
+
+
+def _candump_rows(timestamps, can_ids, flags, data):
+    columns = ([], [], [], [])
+    for timestamp, can_id, bits, text in zip(timestamps.tolist(), can_ids.tolist(), flags.tolist(),
+                                             data.tolist()):
+        try:
+            payload = bytes.fromhex(text.replace(b".", b"").decode("ascii"))
+        except ValueError:
+            continue
+        for column, value in zip(columns, (timestamp, can_id, bits, payload)):
+            column.append(value)
+    return columns
+
+
+class AscEncoder():
+    """Vector ASC 格式（base hex，timestamps absolute）。
+
+    时间戳相对于文件头中 date 一行的时间（第一帧的时间戳截断到毫秒），
+    本地回显的帧记为 Tx，其它为 Rx，通道固定为 1。文件头在第一批帧到达时写入。
+    """
+
+    def __init__(self, channel=1):
+        self.m_channel = channel
+        self.m_start = None
+
+    def begin(self):
+        return b""
+
+    def _header(self, start):
+        self.m_start = start
+        date = datetime.fromtimestamp(start / 1000000)
+        text = f"{date.strftime('%a %b %d %I:%M:%S')}.{date.microsecond // 1000:03d} " \
+               f"{date.strftime('%p').lower()} {date.year}"
+        return (f"date {text}\nbase hex  timestamps absolute\ninternal events logged\n"
+                f"Begin Triggerblock {text}\n{_format_seconds(0, 4)} Start of measurement\n")
+
+    def encode(self, batch):
+        lines = []
+        if self.m_start is None:
+            first = int(batch.timestamp[0]) if len(batch) else 0
+            lines.append(self._header(first - first % 1000))
+        data = hex_rows(batch.payload, batch.dlc, " ")
+        channel = self.m_channel
+        for timestamp, can_id, bits, dlc, payload in zip(batch.timestamp.tolist(), batch.can_id.tolist(),
+                                                        batch.flags.tolist(), batch.dlc.tolist(), data):
+            time_text = _format_seconds(timestamp - self.m_start, 4)
+            if bits & FLAG_ERROR_FRAME:
+                lines.append(f"{time_text} {channel}  ErrorFrame\n")
+                continue
+            ident = f"{can_id:X}x" if bits & FLAG_EXTENDED else f"{can_id:X}"
+            direction = "Tx" if bits & FLAG_LOCAL_ECHO else "Rx"
+            if bits & FLAG_FLEXIBLE_DATA_RATE:
+                brs = 1 if bits & FLAG_BITRATE_SWITCH else 0
+                esi = 1 if bits & FLAG_ERROR_STATE else 0
+                fd_flags = 0x1000 | brs << 13 | esi << 14
+                lines.append(f"{time_text} CANFD {channel:>3} {direction:<4} {ident:>8} {brs} {esi} "
+                             f"{_FD_DLC.get(dlc, 15):x} {dlc:>2} {payload} {0:>8} {0:>4} {fd_flags:>8X} "
+                             f"{0:>8} {0:>8} {0:>8} {0:>8} {0:>8}\n")
+            elif bits & FLAG_REMOTE:
+                lines.append(f"{time_text} {channel}  {ident:<15} {direction:<4} r {dlc:x}\n")
+            else:
+                lines.append(f"{time_text} {channel}  {ident:<15} {direction:<4} d {dlc:x} {payload}\n")
+        return "".join(lines).encode("ascii")
+
+    def end(self):
+        header = self._header(0) if self.m_start is None else ""
+        return (header + "End TriggerBlock\n").encode("ascii")
+
+
+def read_asc(f, first_number=1):
+    base = 16
+    relative = False
+    offset = 0  # date 一行的时间，加到每一帧的时间戳上
+    last = 0
+    for block in _line_blocks(f):
+        timestamps = []
+        can_ids = []
+        flags = []
+        payloads = []
+        for line in block.decode("latin-1").splitlines():
+            tokens = line.split()
+            if len(tokens) < 3:
+                continue
+            keyword = tokens[0]
+            if not keyword[0].isdigit():
+                if keyword == "base":
+                    base = 10 if tokens[1] == "dec" else 16
+                    relative = "relative" in tokens[2:]
+                elif keyword == "date":
+                    try:
+                        date = datetime.strptime(" ".join(tokens[1:]), _ASC_DATE_FORMAT)
+                        offset = int(date.timestamp() * 1000) * 1000
+                    except ValueError:
+                        offset = 0
+                continue
+            try:
+                frame = _parse_asc_message(tokens, base)
+            except ValueError:
+                continue # 不认识的事件或格式错误的行
+            if frame is None:
+                continue
+            timestamp = _parse_seconds(keyword)
+            if relative:
+                last += timestamp
+                timestamp = last
+            timestamps.append(timestamp + offset)
+            can_ids.append(frame[0])
+            flags.append(frame[1])
+            payloads.append(frame[2])
+        if timestamps:
+            yield make_batch(first_number, timestamps, can_ids, flags, payloads)
+            first_number += len(timestamps)
+
+
+def _asc_id(text, base):
+    if text.endswith("x"):
+        return int(text[:-1], base), FLAG_EXTENDED
+    return int(text, base), 0
+
+
+def _asc_bytes(tokens, base):
+    if base == 16:
+        return bytes.fromhex("".join(tokens))
+    return bytes(int(token) for token in tokens)
+
+
+# 解析一行 ASC 消息，返回 (ID, 标志位, 有效载荷)，不是 CAN 帧的行返回 None
+def _parse_asc_message(tokens, base):
+    if tokens[1] == "CANFD":
+        # 时间 CANFD 通道 方向 ID [符号名] BRS ESI DLC 长度 数据...
+        if len(tokens) < 10:
+            return None
+        bits = FLAG_LOCAL_ECHO if tokens[3] == "Tx" else 0
+        can_id, extended = _asc_id(tokens[4], base)
+        i = 5 if tokens[5].isdigit() and tokens[6].isdigit() else 6
+        bits |= extended | FLAG_FLEXIBLE_DATA_RATE
+        if tokens[i] == "1":
+            bits |= FLAG_BITRATE_SWITCH
+        if tokens[i + 1] == "1":
+            bits |= FLAG_ERROR_STATE
+        length = int(tokens[i + 3])
+        return can_id, bits, _asc_bytes(tokens[i + 4:i + 4 + length], base)
+    if not tokens[1].isdigit():
+        return None
+    if tokens[2] == "ErrorFrame":
+        return 0, FLAG_ERROR_FRAME, b""
+    if len(tokens) < 5 or tokens[3] not in ("Rx", "Tx"):
+        return None
+    can_id, bits = _asc_id(tokens[2], base)
+    if tokens[3] == "Tx":
+        bits |= FLAG_LOCAL_ECHO
+    if tokens[4] == "r":
+        return can_id, bits | FLAG_REMOTE, b""
+    if tokens[4] != "d" or len(tokens) < 6:
+        return None
+    dlc = int(tokens[5], 16)
+    return can_id, bits, _asc_bytes(tokens[6:6 + dlc], base)
+
+
+def read_binary_log(file_name, first_number=1):
+    _, records = open_log(file_name)
+    for start in range(0, len(records), EXPORT_CHUNK):
+        stop = min(start + EXPORT_CHUNK, len(records))
+        yield records_to_batch(records[start:stop], first_number + start)
+
+
+# 从文件对象（例如 gzip 压缩的段，见 rotation）顺序读取二进制日志
+def _read_binary_stream(f, first_number=1):
+    read_header(f)
+    while True:
+        records = np.empty(EXPORT_CHUNK, RECORD_DTYPE)
+        size = f.readinto(memoryview(records).cast("B"))
+        count = size // RECORD_DTYPE.itemsize
+        if count:
+            yield records_to_batch(records[:count], first_number)
+            first_number += count
+        if size < records.nbytes:
+            break
+
+
+def _extension(file_name):
+    return os.path.splitext(file_name)[1].lower()
+
+
+def read_blf(file_name, first_number=1):
+    reader = BlfReader(file_name)
+    try:
+        yield from reader.batches(first_number)
+    finally:
+        reader.close()
+
+
+def read_parquet(file_name, first_number=1):
+    reader = ParquetReader(file_name)
+    try:
+        yield from reader.batches(first_number)
+    finally:
+        reader.close()
+
+
+# 按扩展名选择编码器：.log 为 candump，.asc 为 Vector ASC，.blf 为 Vector BLF，.parquet 为 Parquet，其它为二进制格式
+def encoder_for_file(file_name):
+    extension = _extension(file_name)
+    if extension == ".blf":
+        return BlfEncoder()
+    if extension == ".parquet":
+        return ParquetEncoder()
+    if extension == ".log":
+        return CandumpEncoder()
+    if extension == ".asc":
+        return AscEncoder()
+    return BinaryLogEncoder()
+
+
+# 逐批读取日志文件中的帧，帧序号从 first_number 开始连续编号。
+# 以 .gz 结尾的文件（rotation 压缩的段）按去掉 .gz 后的扩展名解压读取。
+# 文件无法读取时抛出 OSError，格式不对时抛出 LogFormatError
+def read_log_file(file_name, first_number=1):
+    extension = _extension(file_name)
+    if extension == ".gz":
+        inner = _extension(file_name[:-3])
+        if inner not in (".canlog", ".log", ".asc"):
+            raise LogFormatError(f"unknown log format '{inner}.gz'")
+        with gzip.open(file_name, "rb") as f:
+            try:
+                if inner == ".canlog":
+                    yield from _read_binary_stream(f, first_number)
+                else:
+                    yield from (read_candump if inner == ".log" else read_asc)(f, first_number)
+            except (EOFError, gzip.BadGzipFile) as e:
+                raise LogFormatError(str(e))
+        return
+    if extension == ".canlog":
+        yield from read_binary_log(file_name, first_number)
+        return
+    if extension == ".blf":
+        yield from read_blf(file_name, first_number)
+        return
+    if extension == ".parquet":
+        yield from read_parquet(file_name, first_number)
+        return
+    if extension not in (".log", ".asc"):
+        raise LogFormatError(f"unknown log format '{extension}'")
+    with open(file_name, "rb") as f:
+        reader = read_candump if extension == ".log" else read_asc
+        yield from reader(f, first_number)
+
+
+# 把一系列批次写入日志文件（格式由扩展名决定），返回写入的帧数
+def export_log(file_name, batches):
+    encoder = encoder_for_file(file_name)
+    count = 0
+    with open(file_name, "wb") as f:
+        f.write(encoder.begin())
+        for batch in batches:
+            if len(batch):
+                f.write(encoder.encode(batch))
+                count += len(batch)
+        f.write(encoder.end())
+        if hasattr(encoder, "finish"):
+            encoder.finish(f)
+    return count
@@ -0,0 +1,145 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from collections import OrderedDict
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSize, Qt
+
+from framestore import FLAG_ERROR_FRAME
+from receivedframesmodel import (ReceivedFramesModelColumns, clipboard_text_role, column_alignment,
+                                 format_flags, format_payload, format_timestamp)
+
+# 按需读取的日志文件表格模型，列与 ReceivedFramesModel 相同。
+#
+# 帧不复制到模型中，而是留在日志文件里，由数据源按需解码。数据源的接口（见 blf.BlfReader 和 mappedlog.MappedLog）：
+#   row_count()         已知的帧数
+#   can_fetch_more()    后面是否还有没有解码的帧
+#   fetch_more()        继续解码一部分帧，返回新得到的帧数
+#   batch(start, stop)  返回行 [start, stop) 的 FrameBatch
+# 视图滚动到末尾时通过 canFetchMore()/fetchMore() 继续读取；可见的行按页从数据源取出，
+# 最近用过的页保存在有上限的 LRU 缓存中。
+
+PAGE_ROWS = 1024  # 每页的行数
+PAGE_CACHE = 32  # 缓存的页数
+
+column_titles = ["#", "Timestamp", "Flags", "CAN-ID", "DLC", "Data"]
+column_widths = [80, 130, 25, 50, 25, 200]
+
+
+class LogFileModel(QAbstractTableModel):
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.m_source = source
+        self.m_rowCount = source.row_count()
+        self.m_pages = OrderedDict()  # 页号 -> FrameBatch
+
+    def headerData(self, section, orientation, role):
+        if orientation != Qt.Horizontal:
+            return None
+        if role == Qt.DisplayRole:
+            return column_titles[section]
+        if role == Qt.SizeHintRole:
+            return QSize(column_widths[section], 25)
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.m_rowCount
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else ReceivedFramesModelColumns.count
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.m_source.can_fetch_more()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        self.m_source.fetch_more()
+        count = self.m_source.row_count()
+        if count > self.m_rowCount:
+            # 最后一页可能是不完整的，新的行到达后重新读取
+            self.m_pages.pop(self.m_rowCount // PAGE_ROWS, None)
+            self.beginInsertRows(QModelIndex(), self.m_rowCount, count - 1)
+            self.m_rowCount = count
+            self.endInsertRows()
+
+    # 读取全部剩余的帧，返回总帧数
+    def fetch_all(self):
+        while self.canFetchMore():
+            self.fetchMore()
+        return self.m_rowCount
+
+    def _page(self, page):
+        batch = self.m_pages.get(page)
+        if batch is None:
+            batch = self.m_source.batch(page * PAGE_ROWS, (page + 1) * PAGE_ROWS)
+            self.m_pages[page] = batch
+            if len(self.m_pages) > PAGE_CACHE:
+                self.m_pages.popitem(last=False)
+        else:
+            self.m_pages.move_to_end(page)
+        return batch
+
+    def data(self, index, role):
+        row = index.row()
+        column = index.column()
+        if row < 0 or row >= self.m_rowCount:
+            return None
+        if role == Qt.TextAlignmentRole:
+            return column_alignment[column]
+        if role == Qt.DisplayRole:
+            return self.format_cell(row, column)
+        if role == clipboard_text_role:
+            f = self.format_cell(row, column)
+            return f"[{f}]" if column == ReceivedFramesModelColumns.DLC else f
+        return None
+
+    def format_cell(self, row, column):
+        frames = self._page(row // PAGE_ROWS)
+        p = row % PAGE_ROWS
+        if p >= len(frames):
+            return None
+        if column == ReceivedFramesModelColumns.number:
+            return f"{frames.number[p]}"
+        if column == ReceivedFramesModelColumns.timestamp:
+            return format_timestamp(frames.timestamp[p])
+        if column == ReceivedFramesModelColumns.flags:
+            return format_flags(frames.flags[p])
+        if column == ReceivedFramesModelColumns.can_id:
+            return f"{frames.can_id[p]:x}"
+        if column == ReceivedFramesModelColumns.DLC:
+            return f"{frames.dlc[p]}"
+        if column == ReceivedFramesModelColumns.data:
+            if frames.flags[p] & FLAG_ERROR_FRAME and frames.error_texts:
+                text = frames.error_texts.get(int(frames.number[p]))
+                if text is not None:
+                    return text
+            return format_payload(frames.payload[p], frames.dlc[p])
+        return None
+
+
+class MappedLogModel(LogFileModel):
+    """内存映射的二进制日志（见 mappedlog.MappedLog）的表格模型。
+
+    除了显示以外，还提供与 ReceivedFramesModel 相同的按时间定位和查找同 ID 帧的接口，
+    由数据源用稀疏索引完成，ReceivedFramesView 的对应菜单因此也可以用于日志文件。
+    """
+
+    def row_key(self, row):
+        return self.m_source.row_key(row)
+
+    def find_same_id(self, row, forward=True):
+        return self.m_source.find_same_id(row, forward)
+
+    def timestamp(self, row):
+        return self.m_source.timestamp(row)
+
+    def timestamp_breaks(self):
+        return self.m_source.timestamp_breaks()
+
+    def row_at_time(self, timestamp):
+        return self.m_source.row_at_time(timestamp)
+
+    def rows_in_time_window(self, first, last):
+        return self.m_source.rows_in_time_window(first, last)
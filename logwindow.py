@@ -0,0 +1,138 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+
+from PySide6.QtCore import Qt, QTimer, Slot
+from PySide6.QtWidgets import QLabel, QVBoxLayout, QWidget
+
+from blf import BlfReader
+from logcodecs import read_log_file
+from logfilemodel import LogFileModel, MappedLogModel
+from mappedlog import MappedLog
+from parquetlog import ParquetReader
+from receivedframesmodel import ReceivedFramesModel
+from receivedframesview import ReceivedFramesView
+
+# 日志文件窗口：把 candump、ASC 或二进制日志文件中的帧读入一个不限行数的 ReceivedFramesModel。
+# 文件按块流式解析（见 logcodecs），每个定时器周期只读入一块并追加到模型，读取大文件时界面仍然可以操作。
+# BLF 文件不读入内存，而是用 LogFileModel 按需解压：视图滚动到哪里，才解压到哪里。
+# Parquet 文件也一样，只解码可见的行所在的行组（见 parquetlog）。
+# 二进制日志（.canlog）以内存映射打开（见 mappedlog），立即显示所有行；
+# 按时间定位和查找同 ID 帧用的稀疏索引由定时器分块建立，每个周期一块，建好后保存在日志旁边供下次使用。
+
+
+class LogWindow(QWidget):
+
+    def __init__(self, file_name, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle(f"Log - {os.path.basename(file_name)}")
+        self.resize(700, 400)
+
+        self.m_view = ReceivedFramesView(self)
+        self.m_status = QLabel(self)
+        self.m_view.status_message.connect(self.m_status.setText)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.m_view)
+        layout.addWidget(self.m_status)
+
+        self.m_reader = None
+        self.m_batches = None
+        self.m_loadTimer = None
+        self.m_indexTimer = None
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension == ".blf":
+            self._open_source(BlfReader, file_name)
+            return
+        if extension == ".parquet":
+            self._open_source(ParquetReader, file_name)
+            return
+        if extension == ".canlog":
+            self._open_mapped(file_name)
+            return
+
+        self.m_model = ReceivedFramesModel(self)
+        self.m_model.set_queue_limit(0)
+        self.m_view.set_model(self.m_model)
+        self.m_batches = read_log_file(file_name)
+        self.m_loadTimer = QTimer(self)
+        self.m_loadTimer.timeout.connect(self._load_next)
+        self.m_loadTimer.start(0)
+
+    # 用 reader_type（BlfReader 或 ParquetReader）打开文件，作为 LogFileModel 的数据源
+    def _open_source(self, reader_type, file_name):
+        try:
+            self.m_reader = reader_type(file_name)
+        except (OSError, ValueError) as e:
+            self.m_status.setText(f"Cannot read log: {e}")
+            return
+        self.m_model = LogFileModel(self.m_reader, self)
+        self.m_model.rowsInserted.connect(self._show_fetched)
+        self.m_view.set_model(self.m_model)
+        if self.m_model.canFetchMore():
+            self.m_model.fetchMore()
+        self._show_fetched()
+
+    def _open_mapped(self, file_name):
+        try:
+            self.m_reader = MappedLog(file_name)
+        except (OSError, ValueError) as e:
+            self.m_status.setText(f"Cannot read log: {e}")
+            return
+        self.m_model = MappedLogModel(self.m_reader, self)
+        self.m_view.set_model(self.m_model)
+        self.m_indexTimer = QTimer(self)
+        self.m_indexTimer.timeout.connect(self._index_next)
+        self.m_indexTimer.start(0)
+        self._index_next()
+
+    # 为下一块建立索引
+    @Slot()
+    def _index_next(self):
+        rows = self.m_reader.row_count()
+        try:
+            indexed = self.m_reader.index_more()
+        except OSError as e:
+            self.m_indexTimer.stop()
+            self.m_status.setText(f"{rows} frames, cannot build index: {e}")
+            return
+        if indexed < rows:
+            self.m_status.setText(f"{rows} frames, indexing {indexed * 100 // rows}%")
+            return
+        self.m_indexTimer.stop()
+        self.m_reader.save_index()
+        self.m_status.setText(f"{rows} frames")
+
+    @Slot()
+    def _show_fetched(self):
+        more = " (scroll down to read more)" if self.m_reader.can_fetch_more() else ""
+        self.m_status.setText(f"{self.m_model.rowCount()} frames{more}")
+
+    # 读入下一块
+    @Slot()
+    def _load_next(self):
+        try:
+            batch = next(self.m_batches)
+        except StopIteration:
+            self.m_loadTimer.stop()
+            self.m_status.setText(f"{self.m_model.rowCount()} frames")
+            return
+        except (OSError, ValueError) as e:
+            self.m_loadTimer.stop()
+            self.m_status.setText(f"Cannot read log: {e}")
+            return
+        self.m_model.append_frames(batch)
+        self.m_model.update()
+        self.m_status.setText(f"Loading... {self.m_model.rowCount()} frames")
+
+    def closeEvent(self, event):
+        if self.m_loadTimer is not None:
+            self.m_loadTimer.stop()
+            self.m_batches.close()
+        if self.m_indexTimer is not None:
+            self.m_indexTimer.stop()
+        if self.m_reader is not None:
+            self.m_reader.close()
+        super().closeEvent(event)
@@ -1,39 +1,45 @@
 # Copyright (C) 2022 The Qt Company Ltd.
 # SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
 
-from PySide6.QtCore import QTimer, QUrl, Slot
-from PySide6.QtGui import QDesktopServices
-from PySide6.QtWidgets import QLabel, QMainWindow
-from PySide6.QtSerialBus import QCanBus, QCanBusDevice, QCanBusFrame
+import os
+from datetime import datetime
+
+from PySide6.QtCore import QEvent, QThread, QTimer, QUrl, Slot
+from PySide6.QtGui import QAction, QDesktopServices
+from PySide6.QtWidgets import QFileDialog, QInputDialog, QLabel, QLineEdit, QMainWindow
+from PySide6.QtSerialBus import QCanBusDevice, QCanBusFrame
 
 from connectdialog import ConnectDialog
 from canbusdeviceinfodialog import CanBusDeviceInfoDialog
 from ui_mainwindow import Ui_MainWindow
-from receivedframesmodel import ReceivedFramesModel
+from receivedframesmodel import ReceivedFramesModel, format_flags
+from fixedtracemodel import FixedTraceModel
+from framefilterproxymodel import FrameFilterProxyModel
+from filteredviewwindow import FilteredViewWindow
+from payloadsearch import PayloadSearchBar
+from framereader import FrameReader, frame_flag_bits
+from recorder import LogRecorder
+from capturedb import CAPTURE_DB_FILTER, SqliteRecorder, is_capture_db
+from rotation import RotatingRecorder
+from rotationdialog import RotationDialog, default_recording, rotation_enabled, rotation_options, writer_options
+from triggercapture import TriggerCapture
+from triggerdialog import TriggerDialog, default_trigger
+from logcodecs import EXPORT_CHUNK, LOG_FILE_FILTERS, encoder_for_file, export_log
+from logwindow import LogWindow
+from sqlconsole import SqlConsoleWindow
+from replay import LogReplayer
+from transmittable import TransmitTableWindow
+from refreshscheduler import RefreshScheduler
+from filterengine import FilterSyntaxError, compile_filter
+from instrumentation import metrics
 
 
 # 如果 frame 具有 hasBitrateSwitch 和 hasLocalEcho 属性，
-# 那么调用 frame_flags(frame) 将返回字符串 " BL- "。
+# 那么调用 frame_flags(frame) 将返回字符串 " B-L "。
 
 # 该字符串表示 frame 具有比特率切换和本地回显的标志。
 def frame_flags(frame):
-    result = " --- "
-    if frame.hasBitrateSwitch():
-        # result[1] = 'B' # (就是区分CAN 还是 CAN-FD)
-        result = list(result)
-        result[1] = 'B'
-        result = ''.join(result)
-    if frame.hasErrorStateIndicator():
-        # result[2] = 'E' # 通过错误状态指示器来提醒通信节点发现问题
-        result = list(result)
-        result[2] = 'E'
-        result = ''.join(result)
-    if frame.hasLocalEcho():
-        result = list(result)
-        result[3] = 'L'
-        result = ''.join(result)
-        # result[3] = 'L' # 输入后 立即看到屏幕显示（默认开启，但 在输入敏感信息（如密码）时，为了安全性考虑（可能会被禁用）
-    return result
+    return format_flags(frame_flag_bits(frame))
 # 比特率切换是一种在 CAN 网络中改变通信速率的机制。
 # 通过比特率切换，可以调整数据传输的速度，以适应不同的应用场景和要求。
 # hasBitrateSwitch() 方法用于判断 CAN 报文是否具有比特率切换。(就是区分CAN 还是 CAN-FD)
@@ -89,7 +95,15 @@ class MainWindow(QMainWindow):
         self.m_number_frames_received = 0
         self.m_written = None
         self.m_received = None
-        self.m_can_device = None
+        self.m_device_connected = False
+        self.m_device_info = None
+
+        # CAN 总线设备由接收线程中的 FrameReader 创建和拥有，GUI 线程不在接收的热路径上
+        self.m_readerThread = QThread(self)
+        self.m_reader = FrameReader()
+        self.m_reader.moveToThread(self.m_readerThread)
+        self.m_readerThread.finished.connect(self.m_reader.deleteLater)
+        self.m_readerThread.start()
 
         self.m_busStatusTimer = QTimer(self)
         # 创建一个定时器m_busStatusTimer，并通过QTimer.timeout信号与bus_status方法连接
@@ -102,10 +116,18 @@ class MainWindow(QMainWindow):
         # 创建两个QLabel对象表示状态栏的标签，分别是m_status、m_written和m_received。
         self.m_status = QLabel()
         self.m_ui.statusBar.addPermanentWidget(self.m_status)
+        self.m_metrics = QLabel() # 性能计数的实时读数，显示在m_status旁边
+        self.m_ui.statusBar.addPermanentWidget(self.m_metrics)
         self.m_written = QLabel()
         self.m_ui.statusBar.addWidget(self.m_written)
         self.m_received = QLabel()
         self.m_ui.statusBar.addWidget(self.m_received)
+        self.m_recording = QLabel() # 磁盘记录的进度
+        self.m_ui.statusBar.addWidget(self.m_recording)
+        self.m_replaying = QLabel() # 日志回放的进度和定时误差
+        self.m_ui.statusBar.addWidget(self.m_replaying)
+        self.m_triggering = QLabel() # 触发记录的状态
+        self.m_ui.statusBar.addWidget(self.m_triggering)
 
         # 启动ReceivedFramesModel模型，
         # 设置模型的队列限制为1000，
@@ -114,13 +136,74 @@ class MainWindow(QMainWindow):
         self.m_model.set_queue_limit(1000)
         self.m_ui.receivedFramesView.set_model(self.m_model)
 
+        # 固定（per-ID 覆盖）模式的模型，每个 CAN ID 只占一行，与滚动日志同时接收数据
+        self.m_fixedTraceModel = FixedTraceModel(self)
+        self.m_idFilterModel = FrameFilterProxyModel(self) # 只显示某个 ID 的帧，增量维护到 m_model 的行号映射
+        self.m_idFilterModel.setSourceModel(self.m_model)
+        # 接收帧视图上方的有效载荷搜索栏（Ctrl+F）
+        self.m_searchBar = PayloadSearchBar(self.m_ui.receivedFramesView, self.m_model, self)
+        self.m_ui.verticalLayout_2.insertWidget(0, self.m_searchBar)
+        self.m_fixedTraceAction = QAction("&Fixed Trace", self)
+        self.m_fixedTraceAction.setCheckable(True)
+        self.m_fixedTraceAction.setToolTip("Show one row per CAN ID instead of the scrolling log")
+        # 软件过滤器：编译好的过滤表达式在帧进入模型之前按批筛选，None 表示不过滤
+        self.m_frameFilter = None
+        self.m_filterEdit = QLineEdit(self)
+        self.m_filterEdit.setPlaceholderText("Filter, e.g. id 0x100..0x1ff && data[0] 0x10/0xf0")
+        self.m_filterEdit.setToolTip("Only frames matching this expression are added to the log; "
+                                     "press Enter to apply")
+        self.m_filterEdit.setClearButtonEnabled(True)
+        self.m_filterEdit.setMinimumWidth(300)
+        self.m_filteredViewAction = QAction("New Filtered &View", self)
+        self.m_filteredViewAction.setToolTip("Open another window showing only the frames matching a filter")
+        # 磁盘记录器：把接收到的每一帧写入二进制日志文件，不受模型环形缓冲区大小的限制
+        self.m_recorder = None
+        self.m_recordAction = QAction("&Record to File...", self)
+        self.m_recordAction.setCheckable(True)
+        self.m_recordAction.setToolTip("Write every received frame to a log file or an SQLite database")
+        self.m_recordingOptions = dict(default_recording)  # 自动记录、分段和 fsync 的设置，见 rotationdialog
+        self.m_recordOptionsAction = QAction("Recording &Options...", self)
+        self.m_recordOptionsAction.setToolTip("Record automatically on connect, split long recordings into segments, "
+                                              "delete old ones and choose the fsync policy")
+        # 触发记录：内存中保留最近几秒的帧，满足触发条件时把触发前后的帧写入文件
+        self.m_triggerCapture = None
+        self.m_trigger = dict(default_trigger)  # 触发记录的设置，见 triggerdialog
+        self.m_lastBusStatus = None  # 上一次的总线状态，改变时触发
+        self.m_triggerAction = QAction("&Trigger Capture...", self)
+        self.m_triggerAction.setCheckable(True)
+        self.m_triggerAction.setToolTip("Keep the last seconds of traffic in memory and save them "
+                                        "together with the following seconds when a trigger fires")
+        # 日志回放：按原来的帧间隔把日志文件中的帧发送到已连接的设备上
+        self.m_replayer = None
+        self.m_replayAction = QAction("Re&play Log...", self)
+        self.m_replayAction.setCheckable(True)
+        self.m_replayAction.setEnabled(False)
+        self.m_replayAction.setToolTip("Send the frames of a log file to the connected device with their original timing")
+        # 周期发送表：按各自的周期发送多条报文，窗口只创建一次
+        self.m_transmitWindow = None
+        self.m_transmitAction = QAction("C&yclic Transmit...", self)
+        self.m_transmitAction.setEnabled(False)
+        self.m_transmitAction.setToolTip("Send a table of frames periodically and show the measured period jitter")
+        self.m_openLogAction = QAction("&Open Log...", self)
+        self.m_openLogAction.setToolTip("Show the frames of a candump, ASC or binary log file in a new window")
+        self.m_exportLogAction = QAction("&Export Log...", self)
+        self.m_exportLogAction.setToolTip("Save the received frames as a candump, ASC or binary log file")
+        self.m_sqlConsoleAction = QAction("&SQL Console...", self)
+        self.m_sqlConsoleAction.setToolTip("Run SQL queries on a capture recorded to an SQLite database")
+        self.m_dumpMetricsAction = QAction("Dump &Metrics...", self)
+        self.m_dumpMetricsAction.setToolTip("Save the hot-path counters and latency histograms as JSON")
+        self.m_refreshBudgetAction = QAction("Refresh &Budget...", self)
+        self.m_refreshBudgetAction.setToolTip("Limit the share of GUI thread time spent refreshing the frame views")
+
         self.init_actions_connections() #调用init_actions_connections()方法来初始化操作和信号连接
         QTimer.singleShot(50, self.m_connect_dialog.show) #通过QTimer.singleShot()方法延迟50毫秒，在50毫秒后显示连接对话框
 
         self.m_busStatusTimer.timeout.connect(self.bus_status) #为定时器m_busStatusTimer的超时信号连接一个名为bus_status的方法。
-        self.m_appendTimer = QTimer(self) #创建一个定时器m_appendTimer
-        self.m_appendTimer.timeout.connect(self.onAppendFramesTimeout) #通过QTimer.timeout信号与onAppendFramesTimeout方法连接
-        self.m_appendTimer.start(350) #启动定时器
+        self.m_metricsTimer = QTimer(self) #每秒更新一次状态栏中的性能读数
+        self.m_metricsTimer.timeout.connect(self._show_metrics)
+        self.m_metricsTimer.start(1000)
+        # 创建自适应的刷新调度器，有新帧到达时按刷新代价和帧预算安排 onAppendFramesTimeout 的调用
+        self.m_refreshScheduler = RefreshScheduler(self.onAppendFramesTimeout, self)
 
     def init_actions_connections(self):
         # 初始化各种操作和信号连接
@@ -140,6 +223,14 @@ class MainWindow(QMainWindow):
         # _action_connect方法名，签名带有下划线_，表示是类的 私有方法，不应该 在类外部直接调用。需要在实现的类中定义这些方法
         # ，以确保信号连接正确地触发对应的操作和逻辑
         self.m_connect_dialog.accepted.connect(self.connect_device)
+
+        # 接收线程发来的信号（排队连接，在 GUI 线程中执行）
+        self.m_reader.device_connected.connect(self._device_connected)
+        self.m_reader.connection_failed.connect(self.m_status.setText)
+        self.m_reader.error_occurred.connect(self.process_errors)
+        self.m_reader.frames_received.connect(self.process_received_frames)
+        self.m_reader.frames_written.connect(self.process_frames_written)
+        self.m_reader.bus_status_changed.connect(self._show_bus_status)
         # 将connect_dialog的accepted信号与connect_device方法连接，当连接对话框的"确定"按钮被点击时触发
         self.m_ui.actionDisconnect.triggered.connect(self.disconnect_device)
         # 将actionDisconnect的triggered信号与disconnect_device方法连接，当actionDisconnect被触发时执行。
@@ -148,6 +239,42 @@ class MainWindow(QMainWindow):
         self.m_ui.actionQuit.triggered.connect(self.close)
         self.m_ui.actionAboutQt.triggered.connect(qApp.aboutQt)
         self.m_ui.actionClearLog.triggered.connect(self.m_model.clear)
+        self.m_ui.actionClearLog.triggered.connect(self.m_fixedTraceModel.clear)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_fixedTraceAction)
+        self.m_ui.mainToolBar.addAction(self.m_fixedTraceAction)
+        self.m_fixedTraceAction.toggled.connect(self._fixed_trace_toggled)
+        self.m_ui.receivedFramesView.id_filter_requested.connect(self._id_filter_requested)
+        self.m_ui.receivedFramesView.status_message.connect(self._show_message)
+        self.m_model.timestamps_went_backwards.connect(self._timestamps_went_backwards)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_filteredViewAction)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_recordAction)
+        self.m_ui.mainToolBar.addAction(self.m_recordAction)
+        self.m_recordAction.toggled.connect(self._record_toggled)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_recordOptionsAction)
+        self.m_recordOptionsAction.triggered.connect(self._record_options)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_triggerAction)
+        self.m_ui.mainToolBar.addAction(self.m_triggerAction)
+        self.m_triggerAction.toggled.connect(self._trigger_toggled)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_replayAction)
+        self.m_ui.mainToolBar.addAction(self.m_replayAction)
+        self.m_replayAction.toggled.connect(self._replay_toggled)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionClearLog, self.m_transmitAction)
+        self.m_transmitAction.triggered.connect(self._show_transmit_table)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionQuit, self.m_openLogAction)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionQuit, self.m_exportLogAction)
+        self.m_ui.menuCalls.insertAction(self.m_ui.actionQuit, self.m_sqlConsoleAction)
+        self.m_ui.menuCalls.insertSeparator(self.m_ui.actionQuit)
+        self.m_openLogAction.triggered.connect(self._open_log)
+        self.m_exportLogAction.triggered.connect(self._export_log)
+        self.m_sqlConsoleAction.triggered.connect(self._open_sql_console)
+        self.m_filteredViewAction.triggered.connect(self._new_filtered_view)
+        self.m_ui.mainToolBar.addSeparator()
+        self.m_ui.mainToolBar.addWidget(self.m_filterEdit)
+        self.m_filterEdit.editingFinished.connect(self._filter_changed)
+        self.m_ui.menuHelp.insertAction(self.m_ui.actionAboutQt, self.m_dumpMetricsAction)
+        self.m_dumpMetricsAction.triggered.connect(self._dump_metrics)
+        self.m_ui.menuHelp.insertAction(self.m_ui.actionAboutQt, self.m_refreshBudgetAction)
+        self.m_refreshBudgetAction.triggered.connect(self._refresh_budget)
         self.m_ui.actionPluginDocumentation.triggered.connect(show_help)
         self.m_ui.actionDeviceInformation.triggered.connect(self._action_device_information)
 
@@ -156,11 +283,10 @@ class MainWindow(QMainWindow):
     # 当该操作被触发时执行
     @Slot()
     def _action_connect(self):
-        #首先检查m_can_device对象是否存在。如果存在，则调用deleteLater()方法来删除该对象，并将m_can_device设置为None。
+        #首先检查设备是否已连接。如果已连接，则让接收线程断开并删除该设备。
         # 接下来，显示连接对话框m_connect_dialog。
-        if self.m_can_device:
-            self.m_can_device.deleteLater()
-            self.m_can_device = None
+        if self.m_device_connected:
+            self.disconnect_device()
         self.m_connect_dialog.show()
 
     # 一个名为_reset_controller的槽函数，该槽函数没有参数。
@@ -168,24 +294,338 @@ class MainWindow(QMainWindow):
     # 当该操作被触发时执行。
     @Slot()
     def _reset_controller(self):
-        self.m_can_device.resetController()
+        self.m_reader.reset_controller()
+
+    # 在滚动日志和固定（per-ID 覆盖）模式之间切换视图的模型
+    @Slot(bool)
+    def _fixed_trace_toggled(self, checked):
+        model = self.m_fixedTraceModel if checked else self.m_model
+        model.update()
+        if not checked and self.m_idFilterModel.key() is not None:
+            model = self.m_idFilterModel
+        self.m_ui.receivedFramesView.set_model(model)
+
+    @Slot(str)
+    def _show_message(self, message):
+        self.m_ui.statusBar.showMessage(message, 10000)
+
+    # 时间戳回退通常是控制器复位或重新连接造成的，提示用户按时间定位会分段查找
+    @Slot(int)
+    def _timestamps_went_backwards(self, row):
+        self._show_message(f"Timestamps went backwards at row {row} (controller reset?); "
+                           f"time seeks search each monotonic section separately")
+
+    # 打开一个新的过滤视图窗口，与主窗口共用同一个模型，可以同时打开多个
+    @Slot()
+    def _new_filtered_view(self):
+        window = FilteredViewWindow(self.m_model, self)
+        window.show()
+
+    # 只显示某个 ID 的帧（key 为 None 时显示所有帧），保持当前选中的帧可见
+    @Slot(object)
+    def _id_filter_requested(self, key):
+        view = self.m_ui.receivedFramesView
+        current = view.currentIndex()
+        if current.isValid() and view.model() is self.m_idFilterModel:
+            current = self.m_idFilterModel.mapToSource(current)
+        self.m_idFilterModel.set_id_filter(key)
+        model = self.m_model if key is None else self.m_idFilterModel
+        view.set_model(model)
+        if current.isValid():
+            if key is not None:
+                current = self.m_idFilterModel.mapFromSource(current)
+            view.setCurrentIndex(current)
+            view.scrollTo(current)
+
+    # 编译过滤框中的表达式，之后接收到的帧按新的表达式过滤；已经显示的帧不受影响
+    @Slot()
+    def _filter_changed(self):
+        text = self.m_filterEdit.text()
+        try:
+            self.m_frameFilter = compile_filter(text)
+        except FilterSyntaxError as e:
+            self.m_filterEdit.setStyleSheet("QLineEdit { color: red; }")
+            self.m_status.setText(f"Filter error: {e}")
+            return
+        self.m_filterEdit.setStyleSheet("")
+        if self.m_frameFilter is not None:
+            self.m_status.setText(f"Filter: {text}")
+
+    # 开始或停止记录到文件。记录器由接收线程直接喂给，GUI 线程只负责开始、停止和显示进度
+    @Slot(bool)
+    def _record_toggled(self, checked):
+        if not checked:
+            self._stop_recording()
+            return
+        if self.m_recorder is not None: # 自动记录开始时勾选
+            return
+        file_name, _ = QFileDialog.getSaveFileName(self, "Record to File", "capture.canlog",
+                                                   f"{LOG_FILE_FILTERS};;{CAPTURE_DB_FILTER}")
+        if not file_name or not self._start_recording(file_name):
+            self.m_recordAction.setChecked(False)
+
+    def _start_recording(self, file_name):
+        options = self.m_recordingOptions
+        if is_capture_db(file_name):
+            recorder = SqliteRecorder(file_name, **writer_options(options))
+        elif rotation_enabled(options):
+            recorder = RotatingRecorder(file_name, **rotation_options(options), **writer_options(options))
+        else:
+            recorder = LogRecorder(file_name, encoder_for_file(file_name), **writer_options(options))
+        try:
+            recorder.start()
+        except OSError as e:
+            self.m_status.setText(f"Cannot record: {e}")
+            return False
+        self.m_recorder = recorder
+        self.m_reader.set_recorder(recorder)
+        self._show_recording()
+        return True
+
+    # 连接设备时自动开始记录（没有正在进行的记录时），环形缓冲区挤掉的帧仍然在磁盘上
+    def _auto_record(self):
+        options = self.m_recordingOptions
+        if not options["auto_record"] or self.m_recorder is not None:
+            return
+        directory = options["directory"]
+        file_name = os.path.join(directory, f"capture-{datetime.now():%Y%m%d-%H%M%S}.canlog")
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            self.m_status.setText(f"Cannot record: {e}")
+            return
+        if self._start_recording(file_name):
+            self.m_recordAction.setChecked(True)
+            self.m_status.setText(f"{self.m_status.text()}, recording to {file_name}")
+
+    # 记录的设置，在下一次开始记录时生效
+    @Slot()
+    def _record_options(self):
+        dialog = RotationDialog(self.m_recordingOptions, self)
+        if dialog.exec():
+            self.m_recordingOptions = dialog.settings()
+
+    def _stop_recording(self):
+        if self.m_recorder is None:
+            return
+        self.m_reader.set_recorder(None)
+        self.m_recorder.stop()
+        self._show_recording()
+        self.m_recorder = None
+        self.m_recordAction.setChecked(False)
+
+    # 开始或停止触发记录：先设置触发条件和窗口，再选择文件的基本名，每次触发写一个文件
+    @Slot(bool)
+    def _trigger_toggled(self, checked):
+        if not checked:
+            self._stop_trigger_capture()
+            return
+        dialog = TriggerDialog(self.m_trigger, self)
+        file_name = ""
+        if dialog.exec():
+            self.m_trigger = dialog.settings()
+            file_name, _ = QFileDialog.getSaveFileName(self, "Trigger Capture", "trigger.canlog", LOG_FILE_FILTERS)
+        if not file_name:
+            self.m_triggerAction.setChecked(False)
+            return
+        settings = self.m_trigger
+        capture = TriggerCapture(file_name, dialog.frame_filter(), settings["pre_trigger"],
+                                 settings["post_trigger"], settings["max_events"])
+        try:
+            capture.start()
+        except OSError as e:
+            self.m_status.setText(f"Cannot start trigger capture: {e}")
+            self.m_triggerAction.setChecked(False)
+            return
+        self.m_triggerCapture = capture
+        self.m_reader.set_trigger_capture(capture)
+        self._show_trigger_capture()
+
+    def _stop_trigger_capture(self):
+        if self.m_triggerCapture is None:
+            return
+        self.m_reader.set_trigger_capture(None)
+        self.m_triggerCapture.stop()
+        self._show_trigger_capture()
+        self.m_triggerCapture = None
+        self.m_triggerAction.setChecked(False)
+
+    def _show_trigger_capture(self):
+        if self.m_triggerCapture is None:
+            return
+        stats = self.m_triggerCapture.statistics()
+        text = f"trigger: {stats['ring_seconds']:.1f} s buffered, {stats['events']} events"
+        if stats["capturing"]:
+            text += f", capturing {stats['capturing']}"
+        if stats["reason"]:
+            text += f", last: {stats['reason']}"
+        if stats["dropped"]:
+            text += f", {stats['dropped']} dropped"
+        if stats["error"]:
+            text += f", stopped: {stats['error']}"
+        self.m_triggering.setText(text)
+
+    # 显示周期发送表，发送由接收线程写到设备上
+    @Slot()
+    def _show_transmit_table(self):
+        if self.m_transmitWindow is None:
+            self.m_transmitWindow = TransmitTableWindow(self.m_reader, self)
+            self.m_transmitWindow.set_device_connected(self.m_device_connected)
+        self.m_transmitWindow.show()
+        self.m_transmitWindow.raise_()
+        self.m_transmitWindow.activateWindow()
+
+    # 开始或停止回放日志。回放在自己的线程中调度，由接收线程写到设备上
+    @Slot(bool)
+    def _replay_toggled(self, checked):
+        if not checked:
+            self._stop_replay()
+            return
+        file_name, _ = QFileDialog.getOpenFileName(self, "Replay Log", "",
+                                                   f"{LOG_FILE_FILTERS};;All files (*)")
+        speed, ok = (QInputDialog.getDouble(self, "Replay Log", "Speed (1 = real time, 0 = as fast as possible):",
+                                            1.0, 0.0, 1000.0, 2) if file_name else (0.0, False))
+        if not ok or not self.m_device_connected:
+            self.m_replayAction.setChecked(False)
+            return
+        self.m_replayer = LogReplayer(file_name, self.m_reader, speed)
+        self.m_replayer.start()
+        self._show_replay()
+
+    def _stop_replay(self):
+        replayer = self.m_replayer
+        if replayer is None:
+            return
+        self.m_replayer = None
+        stats = replayer.stop()
+        self.m_replaying.setText(self._replay_text(stats))
+        self.m_replayAction.setChecked(False)
+
+    # 显示回放的进度，回放结束后停止
+    def _show_replay(self):
+        if self.m_replayer is None:
+            return
+        stats = self.m_replayer.statistics()
+        if not stats["running"]:
+            self._stop_replay()
+            return
+        self.m_replaying.setText(self._replay_text(stats))
+
+    # 回放的进度：实际用时与要求的用时，以及定时误差
+    def _replay_text(self, stats):
+        speed = f"{stats['speed']:g}x" if stats["speed"] > 0 else "max speed"
+        text = f"replayed {stats['sent']} frames at {speed}"
+        if stats["speed"] > 0:
+            error = stats["timing_error"]
+            text += (f", {stats['elapsed_s']:.3f} s of {stats['requested_s']:.3f} s, "
+                     f"timing error mean {error['mean_ms']:.3f} ms, p99 {error['p99_ms']:.3f} ms, "
+                     f"max {error['max_ms']:.3f} ms, {stats['late']} late")
+        else:
+            text += f", {stats['rate_fps']} frames/s"
+        if stats["skipped"]:
+            text += f", {stats['skipped']} error frames skipped"
+        if stats["error"]:
+            text += f", stopped: {stats['error']}"
+        return text
+
+    # 在新窗口中打开日志文件，文件在窗口中分块读入
+    @Slot()
+    def _open_log(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Log", "",
+                                                   f"{LOG_FILE_FILTERS};;Compressed log segments (*.gz);;"
+                                                   "All files (*)")
+        if file_name:
+            LogWindow(file_name, self).show()
+
+    # 打开 SQLite 捕获库的 SQL 控制台；正在记录到数据库时默认选中这个数据库，可以边记录边查询
+    @Slot()
+    def _open_sql_console(self):
+        current = ""
+        if self.m_recorder is not None and is_capture_db(self.m_recorder.file_name()):
+            current = self.m_recorder.file_name()
+        file_name, _ = QFileDialog.getOpenFileName(self, "SQL Console", current, CAPTURE_DB_FILTER)
+        if file_name:
+            SqlConsoleWindow(file_name, self).show()
+
+    # 把模型中当前缓存的所有帧导出为日志文件，按 EXPORT_CHUNK 帧一批编码和写入
+    @Slot()
+    def _export_log(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Log", "capture.asc", LOG_FILE_FILTERS)
+        if not file_name:
+            return
+        frames = self.m_model.m_frames
+        rows = len(frames)
+        batches = (frames.batch(start, min(start + EXPORT_CHUNK, rows))
+                   for start in range(0, rows, EXPORT_CHUNK))
+        try:
+            with metrics.timed("export_log"):
+                count = export_log(file_name, batches)
+        except OSError as e:
+            self.m_status.setText(f"Cannot export log: {e}")
+            return
+        self.m_status.setText(f"Exported {count} frames to {file_name}")
+
+    def _show_recording(self):
+        if self.m_recorder is None:
+            return
+        stats = self.m_recorder.statistics()
+        text = f"recorded {stats['written']} frames ({stats['bytes'] / 1048576:.1f} MB)"
+        if "segments" in stats:
+            text += f" in {stats['segments']} files"
+            if stats["compressing"]:
+                text += f", compressing {stats['compressing']}"
+            if stats["compress_error"]:
+                text += f", {stats['compress_error']}"
+        if stats["dropped"]:
+            text += f", {stats['dropped']} dropped"
+        if stats["error"]:
+            text += f", stopped: {stats['error']}"
+        self.m_recording.setText(text)
+
+    # 在状态栏中显示各阶段的耗时和显示延迟
+    @Slot()
+    def _show_metrics(self):
+        self.m_metrics.setText(metrics.summary())
+        self._show_recording()
+        self._show_trigger_capture()
+        self._show_replay()
+
+    # 把性能计数以 JSON 格式保存到用户选择的文件中
+    @Slot()
+    def _dump_metrics(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Dump Metrics", "metrics.json",
+                                                   "JSON files (*.json)")
+        if not file_name:
+            return
+        try:
+            with open(file_name, "w", encoding="utf-8") as f:
+                f.write(metrics.to_json())
+        except OSError as e:
+            self.m_status.setText(f"Cannot write metrics: {e}")
+
+    # 设置视图刷新最多占用 GUI 线程时间的百分比（见 refreshscheduler）
+    @Slot()
+    def _refresh_budget(self):
+        budget, ok = QInputDialog.getInt(self, "Refresh Budget", "GUI thread time for refreshing the views (%):",
+                                         round(self.m_refreshScheduler.frame_budget() * 100), 1, 100)
+        if ok:
+            self.m_refreshScheduler.set_frame_budget(budget / 100)
 
     # 一个名为_action_device_information的槽函数，该槽函数没有参数。
     # 该槽函数用于处理  设备信息  操作，
     # 当该操作被触发时执行
     @Slot()
     def _action_device_information(self):
-        info = self.m_can_device.deviceInfo() #获取设备的信息，并将结果赋值给变量info
+        info = self.m_device_info #设备的信息，在连接成功时由接收线程提供
         dialog = CanBusDeviceInfoDialog(info, self) #创建一个CanBusDeviceInfoDialog对象dialog，并将 设备信息info 和  当前窗口  作为参数传递给构造函数
         dialog.exec()
 
     # 一个名为process_errors的槽函数，
-    # 接受一个QCanBusDevice.CanBusError类型的参数error。
+    # 接受一个str类型的参数error_string（接收线程中设备的错误描述）。
     # 该槽函数用于处理   CAN总线设备的错误
-    @Slot(QCanBusDevice.CanBusError)
-    def process_errors(self, error):
-        if error != QCanBusDevice.NoError: #判断error是否为QCanBusDevice.NoError
-            self.m_status.setText(self.m_can_device.errorString()) #如果不是，则将m_can_device的错误描述字符串设置为状态栏的文本m_status。
+    @Slot(str)
+    def process_errors(self, error_string):
+        self.m_status.setText(error_string) #将设备的错误描述字符串设置为状态栏的文本m_status。
 
     # 一个名为connect_device的槽函数，
     # 该槽函数没有参数。
@@ -199,73 +639,61 @@ class MainWindow(QMainWindow):
         # else:
         #     self.m_model.set_queue_limit(0)  #否则将队列限制设置为0
 
-        device, error_string = QCanBus.instance().createDevice(p.plugin_name, p.device_interface_name)
-        # 使用QCanBus.instance().createDevice()方法创建一个CAN总线设备，
-        # 并将设备对象赋值给device，
-        # 错误信息赋值给error_string。
-
-        # 检查device是否为空，如果为空，则将错误信息设置为状态栏的文本，然后返回
-        if not device:
-            self.m_status.setText(f"Error creating device '{p.plugin_name}', reason: '{error_string}'")
-            return
-
         self.m_number_frames_written = 0  #重置已写入帧数m_number_frames_written为0
-        self.m_can_device = device #将device赋值给m_can_device。
-
-        # 将m_can_device的errorOccurred信号连接到process_errors槽函数，
-        # 将framesReceived信号连接到process_received_frames槽函数，
-        # 将framesWritten信号连接到process_frames_written槽函数
-        self.m_can_device.errorOccurred.connect(self.process_errors)
-        self.m_can_device.framesReceived.connect(self.process_received_frames)
-        self.m_can_device.framesWritten.connect(self.process_frames_written)
-
-        
-        # 如果设置信息中启用了配置参数，则将每个配置参数设置到m_can_device中
-        if p.use_configuration_enabled:
-            for k, v in p.configurations:
-                self.m_can_device.setConfigurationParameter(k, v)
-
-        # 调用m_can_device的connectDevice方法来连接设备。
-        # 如果连接失败，则将错误信息设置为状态栏的文本，
-        # 并将m_can_device设置为None
-        if not self.m_can_device.connectDevice():    
-            e = self.m_can_device.errorString()
-            self.m_status.setText(f"Connection error: {e}")
-            self.m_can_device = None
-        else:
-            self.m_ui.actionConnect.setEnabled(False)
-            self.m_ui.actionDisconnect.setEnabled(True)
-            self.m_ui.actionDeviceInformation.setEnabled(True)
-            self.m_ui.sendFrameBox.setEnabled(True)
-            # 如果连接成功，则禁用connect界面部件，启用Disconnect连接、设备信息DevInfo、发送帧sendFrameBox的界面部件。
-            config_bit_rate = self.m_can_device.configurationParameter(QCanBusDevice.BitRateKey) # 获取配置参数中的比特率信息
-            if config_bit_rate > 0:
-                is_can_fd = bool(self.m_can_device.configurationParameter(QCanBusDevice.CanFdKey)) #是否是CAN_FD
-                config_data_bit_rate = self.m_can_device.configurationParameter(QCanBusDevice.DataBitRateKey)
-                bit_rate = config_bit_rate / 1000 # 因为后面的单位是kbps 所以这个地方/1000
-                if is_can_fd and config_data_bit_rate > 0: # 如果是CANFD 且 有config_data_bit_rate
-                    data_bit_rate = config_data_bit_rate / 1000 # bps ->kbps
-                    m = f"Plugin: {p.plugin_name}, connected to {p.device_interface_name} at {bit_rate} / {data_bit_rate} kBit/s"
-                    self.m_status.setText(m) # 设置状态栏文本
-                else:
-                    m = f"Plugin: {p.plugin_name}, connected to {p.device_interface_name} at {bit_rate} kBit/s"
-                    self.m_status.setText(m) # 设置状态栏文本
-            else:
-                self.m_status.setText(f"Plugin: {p.plugin_name}, connected to {p.device_interface_name}")
 
-            if self.m_can_device.hasBusStatus(): # 如果m_can_device具有总线状态
-                self.m_busStatusTimer.start(2000) # 启动m_busStatusTimer定时器以每2秒 更新总线状态
+        # 由接收线程创建并连接设备，结果通过 device_connected 或 connection_failed 信号返回。
+        # 如果设置信息中启用了配置参数，则将每个配置参数设置到设备中
+        configurations = p.configurations if p.use_configuration_enabled else []
+        self.m_reader.connect_device(p.plugin_name, p.device_interface_name, configurations)
+
+    # 接收线程中的设备连接成功后被调用，info 中包含设备的配置和信息
+    @Slot(dict)
+    def _device_connected(self, info):
+        p = self.m_connect_dialog.settings()
+        self.m_device_connected = True
+        self.m_device_info = info["device_info"]
+        self.m_ui.actionConnect.setEnabled(False)
+        self.m_ui.actionDisconnect.setEnabled(True)
+        self.m_ui.actionDeviceInformation.setEnabled(True)
+        self.m_ui.sendFrameBox.setEnabled(True)
+        self.m_replayAction.setEnabled(True)
+        self.m_transmitAction.setEnabled(True)
+        if self.m_transmitWindow is not None:
+            self.m_transmitWindow.set_device_connected(True)
+        # 如果连接成功，则禁用connect界面部件，启用Disconnect连接、设备信息DevInfo、发送帧sendFrameBox的界面部件。
+        config_bit_rate = info["bit_rate"] # 获取配置参数中的比特率信息
+        if config_bit_rate > 0:
+            is_can_fd = info["is_can_fd"] #是否是CAN_FD
+            config_data_bit_rate = info["data_bit_rate"]
+            bit_rate = config_bit_rate / 1000 # 因为后面的单位是kbps 所以这个地方/1000
+            if is_can_fd and config_data_bit_rate > 0: # 如果是CANFD 且 有config_data_bit_rate
+                data_bit_rate = config_data_bit_rate / 1000 # bps ->kbps
+                m = f"Plugin: {p.plugin_name}, connected to {p.device_interface_name} at {bit_rate} / {data_bit_rate} kBit/s"
+                self.m_status.setText(m) # 设置状态栏文本
             else:
-                self.m_ui.busStatus.setText("No CAN bus status available.")
+                m = f"Plugin: {p.plugin_name}, connected to {p.device_interface_name} at {bit_rate} kBit/s"
+                self.m_status.setText(m) # 设置状态栏文本
+        else:
+            self.m_status.setText(f"Plugin: {p.plugin_name}, connected to {p.device_interface_name}")
+        if info["raw_filters"]: # 显示接收过滤器是由驱动还是由接收线程执行的
+            self.m_status.setText(f"{self.m_status.text()}, {info['raw_filters']} filters")
+        self._auto_record()
 
-    # 用于更新CAN总线状态
+        if info["has_bus_status"]: # 如果设备具有总线状态
+            self.m_busStatusTimer.start(2000) # 启动m_busStatusTimer定时器以每2秒 更新总线状态
+        else:
+            self.m_ui.busStatus.setText("No CAN bus status available.")
+
+    # 用于更新CAN总线状态：向接收线程请求总线状态，结果由 _show_bus_status 显示
     def bus_status(self):
-        if not self.m_can_device or not self.m_can_device.hasBusStatus(): # 以 or 就是 或 为分界 去读这个代码
+        if not self.m_device_connected:
             self.m_ui.busStatus.setText("No CAN bus status available.")
             self.m_busStatusTimer.stop() # 停止计时器
             return
+        self.m_reader.request_bus_status()
 
-        state = self.m_can_device.busStatus()
+    @Slot(object)
+    def _show_bus_status(self, state):
         if state == QCanBusDevice.CanBusStatus.Good:
             self.m_ui.busStatus.setText("CAN bus status: Good.")
         elif state == QCanBusDevice.CanBusStatus.Warning:
@@ -276,6 +704,11 @@ class MainWindow(QMainWindow):
             self.m_ui.busStatus.setText("CAN bus status: Bus Off.")
         else:
             self.m_ui.busStatus.setText("CAN bus status: Unknown.")
+        # 总线状态改变时触发记录；连接后的第一次状态不触发
+        if self.m_triggerCapture is not None and self.m_trigger["bus_status"] \
+                and self.m_lastBusStatus is not None and state != self.m_lastBusStatus:
+            self.m_triggerCapture.trigger(f"bus status {state.name}")
+        self.m_lastBusStatus = state
 
     # 一个名为disconnect_device的槽函数，
     # 该槽函数没有参数。
@@ -283,10 +716,17 @@ class MainWindow(QMainWindow):
     # 当该操作被触发时执行。
     @Slot()
     def disconnect_device(self):
-        if not self.m_can_device: # 检查m_can_device是否为空
+        if not self.m_device_connected: # 检查设备是否已连接
             return
+        self.m_device_connected = False
         self.m_busStatusTimer.stop() # 停止m_busStatusTimer定时器
-        self.m_can_device.disconnectDevice() # 使用disconnectDevice方法断开m_can_device的连接
+        self.m_lastBusStatus = None
+        self._stop_replay() # 先停止回放，再断开设备
+        self.m_replayAction.setEnabled(False)
+        if self.m_transmitWindow is not None: # 周期发送也先停止
+            self.m_transmitWindow.set_device_connected(False)
+        self.m_transmitAction.setEnabled(False)
+        self.m_reader.disconnect_device() # 由接收线程断开设备的连接
         self.m_ui.actionConnect.setEnabled(True) # 启用
         self.m_ui.actionDisconnect.setEnabled(False) # 禁用
         self.m_ui.actionDeviceInformation.setEnabled(False) # 禁用
@@ -302,63 +742,80 @@ class MainWindow(QMainWindow):
         self.m_number_frames_written += count
         self.m_written.setText(f"{self.m_number_frames_written} frames written")
 
+    # 窗口最小化或还原时暂停或恢复视图的刷新，接收不受影响
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange:
+            self._update_refresh_suspension()
+        super().changeEvent(event)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._update_refresh_suspension()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._update_refresh_suspension()
+
+    def _update_refresh_suspension(self):
+        if self.isHidden() or self.isMinimized():
+            self.m_refreshScheduler.suspend()
+        else:
+            self.m_refreshScheduler.resume()
+
     # 一个名为closeEvent的函数，
     # 它重写了Qt中的closeEvent事件。
     # 该函数在窗口关闭时被调用
     def closeEvent(self, event):
         self.m_connect_dialog.close() # 关闭连接对话框m_connect_dialog
+        self.disconnect_device()
+        self.m_readerThread.quit() # 停止接收线程，并等待它处理完断开连接的请求
+        self.m_readerThread.wait()
+        self._stop_recording() # 接收线程交出最后一批帧之后再关闭日志文件
+        self._stop_trigger_capture()
         event.accept() # 调用event.accept()来接受关闭事件
 
    # 处理收到的帧，这个比较重要 可用 序号、时间戳、flag、CAN-ID、DLC、Data
-    @Slot()
-    def process_received_frames(self):
-        if not self.m_can_device:
-            return
-        while self.m_can_device.framesAvailable():
-            self.m_number_frames_received = self.m_number_frames_received + 1
-            frame = self.m_can_device.readFrame()
-            data = ""
-            if frame.frameType() == QCanBusFrame.ErrorFrame: # 如果帧类型为错误帧，则使用m_can_device的interpretErrorFrame方法解释错误帧
-                data = self.m_can_device.interpretErrorFrame(frame)
-            else:
-                data = frame.payload().toHex(' ').toUpper() # 将frame.payload()返回的字节序列转换为十六进制字符串，并使用空格分隔每两个字符。然后，将得到的字符串转换为大写形式
-
-            # 获取帧的时间戳，并将秒数和微秒数格式化成字符串，并赋值给time变量。获取帧的标志位，并赋值给flags变量
-            secs = frame.timeStamp().seconds()
-            microsecs = frame.timeStamp().microSeconds() / 100  #  获取微秒数，并将其除以100得到小数位
-            time = f"{secs:>10}.{microsecs:0>4}"  # 格式化为字符串，秒数占据10个字符的宽度，微秒数占据4个字符的宽度
-            flags = frame_flags(frame) #  获取frame的标志
-
-            id = f"{frame.frameId():x}" # 在 f-string 中，我们可以使用冒号:来指定格式化选项,x 表示16进制
-            dlc = f"{frame.payload().size()}"
-            frame = [f"{self.m_number_frames_received}", time, flags, id, dlc, data] 
-            self.m_model.append_frame(frame)
-            # 获取帧ID的十六进制表示并赋值给id变量。
-            # 获取帧的数据长度，并赋值给dlc变量。
-            # 将帧号、时间、标志位、ID、数据长度、数据组成一个 list列表frame
-            # 并将该列表添加到m_model模型中
-
-
+   # 帧由接收线程用 readAllFrames() 整批读取并转换为列式的 FrameBatch，这里只调用一次 append_frames 把整批帧交给模型
+    @Slot(object)
+    def process_received_frames(self, batch):
+        with metrics.timed("process_received_frames"):
+            self.m_number_frames_received = int(batch.number[-1]) # 接收线程给每一帧编的序号，就是已接收的帧数
+            self.m_reader.batch_consumed(len(batch))
+            metrics.count("frames.received", len(batch))
+            if self.m_frameFilter is not None: # 整批求出布尔掩码，只把匹配的帧交给模型
+                with metrics.timed("filter"):
+                    batch = self.m_frameFilter.apply(batch)
+                if not len(batch):
+                    return
+            self.m_model.append_frames(batch)
+            self.m_fixedTraceModel.append_frames(batch)
+            self.m_refreshScheduler.frames_arrived(len(batch))
 
     # 定义了一个名为send_frame的槽函数，
     # 接受一个QCanBusFrame类型的参数frame。
     # 该槽函数用于   向CAN总线设备发送CAN帧   
     @Slot(QCanBusFrame)
     def send_frame(self, frame):
-        # 通过检查m_can_device对象是否有效来确保已经创建了CAN总线设备。
-        # 如果m_can_device存在，则调用其writeFrame方法，将frame发送到CAN总线上。
-        if self.m_can_device:
-            self.m_can_device.writeFrame(frame)
+        # 通过检查设备是否已连接来确保已经创建了CAN总线设备。
+        # 如果已连接，则由接收线程调用设备的writeFrame方法，将frame发送到CAN总线上。
+        if self.m_device_connected:
+            self.m_reader.write_frame(frame)
 
     # 一个名为onAppendFramesTimeout的槽函数，
     # 该槽函数没有参数。
-    # 该槽函数用于处理   扩展帧超时  操作，当超时发生时执行。
+    # 该槽函数用于处理   扩展帧超时  操作，由刷新调度器m_refreshScheduler按需调用。
     @Slot()
     def onAppendFramesTimeout(self):
-        if not self.m_can_device: #首先检查m_can_device对象是否存在，如果不存在，则直接返回
-            return
+        with metrics.timed("onAppendFramesTimeout"):
+            self._append_frames()
+
+    def _append_frames(self):
+        self.m_fixedTraceModel.update() # 固定模式的行数有限，原地更新的代价很小
         if self.m_model.need_update(): #检查模型m_model是否需要更新，如果需要更新，则调用update方法进行模型的更新
             self.m_model.update()
-            if self.m_connect_dialog.settings().use_autoscroll: #检查  连接对话框  的设置是否启用了   自动滚动功能
+            fixed_trace = self.m_fixedTraceAction.isChecked()
+            if self.m_connect_dialog.settings().use_autoscroll and not fixed_trace: #检查  连接对话框  的设置是否启用了   自动滚动功能
                 self.m_ui.receivedFramesView.scrollToBottom() #如果启用，则调用scrollToBottom方法将接收到的帧滚动到底部
-            self.m_received.setText(f"{self.m_number_frames_received} frames received") # 示接收到的帧数self.m_number_frames_received
+            stats = self.m_reader.statistics()
+            self.m_received.setText(f"{self.m_number_frames_received} frames received, "
+                                    f"queue {stats['queue_depth']}, dropped {stats['dropped']}") # 示接收到的帧数、队列深度和丢弃的帧数
@@ -0,0 +1,257 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import mmap
+import os
+import zipfile
+
+import numpy as np
+
+from framestore import id_key, id_keys
+from recorder import HEADER_SIZE, RECORD_DTYPE, LogFormatError, read_header, records_to_batch
+
+# 二进制日志（见 recorder）的内存映射浏览：不把文件读入内存，视图需要哪些行才从映射中取出哪些行。
+#
+# 记录是定长的，第 i 行就在 HEADER_SIZE + i * RECORD_DTYPE.itemsize，按行号取数据不需要任何索引。
+# 按时间定位和查找同 ID 的帧则需要一个稀疏索引，保存在日志旁边的 "<日志文件名>.idx" 文件中：
+#   timestamps  每 TIME_STRIDE 行一个时间戳，先在其中二分查找，再只读入一段 TIME_STRIDE 行
+#   breaks      时间戳比前一行小的行号（见 frameindex.TimestampIndex），把所有行分为若干单调区间
+#   id_bitmaps  每 ID_BLOCK 行一个 ID_BITS 位的位图，记录这一块中出现过的报文键的哈希，
+#               查找同 ID 的帧时跳过位图中没有这个键的块
+# 5000 万帧的日志，索引只有约 0.7 MB。索引由 index_more() 分块建立，建立时用普通的文件读取而不是映射，
+# 不会把整个文件留在进程的内存中；日志在上次建立索引之后变长时（例如还在记录），只为新的部分建立索引。
+#
+# 浏览时从映射读过的页面计入进程的 RSS（内核一次可能映射远多于读取的字节）。每次读取都先拷贝出来，
+# 再告诉内核收回这一段周围 RELEASE_ALIGN 字节对齐的映射，从头滚动到尾，RSS 也基本不变
+# （页面仍在操作系统的缓存中，再次访问时不需要读盘）。
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+TIME_STRIDE = 1024  # 稀疏时间索引的间隔（行）
+ID_BLOCK = 65536  # ID 位图的块大小（行），也是建立索引时每次读入的行数
+ID_BITS = 4096  # 每块位图的位数
+RELEASE_ALIGN = 2 << 20  # 收回映射的页面时的对齐字节数
+
+
+# 报文键的哈希，范围 [0, ID_BITS)；标准帧的 11 位 ID 各不相同
+def _id_bits(keys):
+    return (keys ^ (keys >> 12) ^ (keys >> 24)) & (ID_BITS - 1)
+
+
+class MappedLog():
+    """以只读内存映射打开的二进制日志，提供 logfilemodel.LogFileModel 需要的数据源接口和按时间、按 ID 的查找。"""
+
+    def __init__(self, file_name):
+        self.m_fileName = file_name
+        self.m_file = open(file_name, "rb")
+        try:
+            self.m_header = read_header(self.m_file)
+        except LogFormatError:
+            self.m_file.close()
+            raise
+        self.m_rows = (os.fstat(self.m_file.fileno()).st_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        self.m_map = None
+        if self.m_rows:
+            self.m_map = mmap.mmap(self.m_file.fileno(), HEADER_SIZE + self.m_rows * RECORD_DTYPE.itemsize,
+                                   access=mmap.ACCESS_READ)
+
+        # 稀疏索引，覆盖前 m_indexed 行
+        self.m_indexed = 0
+        self.m_timestamps = np.empty(0, np.int64)
+        self.m_breaks = np.empty(0, np.int64)
+        self.m_idBitmaps = np.empty((0, ID_BITS // 8), np.uint8)
+        self.m_lastTimestamp = None
+        self.m_indexChanged = False
+        self._load_index()
+
+    def file_name(self):
+        return self.m_fileName
+
+    def start_time(self):
+        return self.m_header["start_time"]
+
+    def close(self):
+        if self.m_indexChanged:
+            self.save_index()
+        if self.m_map is not None:
+            self.m_map.close()
+        self.m_file.close()
+
+    # 以下为 LogFileModel 的数据源接口；所有行在打开时就已知
+
+    def row_count(self):
+        return self.m_rows
+
+    def can_fetch_more(self):
+        return False
+
+    def fetch_more(self, rows=0):
+        return 0
+
+    # 返回行 [start, stop) 的记录（拷贝），然后收回这一段的映射
+    def _records(self, start, stop):
+        offset = HEADER_SIZE + start * RECORD_DTYPE.itemsize
+        records = np.frombuffer(self.m_map, RECORD_DTYPE, stop - start, offset).copy()
+        if hasattr(mmap, "MADV_DONTNEED"):
+            # 映射是只读的，收回的页面以后访问时从操作系统的缓存（或磁盘）重新读入
+            first = offset // RELEASE_ALIGN * RELEASE_ALIGN
+            last = min(-(-(offset + records.nbytes) // RELEASE_ALIGN) * RELEASE_ALIGN, len(self.m_map))
+            self.m_map.madvise(mmap.MADV_DONTNEED, first, last - first)
+        return records
+
+    def batch(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, self.m_rows)
+        return records_to_batch(self._records(start, max(start, stop)), start + 1)
+
+    def timestamp(self, row):
+        return int(self._records(row, row + 1)["timestamp"][0])
+
+    def row_key(self, row):
+        if row < 0 or row >= self.m_rows:
+            return None
+        record = self._records(row, row + 1)[0]
+        return id_key(record["can_id"], record["flags"])
+
+    # 以下为稀疏索引
+
+    def index_file_name(self):
+        return self.m_fileName + INDEX_SUFFIX
+
+    def indexed_rows(self):
+        return self.m_indexed
+
+    def index_complete(self):
+        return self.m_indexed >= self.m_rows
+
+    # 读入上次保存的索引；与日志不匹配时丢弃。日志变长时最后一个 ID 块可能不完整，从它的开头重新建立
+    def _load_index(self):
+        try:
+            with np.load(self.index_file_name()) as data:
+                stored = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return  # 索引文件损坏（例如保存时断电）时重新建立
+        try:
+            valid = (int(stored["version"]) == INDEX_VERSION
+                     and int(stored["start_time"]) == self.m_header["start_time"]
+                     and int(stored["rows"]) <= self.m_rows)
+        except KeyError:
+            valid = False
+        if not valid:
+            return
+        rows = int(stored["rows"])
+        indexed = rows if rows == self.m_rows else rows // ID_BLOCK * ID_BLOCK
+        if not indexed:
+            return
+        self.m_indexed = indexed
+        self.m_timestamps = stored["timestamps"][:-(-indexed // TIME_STRIDE)].astype(np.int64)
+        breaks = stored["breaks"].astype(np.int64)
+        self.m_breaks = breaks[breaks < indexed]
+        self.m_idBitmaps = stored["id_bitmaps"][:-(-indexed // ID_BLOCK)].astype(np.uint8)
+        self.m_lastTimestamp = self.timestamp(indexed - 1)
+
+    # 保存索引；日志所在的目录不可写时只保留在内存中，返回是否保存成功
+    def save_index(self):
+        if not self.m_indexChanged:
+            return True
+        temporary = self.index_file_name() + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                np.savez(f, version=INDEX_VERSION, start_time=self.m_header["start_time"],
+                         rows=self.m_indexed, timestamps=self.m_timestamps, breaks=self.m_breaks,
+                         id_bitmaps=self.m_idBitmaps)
+            os.replace(temporary, self.index_file_name())
+        except OSError:
+            return False
+        self.m_indexChanged = False
+        return True
+
+    # 为下一块（最多 ID_BLOCK 行）建立索引，返回已建立索引的行数。
+    # 用 readinto() 读入临时数组而不经过映射，建立索引不会增加进程的 RSS
+    def index_more(self):
+        start = self.m_indexed
+        count = min(ID_BLOCK, self.m_rows - start)
+        if count <= 0:
+            return self.m_indexed
+        records = np.empty(count, RECORD_DTYPE)
+        self.m_file.seek(HEADER_SIZE + start * RECORD_DTYPE.itemsize)
+        self.m_file.readinto(memoryview(records).cast("B"))
+
+        timestamps = records["timestamp"]
+        first = -start % TIME_STRIDE
+        self.m_timestamps = np.concatenate([self.m_timestamps, timestamps[first::TIME_STRIDE]])
+        backwards = np.flatnonzero(timestamps[1:] < timestamps[:-1]) + 1
+        if self.m_lastTimestamp is not None and timestamps[0] < self.m_lastTimestamp:
+            backwards = np.concatenate([[0], backwards])
+        if len(backwards):
+            self.m_breaks = np.concatenate([self.m_breaks, backwards + start])
+        self.m_lastTimestamp = int(timestamps[-1])
+
+        bitmap = np.zeros(ID_BITS, bool)
+        bitmap[_id_bits(id_keys(records["can_id"], records["flags"]))] = True
+        self.m_idBitmaps = np.concatenate([self.m_idBitmaps, np.packbits(bitmap)[None, :]])
+        self.m_indexed = start + count
+        self.m_indexChanged = True
+        return self.m_indexed
+
+    # 以下查找只覆盖已建立索引的行
+
+    def timestamp_breaks(self):
+        return self.m_breaks.tolist()
+
+    def runs(self):
+        starts = [0] + self.timestamp_breaks()
+        stops = starts[1:] + [self.m_indexed]
+        return [(start, stop) for start, stop in zip(starts, stops) if start < stop]
+
+    # 与 FrameStore.search_timestamp 相同：在单调递增的行 [start, stop) 中二分查找
+    def search_timestamp(self, start, stop, timestamp, side="left"):
+        if start >= stop:
+            return stop
+        first = -(-start // TIME_STRIDE)
+        last = -(-stop // TIME_STRIDE)
+        i = int(np.searchsorted(self.m_timestamps[first:last], timestamp, side))
+        lo = start if i == 0 else (first + i - 1) * TIME_STRIDE
+        hi = stop if first + i >= last else (first + i) * TIME_STRIDE
+        return lo + int(np.searchsorted(self._records(lo, hi)["timestamp"], timestamp, side))
+
+    # 与 ReceivedFramesModel.row_at_time 相同
+    def row_at_time(self, timestamp):
+        for start, stop in self.runs():
+            if self.timestamp(stop - 1) >= timestamp:
+                return self.search_timestamp(start, stop, timestamp)
+        return self.m_indexed - 1
+
+    def rows_in_time_window(self, first, last):
+        result = []
+        for start, stop in self.runs():
+            begin = self.search_timestamp(start, stop, first)
+            end = self.search_timestamp(start, stop, last, "right")
+            if begin < end:
+                result.append((begin, end - 1))
+        return result
+
+    # 返回 row 之后（forward 为 True）或之前与第 row 行同 ID 的最近一行，没有则返回 -1。
+    # 只读入位图中可能含有这个报文键的块
+    def find_same_id(self, row, forward=True):
+        key = self.row_key(row)
+        if key is None or row >= self.m_indexed:
+            return -1
+        bit = int(_id_bits(np.int64(key)))
+        candidates = np.flatnonzero(self.m_idBitmaps[:, bit >> 3] & (0x80 >> (bit & 7)))
+        block = row // ID_BLOCK
+        candidates = candidates[candidates >= block] if forward else candidates[candidates <= block][::-1]
+        for b in candidates.tolist():
+            start = b * ID_BLOCK
+            stop = min(start + ID_BLOCK, self.m_indexed)
+            if forward:
+                start = max(start, row + 1)
+            else:
+                stop = min(stop, row)
+            if start >= stop:
+                continue
+            records = self._records(start, stop)
+            found = np.flatnonzero(id_keys(records["can_id"], records["flags"]) == key)
+            if len(found):
+                return start + int(found[0] if forward else found[-1])
+        return -1
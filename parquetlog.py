@@ -0,0 +1,517 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+from framestore import MAX_PAYLOAD_FD, FrameBatch
+from recorder import LogFormatError
+
+# Apache Parquet 格式的列式日志，供 pandas、DuckDB、pyarrow 等离线分析工具直接读取，不需要安装任何额外的包。
+#
+# 文件为 "PAR1"、若干行组（row group）、元数据（Thrift compact 协议编码的 FileMetaData）、元数据长度、"PAR1"。
+# 每个行组最多 ROW_GROUP_ROWS 帧，其中每一列（timestamp、can_id、flags、dlc、payload）是一个列块，
+# 列块只有一个 PLAIN 编码、gzip 压缩的数据页。元数据中记录每个列块的最小值和最大值，
+# 读取者按时间或 ID 过滤时可以跳过整个行组（DuckDB、pyarrow 会自动这样做，ParquetReader.batches() 也一样）。
+#   timestamp  INT64，TIMESTAMP_MICROS（Unix 微秒）
+#   can_id     INT32，不含扩展帧标志
+#   flags      INT32，UINT_8，见 framestore 中的标志位
+#   dlc        INT32，UINT_8，有效载荷的字节数
+#   payload    BYTE_ARRAY，dlc 个字节
+#
+# 写入（ParquetEncoder）：与 recorder.BinaryLogEncoder 的接口相同，可以交给 LogRecorder 在写线程中实时记录。
+# 帧先积累到 ROW_GROUP_ROWS 帧再整列编码为一个行组写出，内存中最多只有一个行组，与记录的长度无关。
+# 元数据在 end() 中写在文件末尾，记录中途中断（例如断电）的文件没有元数据，无法读取；
+# 需要这种保证时先记录为二进制日志（.canlog），再导出为 Parquet。
+#
+# 读取（ParquetReader）：只支持上面这种结构（PLAIN 编码、REQUIRED 列、不压缩或 gzip），即本模块写出的文件。
+# 打开时只读元数据；行组在需要时才解码，最近用过的行组保存在有上限的 LRU 缓存中。
+
+PARQUET_MAGIC = b"PAR1"
+ROW_GROUP_ROWS = 1 << 16  # 每个行组的帧数
+COMPRESSION_LEVEL = 6  # 0 为不压缩
+GROUP_CACHE = 8  # 按需浏览时缓存解码结果的行组个数
+CREATED_BY = "CAN Bus Example"
+
+# Parquet 的枚举值
+TYPE_INT32 = 1
+TYPE_INT64 = 2
+TYPE_BYTE_ARRAY = 6
+REQUIRED = 0
+TIMESTAMP_MICROS = 10
+UINT_8 = 11
+ENCODING_PLAIN = 0
+ENCODING_RLE = 3
+UNCOMPRESSED = 0
+GZIP = 2
+DATA_PAGE = 0
+
+# 列名、物理类型、转换类型
+COLUMNS = [("timestamp", TYPE_INT64, TIMESTAMP_MICROS),
+           ("can_id", TYPE_INT32, None),
+           ("flags", TYPE_INT32, UINT_8),
+           ("dlc", TYPE_INT32, UINT_8),
+           ("payload", TYPE_BYTE_ARRAY, None)]
+_NUMPY_TYPES = {TYPE_INT32: np.dtype("<i4"), TYPE_INT64: np.dtype("<i8")}
+
+# Thrift compact 协议的类型
+T_TRUE = 1
+T_FALSE = 2
+T_BYTE = 3
+T_I16 = 4
+T_I32 = 5
+T_I64 = 6
+T_DOUBLE = 7
+T_BINARY = 8
+T_LIST = 9
+T_SET = 10
+T_MAP = 11
+T_STRUCT = 12
+
+_LENGTH = struct.Struct("<I")
+
+
+# 以下为 Thrift compact 协议。写入时结构体表示为 [(字段号, 类型, 值), ...]，值为 None 的字段不写；
+# 列表的值为 (元素类型, [元素, ...])。读出的结构体为 {字段号: 值}
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return _varint((value << 1) ^ (value >> 63))
+
+
+def _value(kind, value):
+    if kind in (T_BYTE, T_I16, T_I32, T_I64):
+        return _zigzag(value)
+    if kind == T_BINARY:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return _varint(len(value)) + value
+    if kind == T_STRUCT:
+        return _struct(value)
+    if kind == T_LIST:
+        element, items = value
+        size = len(items)
+        head = bytes([size << 4 | element]) if size < 15 else bytes([0xF0 | element]) + _varint(size)
+        return head + b"".join(_value(element, item) for item in items)
+    raise ValueError(f"unsupported Thrift type {kind}")
+
+
+def _struct(fields):
+    out = []
+    last = 0
+    for field, kind, value in fields:
+        if value is None:
+            continue
+        if kind in (T_TRUE, T_FALSE):
+            kind = T_TRUE if value else T_FALSE
+        delta = field - last
+        out.append(bytes([delta << 4 | kind]) if 0 < delta <= 15 else bytes([kind]) + _zigzag(field))
+        if kind not in (T_TRUE, T_FALSE):
+            out.append(_value(kind, value))
+        last = field
+    out.append(b"\0")
+    return b"".join(out)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_zigzag(data, pos):
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _read_value(data, pos, kind):
+    if kind in (T_TRUE, T_FALSE):  # 列表中的布尔值占一个字节
+        return data[pos] == T_TRUE, pos + 1
+    if kind == T_BYTE:
+        return data[pos], pos + 1
+    if kind in (T_I16, T_I32, T_I64):
+        return _read_zigzag(data, pos)
+    if kind == T_DOUBLE:
+        return struct.unpack_from("<d", data, pos)[0], pos + 8
+    if kind == T_BINARY:
+        size, pos = _read_varint(data, pos)
+        return bytes(data[pos:pos + size]), pos + size
+    if kind in (T_LIST, T_SET):
+        head = data[pos]
+        pos += 1
+        size = head >> 4
+        if size == 15:
+            size, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(size):
+            item, pos = _read_value(data, pos, head & 0x0F)
+            items.append(item)
+        return items, pos
+    if kind == T_MAP:
+        size, pos = _read_varint(data, pos)
+        if not size:
+            return {}, pos
+        kinds = data[pos]
+        pos += 1
+        result = {}
+        for _ in range(size):
+            key, pos = _read_value(data, pos, kinds >> 4)
+            result[key], pos = _read_value(data, pos, kinds & 0x0F)
+        return result, pos
+    if kind == T_STRUCT:
+        return _read_struct(data, pos)
+    raise LogFormatError(f"unsupported Thrift type {kind}")
+
+
+def _read_struct(data, pos):
+    result = {}
+    last = 0
+    while True:
+        head = data[pos]
+        pos += 1
+        if not head:
+            return result, pos
+        kind = head & 0x0F
+        if head >> 4:
+            field = last + (head >> 4)
+        else:
+            field, pos = _read_zigzag(data, pos)
+        if kind in (T_TRUE, T_FALSE):
+            result[field] = kind == T_TRUE
+        else:
+            result[field], pos = _read_value(data, pos, kind)
+        last = field
+
+
+# 一批帧的有效载荷按 PLAIN 编码为 BYTE_ARRAY：每帧 4 字节的长度（小端）后跟 dlc 个字节
+def _encode_payload(payload, dlc):
+    sizes = dlc.astype(np.int64) + 4
+    starts = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), np.uint8)
+    out[starts] = dlc
+    mask = np.arange(MAX_PAYLOAD_FD) < dlc[:, None]
+    out[(starts[:, None] + 4 + np.arange(MAX_PAYLOAD_FD))[mask]] = payload[mask]
+    return out
+
+
+# _encode_payload 的逆过程；每个值的长度必须与 dlc 列一致
+def _decode_payload(data, dlc):
+    raw = np.frombuffer(data, np.uint8)
+    sizes = dlc.astype(np.int64) + 4
+    starts = np.cumsum(sizes) - sizes
+    if int(sizes.sum()) != len(raw):
+        raise LogFormatError("payload column does not match the dlc column")
+    lengths = raw[starts[:, None] + np.arange(4)].copy().view("<u4").reshape(-1)
+    if (lengths != dlc).any():
+        raise LogFormatError("payload column does not match the dlc column")
+    payload = np.zeros((len(dlc), MAX_PAYLOAD_FD), np.uint8)
+    mask = np.arange(MAX_PAYLOAD_FD) < dlc[:, None]
+    payload[mask] = raw[(starts[:, None] + 4 + np.arange(MAX_PAYLOAD_FD))[mask]]
+    return payload
+
+
+def _schema():
+    elements = [[(4, T_BINARY, "schema"), (5, T_I32, len(COLUMNS))]]
+    for name, kind, converted in COLUMNS:
+        elements.append([(1, T_I32, kind), (3, T_I32, REQUIRED), (4, T_BINARY, name), (6, T_I32, converted)])
+    return elements
+
+
+class ParquetEncoder():
+    """Parquet 格式的编码器，接口见 recorder.BinaryLogEncoder。
+
+    encode() 只在积累满一个行组时才返回内容，end() 写出最后一个不满的行组和文件末尾的元数据。
+    """
+
+    def __init__(self, row_group_rows=ROW_GROUP_ROWS, compression_level=COMPRESSION_LEVEL):
+        self.m_groupRows = row_group_rows
+        self.m_level = compression_level
+        self.m_pending = []  # 还没有写出的批次
+        self.m_pendingRows = 0
+        self.m_offset = 0  # 已经返回的字节数，也就是下一个列块在文件中的位置
+        self.m_rowGroups = []  # 每个行组的 RowGroup 结构
+        self.m_rows = 0
+
+    def begin(self):
+        self.m_offset = len(PARQUET_MAGIC)
+        return PARQUET_MAGIC
+
+    def encode(self, batch):
+        if len(batch):
+            self.m_pending.append(batch)
+            self.m_pendingRows += len(batch)
+        if self.m_pendingRows < self.m_groupRows:
+            return b""
+        return self._flush(self.m_groupRows)
+
+    # 把积累的帧中每满 size 帧编码为一个行组，返回这些行组的字节
+    def _flush(self, size):
+        frames = FrameBatch.concatenate(self.m_pending)
+        output = []
+        start = 0
+        while len(frames) - start >= size:
+            output.append(self._row_group(frames.slice(start, start + size)))
+            start += size
+        rest = frames.slice(start, len(frames))
+        self.m_pending = [rest] if len(rest) else []
+        self.m_pendingRows = len(rest)
+        return b"".join(output)
+
+    # 返回列的 PLAIN 编码和 Statistics 结构；整数列的统计为小端编码的最小值和最大值
+    def _column(self, batch, name, kind):
+        if kind == TYPE_BYTE_ARRAY:
+            return _encode_payload(batch.payload, batch.dlc).tobytes(), None
+        values = getattr(batch, name).astype(_NUMPY_TYPES[kind])
+        low = values.min()
+        high = values.max()
+        statistics = [(3, T_I64, 0), (5, T_BINARY, high.tobytes()), (6, T_BINARY, low.tobytes())]
+        return values.tobytes(), statistics
+
+    def _row_group(self, batch):
+        count = len(batch)
+        codec = GZIP if self.m_level else UNCOMPRESSED
+        output = []
+        chunks = []
+        group_offset = self.m_offset
+        uncompressed_total = 0
+        for name, kind, _ in COLUMNS:
+            data, statistics = self._column(batch, name, kind)
+            if codec == GZIP:
+                compressor = zlib.compressobj(self.m_level, zlib.DEFLATED, 31)
+                compressed = compressor.compress(data) + compressor.flush()
+            else:
+                compressed = data
+            header = _struct([(1, T_I32, DATA_PAGE), (2, T_I32, len(data)), (3, T_I32, len(compressed)),
+                              (5, T_STRUCT, [(1, T_I32, count), (2, T_I32, ENCODING_PLAIN),
+                                             (3, T_I32, ENCODING_RLE), (4, T_I32, ENCODING_RLE)])])
+            offset = self.m_offset
+            output.append(header)
+            output.append(compressed)
+            self.m_offset += len(header) + len(compressed)
+            uncompressed_total += len(header) + len(data)
+            metadata = [(1, T_I32, kind), (2, T_LIST, (T_I32, [ENCODING_PLAIN, ENCODING_RLE])),
+                        (3, T_LIST, (T_BINARY, [name])), (4, T_I32, codec), (5, T_I64, count),
+                        (6, T_I64, len(header) + len(data)), (7, T_I64, len(header) + len(compressed)),
+                        (9, T_I64, offset), (12, T_STRUCT, statistics)]
+            chunks.append([(2, T_I64, offset), (3, T_STRUCT, metadata)])
+        self.m_rowGroups.append([(1, T_LIST, (T_STRUCT, chunks)), (2, T_I64, uncompressed_total),
+                                 (3, T_I64, count), (5, T_I64, group_offset),
+                                 (6, T_I64, self.m_offset - group_offset)])
+        self.m_rows += count
+        return b"".join(output)
+
+    def end(self):
+        data = b""
+        if self.m_pending:
+            data = self._row_group(FrameBatch.concatenate(self.m_pending))
+            self.m_pending = []
+            self.m_pendingRows = 0
+        # column_orders 为 TypeDefinedOrder，否则读取者不使用 min_value/max_value 统计
+        footer = _struct([(1, T_I32, 1), (2, T_LIST, (T_STRUCT, _schema())), (3, T_I64, self.m_rows),
+                          (4, T_LIST, (T_STRUCT, self.m_rowGroups)), (6, T_BINARY, CREATED_BY),
+                          (7, T_LIST, (T_STRUCT, [[(1, T_STRUCT, [])]] * len(COLUMNS)))])
+        return data + footer + _LENGTH.pack(len(footer)) + PARQUET_MAGIC
+
+
+class ParquetReader():
+    """Parquet 日志的读取器。打开时只读文件末尾的元数据，行组在读取对应的帧时才解码。
+
+    元数据中已经有全部的帧数，按需浏览（见 logfilemodel）时不需要 fetch_more()。
+    """
+
+    def __init__(self, file_name):
+        self.m_file = open(file_name, "rb")
+        try:
+            self.m_map = mmap.mmap(self.m_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # 空文件
+            self.m_file.close()
+            raise LogFormatError("file is too short")
+        try:
+            self._read_metadata()
+        except (IndexError, KeyError, TypeError, struct.error) as e:
+            self.close()
+            raise LogFormatError(f"invalid Parquet metadata: {e}")
+        except LogFormatError:
+            self.close()
+            raise
+        self.m_cache = OrderedDict()  # 行组下标 -> FrameBatch
+
+    def close(self):
+        self.m_map.close()
+        self.m_file.close()
+
+    def _read_metadata(self):
+        size = len(self.m_map)
+        tail = len(PARQUET_MAGIC) + _LENGTH.size
+        if (size < len(PARQUET_MAGIC) + tail or self.m_map[:4] != PARQUET_MAGIC
+                or self.m_map[-4:] != PARQUET_MAGIC):
+            raise LogFormatError("not a Parquet file")
+        length = _LENGTH.unpack_from(self.m_map, size - tail)[0]
+        if length > size - len(PARQUET_MAGIC) - tail:
+            raise LogFormatError("not a Parquet file")
+        metadata, _ = _read_struct(self.m_map, size - tail - length)
+
+        types = {}
+        for element in metadata[2][1:]:
+            if element.get(3, REQUIRED) != REQUIRED:
+                raise LogFormatError(f"unsupported Parquet column '{element[4].decode()}'")
+            types[element[4].decode()] = element.get(1)
+        for name, kind, _ in COLUMNS:
+            if types.get(name) != kind:
+                raise LogFormatError(f"missing Parquet column '{name}'")
+
+        # 每个行组：{列名: ColumnMetaData}
+        self.m_groups = []
+        self.m_rowStarts = [0]  # 第 k 个行组中第一帧的行号，最后一项为总帧数
+        for group in metadata.get(4, []):
+            columns = {}
+            for chunk in group[1]:
+                if 1 in chunk:
+                    raise LogFormatError("Parquet column chunks in other files are not supported")
+                column = chunk[3]
+                columns[column[3][0].decode()] = column
+            self.m_groups.append(columns)
+            self.m_rowStarts.append(self.m_rowStarts[-1] + group[3])
+
+    def row_group_count(self):
+        return len(self.m_groups)
+
+    # 第 k 个行组中列 name 的 (最小值, 最大值)，元数据中没有统计时返回 None
+    def statistics(self, k, name):
+        column = self.m_groups[k][name]
+        statistics = column.get(12, {})
+        low = statistics.get(6, statistics.get(2))
+        high = statistics.get(5, statistics.get(1))
+        if low is None or high is None:
+            return None
+        dtype = _NUMPY_TYPES[column[1]]
+        return int(np.frombuffer(low, dtype)[0]), int(np.frombuffer(high, dtype)[0])
+
+    # 返回可能包含所要的帧的行组的下标：time_range 为时间戳的闭区间 (first, last)，can_ids 为 ID 的列表。
+    # 元数据中的最小值和最大值表明行组中不可能有这样的帧时跳过这个行组
+    def row_groups(self, time_range=None, can_ids=None):
+        ids = None if can_ids is None else np.asarray(list(can_ids), np.int64)
+        result = []
+        for k in range(len(self.m_groups)):
+            if time_range is not None:
+                bounds = self.statistics(k, "timestamp")
+                if bounds is not None and (bounds[1] < time_range[0] or bounds[0] > time_range[1]):
+                    continue
+            if ids is not None:
+                bounds = self.statistics(k, "can_id")
+                if bounds is not None and not ((ids >= bounds[0]) & (ids <= bounds[1])).any():
+                    continue
+            result.append(k)
+        return result
+
+    # 读出第 k 个行组中列 name 的全部数据页，返回解压后的 PLAIN 编码的各页
+    def _pages(self, k, name):
+        column = self.m_groups[k][name]
+        codec = column[4]
+        if codec not in (UNCOMPRESSED, GZIP):
+            raise LogFormatError(f"unsupported Parquet compression codec {codec}")
+        pos = column[9]
+        values = column[5]
+        pages = []
+        while values > 0:
+            header, pos = _read_struct(self.m_map, pos)
+            data = self.m_map[pos:pos + header[3]]
+            pos += header[3]
+            if header[1] != DATA_PAGE or header[5][2] != ENCODING_PLAIN:
+                raise LogFormatError("unsupported Parquet page encoding")
+            if codec == GZIP:
+                data = zlib.decompress(data, 31)
+            pages.append((header[5][1], data))
+            values -= header[5][1]
+        return pages
+
+    def _decode(self, k):
+        columns = {}
+        for name, kind, _ in COLUMNS[:-1]:
+            columns[name] = np.concatenate([np.frombuffer(data, _NUMPY_TYPES[kind])
+                                            for _, data in self._pages(k, name)])
+        dlc = columns["dlc"].astype(np.uint8)
+        if (dlc > MAX_PAYLOAD_FD).any():
+            raise LogFormatError("invalid dlc in Parquet log")
+        payloads = []
+        row = 0
+        for count, data in self._pages(k, "payload"):
+            payloads.append(_decode_payload(data, dlc[row:row + count]))
+            row += count
+        first = self.m_rowStarts[k] + 1
+        count = len(dlc)
+        return FrameBatch(np.arange(first, first + count, dtype=np.int64), columns["timestamp"].astype(np.int64),
+                          columns["can_id"].astype(np.uint32), columns["flags"].astype(np.uint8), dlc,
+                          np.concatenate(payloads) if payloads else np.zeros((0, MAX_PAYLOAD_FD), np.uint8))
+
+    # 顺序读取帧，帧序号为 first_number 加上帧在文件中的下标。
+    # 给出 time_range 或 can_ids 时只返回符合条件的帧，元数据表明不符合条件的行组不解码
+    def batches(self, first_number=1, time_range=None, can_ids=None):
+        ids = None if can_ids is None else np.asarray(list(can_ids), np.uint32)
+        for k in self.row_groups(time_range, ids):
+            batch = self._decode(k)
+            if time_range is not None or ids is not None:
+                mask = np.ones(len(batch), bool)
+                if time_range is not None:
+                    mask &= (batch.timestamp >= time_range[0]) & (batch.timestamp <= time_range[1])
+                if ids is not None:
+                    mask &= np.isin(batch.can_id, ids)
+                batch = batch.select(mask)
+            if len(batch):
+                if first_number != 1:
+                    batch.number += first_number - 1
+                yield batch
+
+    # 以下为 LogFileModel 的数据源接口；行号从 0 开始
+
+    def row_count(self):
+        return self.m_rowStarts[-1]
+
+    def can_fetch_more(self):
+        return False
+
+    def fetch_more(self, rows=0):
+        return 0
+
+    def _decoded_batch(self, k):
+        batch = self.m_cache.get(k)
+        if batch is None:
+            batch = self._decode(k)
+            self.m_cache[k] = batch
+            if len(self.m_cache) > GROUP_CACHE:
+                self.m_cache.popitem(last=False)
+        else:
+            self.m_cache.move_to_end(k)
+        return batch
+
+    def batch(self, start, stop):
+        stop = min(stop, self.row_count())
+        parts = []
+        k = bisect_right(self.m_rowStarts, start) - 1
+        while start < stop and k < len(self.m_groups):
+            first = self.m_rowStarts[k]
+            last = self.m_rowStarts[k + 1]
+            if last > start:
+                parts.append(self._decoded_batch(k).slice(start - first, min(stop, last) - first))
+                start = min(stop, last)
+            k += 1
+        return FrameBatch.concatenate(parts)
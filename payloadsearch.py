@@ -0,0 +1,236 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import re
+
+import numpy as np
+
+from PySide6.QtCore import QModelIndex, Qt, Slot
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import (QApplication, QCheckBox, QHBoxLayout, QLabel, QLineEdit,
+                               QToolButton, QWidget)
+
+from framefilterproxymodel import FrameFilterProxyModel
+from framestore import MAX_PAYLOAD_FD
+from instrumentation import metrics
+
+# 有效载荷的字节模式搜索。
+# 模式是十六进制字节，可以用 ? 代替任意一个半字节，例如 "12 ?? 34 F?"（空格可以省略）。
+# 搜索直接在 FrameStore 的 payload 矩阵（每帧 64 字节，连续存储）上进行，而不是逐行比较格式化后的 Data 字符串：
+# 对模式中的每个字节做一次整列的 (payload & 掩码) == 值 比较，所有偏移量同时比较，
+# 环形缓冲区最多分两段、每段按 SEARCH_CHUNK 行分块处理，临时数组的大小有上限。
+# 搜索过之后，模型每追加一批帧只在新的行中搜索，把结果接在后面，实时接收时结果和跳转一直是最新的。
+
+SEARCH_CHUNK = 1 << 16  # 每块的行数
+
+_BYTE = re.compile(r"[0-9A-Fa-f?]{2}")
+
+
+class PatternError(ValueError):
+    pass
+
+
+# 把模式字符串解析为 (值, 掩码) 两个 uint8 数组，掩码中为 0 的位不参与比较
+def parse_hex_pattern(text):
+    compact = "".join(text.split())
+    if not compact:
+        raise PatternError("empty pattern")
+    if len(compact) % 2 or len(compact) > 2 * MAX_PAYLOAD_FD:
+        raise PatternError("the pattern must be whole bytes, at most 64")
+    values = []
+    masks = []
+    for i in range(0, len(compact), 2):
+        byte = compact[i:i + 2]
+        if not _BYTE.fullmatch(byte):
+            raise PatternError(f"invalid byte '{byte}'")
+        value = 0
+        mask = 0
+        for nibble in byte:
+            value <<= 4
+            mask <<= 4
+            if nibble != "?":
+                value |= int(nibble, 16)
+                mask |= 0xF
+        values.append(value)
+        masks.append(mask)
+    return np.array(values, np.uint8), np.array(masks, np.uint8)
+
+
+# 在 payload[i] 的前 dlc[i] 个字节中查找模式，返回匹配的行（相对于传入数组）。
+# any_offset 为 False 时只匹配从第 0 个字节开始的位置
+def _match_rows(payload, dlc, values, masks, any_offset):
+    length = len(values)
+    # 只需要比较到这一块中最长的有效载荷为止，经典 CAN 帧只有 8 字节
+    offsets = int(dlc.max(initial=0)) - length + 1
+    if offsets <= 0:
+        return np.empty(0, np.int64)
+    if not any_offset:
+        offsets = 1
+    # hits[i, k] 表示第 rows[i] 行从偏移量 k 开始是否匹配
+    rows = np.arange(len(payload))
+    hits = np.ones((len(payload), offsets), bool)
+    for j in range(length):
+        if masks[j] == 0:
+            continue
+        window = payload[:, j:j + offsets]
+        if masks[j] != 0xFF:
+            window = window & masks[j]
+        hits &= window == values[j]
+        # 比较过第一个字节后通常只剩下很少的候选行，后面的字节只在这些行上比较
+        alive = np.flatnonzero(hits.any(axis=1))
+        if len(alive) < len(rows) // 2:
+            rows = rows[alive]
+            hits = hits[alive]
+            payload = payload[alive]
+            dlc = dlc[alive]
+    # 匹配必须完全落在有效载荷的长度之内
+    hits &= np.arange(offsets)[None, :] + length <= dlc[:, None]
+    return rows[hits.any(axis=1)]
+
+
+# 在帧存储的逻辑行 [first, last) 中搜索（last 为 None 时到末尾），返回匹配的逻辑行号（递增）
+def search_payload(store, values, masks, any_offset=True, first=0, last=None):
+    values = values & masks
+    last = len(store) if last is None else last
+    result = []
+    logical = 0
+    for start, stop in store.segments():
+        begin = start + max(first - logical, 0)
+        finish = start + min(last - logical, stop - start)
+        for chunk in range(begin, finish, SEARCH_CHUNK):
+            end = min(chunk + SEARCH_CHUNK, finish)
+            rows = _match_rows(store.payload[chunk:end], store.dlc[chunk:end], values, masks,
+                               any_offset)
+            result.append(rows + logical + chunk - start)
+        logical += stop - start
+    return np.concatenate(result) if result else np.empty(0, np.int64)
+
+
+class PayloadSearchBar(QWidget):
+    """接收帧视图上方的搜索栏：输入模式后按回车搜索整个缓存，用上一个/下一个在结果之间跳转。"""
+
+    def __init__(self, view, model, parent=None):
+        super().__init__(parent)
+        self.m_view = view
+        self.m_model = model  # ReceivedFramesModel，视图显示的可能是它的代理
+        self.m_hits = np.empty(0, np.int64)  # 匹配帧的绝对位置（见 ReceivedFramesModel.absolute_position）
+        self.m_searched = False  # m_hits 是否对应当前的模式
+        self.m_pattern = None  # 搜索过的 (值, 掩码, any_offset)，用于在新追加的行中继续搜索
+
+        self.m_patternEdit = QLineEdit(self)
+        self.m_patternEdit.setPlaceholderText("Search payload, e.g. 12 ?? 34 F?")
+        self.m_patternEdit.setClearButtonEnabled(True)
+        self.m_anyOffsetBox = QCheckBox("Any offset", self)
+        self.m_anyOffsetBox.setChecked(True)
+        self.m_previousButton = QToolButton(self)
+        self.m_previousButton.setArrowType(Qt.UpArrow)
+        self.m_previousButton.setToolTip("Previous match (Shift+Enter)")
+        self.m_nextButton = QToolButton(self)
+        self.m_nextButton.setArrowType(Qt.DownArrow)
+        self.m_nextButton.setToolTip("Next match (Enter)")
+        self.m_resultLabel = QLabel(self)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.m_patternEdit)
+        layout.addWidget(self.m_anyOffsetBox)
+        layout.addWidget(self.m_previousButton)
+        layout.addWidget(self.m_nextButton)
+        layout.addWidget(self.m_resultLabel)
+
+        self.m_patternEdit.returnPressed.connect(self._return_pressed)
+        self.m_patternEdit.textChanged.connect(self._pattern_changed)
+        self.m_anyOffsetBox.toggled.connect(self._pattern_changed)
+        self.m_previousButton.clicked.connect(self.find_previous)
+        self.m_nextButton.clicked.connect(self.find_next)
+        self.m_model.rowsInserted.connect(self._rows_inserted)
+        self.m_model.modelReset.connect(self._model_reset)
+        QShortcut(QKeySequence.Find, view.window(), self.m_patternEdit.setFocus)
+        QShortcut(QKeySequence.FindNext, view.window(), self.find_next)
+        QShortcut(QKeySequence.FindPrevious, view.window(), self.find_previous)
+
+    @Slot()
+    def _pattern_changed(self):
+        self._model_reset()
+        self.m_resultLabel.clear()
+        self.m_patternEdit.setStyleSheet("")
+
+    # 模型清空后绝对位置从 0 重新开始，以前的结果不再有效
+    @Slot()
+    def _model_reset(self):
+        self.m_searched = False
+        self.m_hits = np.empty(0, np.int64)
+
+    # 模型追加了行 [first, last]：只在这些行中搜索，结果接在已有结果的后面
+    @Slot(QModelIndex, int, int)
+    def _rows_inserted(self, parent, first, last):
+        if not self.m_searched:
+            return
+        values, masks, any_offset = self.m_pattern
+        with metrics.timed("payload_search"):
+            rows = search_payload(self.m_model.m_frames, values, masks, any_offset, first, last + 1)
+        if len(rows):
+            self.m_hits = np.concatenate([self.m_hits, rows + self.m_model.absolute_position(0)])
+
+    # 回车：模式改变后先搜索，再跳到第一个结果；Shift+回车向上跳
+    @Slot()
+    def _return_pressed(self):
+        backwards = bool(QApplication.keyboardModifiers() & Qt.ShiftModifier)
+        self.find_previous() if backwards else self.find_next()
+
+    # 在模型的整个缓存中搜索，结果保存为绝对位置，之后淘汰的行会自动失效
+    def search(self):
+        try:
+            values, masks = parse_hex_pattern(self.m_patternEdit.text())
+        except PatternError as e:
+            self.m_patternEdit.setStyleSheet("QLineEdit { color: red; }")
+            self.m_resultLabel.setText(str(e))
+            return False
+        self.m_pattern = (values, masks, self.m_anyOffsetBox.isChecked())
+        with metrics.timed("payload_search"):
+            rows = search_payload(self.m_model.m_frames, *self.m_pattern)
+        self.m_hits = rows + self.m_model.absolute_position(0)
+        self.m_searched = True
+        return True
+
+    @Slot()
+    def find_next(self):
+        self._jump(True)
+
+    @Slot()
+    def find_previous(self):
+        self._jump(False)
+
+    def _jump(self, forward):
+        view_model = self.m_view.model()
+        proxy = isinstance(view_model, FrameFilterProxyModel) and view_model.sourceModel() is self.m_model
+        if view_model is not self.m_model and not proxy:
+            return  # 固定模式等不以滚动日志为数据源的视图不支持搜索
+        if not self.m_searched and not self.search():
+            return
+        first = self.m_model.absolute_position(0)
+        hits = self.m_hits[np.searchsorted(self.m_hits, first):]  # 去掉已被淘汰的行
+        self.m_hits = hits
+        if not len(hits):
+            self.m_resultLabel.setText("No matches")
+            return
+
+        current = self.m_view.currentIndex()
+        row = current.row() if current.isValid() else (-1 if forward else self.m_model.rowCount())
+        if current.isValid() and proxy:
+            row = view_model.mapToSource(current).row()
+        # 从当前行开始找下一个（上一个）结果；视图是代理时跳过代理中不显示的行
+        position = row + first
+        order = range(int(np.searchsorted(hits, position, side="right")), len(hits)) if forward \
+            else range(int(np.searchsorted(hits, position)) - 1, -1, -1)
+        for i in order:
+            index = self.m_model.index(int(hits[i]) - first, current.column() if current.isValid() else 0)
+            if proxy:
+                index = view_model.mapFromSource(index)
+                if not index.isValid():
+                    continue
+            self.m_view.setCurrentIndex(index)
+            self.m_view.scrollTo(index)
+            self.m_resultLabel.setText(f"{i + 1} / {len(hits)}")
+            return
+        self.m_resultLabel.setText(f"{len(hits)} matches, no more {'below' if forward else 'above'}")
@@ -1,9 +1,18 @@
 # Copyright (C) 2022 The Qt Company Ltd.
 # SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
 
+import re
+import time
+from collections import OrderedDict
+from decimal import Decimal
 from enum import IntEnum
 
-from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSize, Qt    
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSize, Qt, Signal
+
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE,
+                        FLAG_LOCAL_ECHO, FrameBatch, FrameStore, id_key)
+from frameindex import FrameIdIndex, TimestampIndex
+from instrumentation import metrics
 
 # QAbstractTableModel 可创建自定义的表格类型
 # QModelIndex 访问和操作表格模型中的数据
@@ -33,6 +42,9 @@ class ReceivedFramesModelColumns(IntEnum):
 
 clipboard_text_role = Qt.UserRole + 1
 
+# 已格式化单元格缓存的最大项数，足够覆盖若干屏可见行的所有列
+format_cache_limit = 4096
+
 # 列表
 # 对齐方式
 # Qt.AlignRight | Qt.AlignVCenter：右对齐且垂直居中
@@ -44,26 +56,63 @@ column_alignment = [Qt.AlignRight | Qt.AlignVCenter, Qt.AlignRight | Qt.AlignVCe
                     Qt.AlignRight | Qt.AlignVCenter, Qt.AlignLeft | Qt.AlignVCenter]
 
 
+# 将 flags 列中的标志位格式化为 " BEL " 形式的字符串，没有的标志位用 '-' 表示
+def format_flags(flags):
+    return (" " + ("B" if flags & FLAG_BITRATE_SWITCH else "-")
+            + ("E" if flags & FLAG_ERROR_STATE else "-")
+            + ("L" if flags & FLAG_LOCAL_ECHO else "-") + " ")
+
+
+# 将微秒时间戳格式化为 "秒.万分之一秒"，秒数占据10个字符的宽度，小数部分占据4个字符的宽度
+def format_timestamp(timestamp):
+    secs, microsecs = divmod(int(timestamp), 1000000)
+    return f"{secs:>10}.{microsecs // 100:0>4}"
+
+
+# format_timestamp 的逆运算：把 "秒.小数" 形式的字符串解析为微秒，格式不对时返回 None
+def parse_timestamp(text):
+    text = text.strip()
+    if not re.fullmatch(r"\d+(\.\d*)?", text):
+        return None
+    return int(Decimal(text) * 1000000)
+
+
+# 将有效载荷格式化为以空格分隔的大写十六进制字符串，例如 "12 34 AB"
+def format_payload(payload, dlc):
+    return payload[:dlc].tobytes().hex(" ").upper()
+
+
 class ReceivedFramesModel(QAbstractTableModel):
 
+    # 新追加的帧中时间戳比前一帧小（例如控制器复位后），参数为第一处回退的逻辑行号
+    timestamps_went_backwards = Signal(int)
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.m_framesQueue = []  # 列表，用于存储表格模型中的 行
-        self.m_framesAccumulator = [] # 列表，用于累积 或 暂存 某些数据
+        self.m_frames = FrameStore()  # 列式存储，用于存储表格模型中的 行
+        self.m_framesAccumulator = [] # 列表，用于累积 或 暂存 接收到但尚未显示的批次（FrameBatch）
+        self.m_accumulatedFrames = 0 # m_framesAccumulator 中的帧数
         self.m_queueLimit = 0 # 用于限制 行（也就是队列 Queue）的大小
-
-
-    # 删除指定行数的数据
+        # 已格式化单元格的 LRU 缓存，键为 (帧序号, 列号)。
+        # 帧序号就是该行的"代"：环形缓冲区中同一个物理位置被新帧覆盖后序号随之改变，旧的缓存项自然失效
+        self.m_formatCache = OrderedDict()
+        self.m_formatCacheLimit = format_cache_limit
+        # 按 CAN ID 的行索引，随追加和淘汰增量维护，用于跳转到同 ID 的帧和只显示某个 ID
+        self.m_idIndex = FrameIdIndex()
+        # 时间戳回退的位置，把所有行分为若干段单调递增的区间，用于按时间二分查找
+        self.m_timeIndex = TimestampIndex()
+
+    # 删除指定行数的数据（只支持从头部删除，即 row 为 0）
     # row:要删除的行的起始索引
     # count:删除的行数
     # parent:在模型中，删除行的父索引
-    def remove_rows(self, row, count, parent):
+    def remove_rows(self, row, count, parent=QModelIndex()):
         self.beginRemoveRows(parent, row, row + count - 1) #开始删除指定行的信号
         # 发出一个信号，通知视图，一个或多个行将被删除，parent 参数表示这些行的父项，之后两个参数定义了将被删除行的范围。
         
-        self.m_framesQueue = self.m_framesQueue[0:row] + self.m_framesQueue[row + count:] #切片 左闭右开
-        # 将m_framesQueue列表 切片 为两部分，并将指定行重新赋值为m_framesQueue.这样就删除了指定的行
-        # 举个实际例子，画图就明白了，例如 row = 4, count = 3,删除row = 4开始的3行
+        self.m_frames.remove_front(count) #只会从队列头部删除（环形缓冲区），只移动头指针，其余行不动
+        self.m_idIndex.evict(count)
+        self.m_timeIndex.evict(count)
         self.endRemoveRows() #删除行的结束信号
         return True
 
@@ -105,16 +154,16 @@ class ReceivedFramesModel(QAbstractTableModel):
     # index:获取数据的索引
     # role：请求不同类型数据的角色，例如：DisplayRole、SizeHintRole等
     def data(self, index, role):
-        if not self.m_framesQueue:
+        if not self.m_frames:
             return None
         row = index.row() # 获取行号
         column = index.column() # 获取列号
         # 根据 role 值 判断请求的数据类型
         # TextAlignmentRole 返回指定列 的对齐方式，column_alignment是一个列表，存储了不同列的对齐方式。
-        # DisplayRole 返回 具体的显示数据，m_framesQueue列表中对应索引位置的数据
+        # DisplayRole 返回 具体的显示数据，由 m_frames 中对应行的原始数据格式化得到
         # 如果 role 是 clipboard_text_role，则返回剪贴板文本数据，
         #         对于特定列（ReceivedFramesModelColumns.DLC 列）返回 [数据]，否则返回原始的值。
-        
+
         # 条件表达式（也称为三元表达式）。如果column的值等于ReceivedFramesModelColumns.DLC，
         # 那么它就会返回一个字符串，该字符串包含方括号且方括号内为变量f指向的值，否则它就会直接返回f的值
 
@@ -122,21 +171,129 @@ class ReceivedFramesModel(QAbstractTableModel):
         if role == Qt.TextAlignmentRole:
             return column_alignment[index.column()]
         if role == Qt.DisplayRole:
-            return self.m_framesQueue[row][column]
+            return self.cached_cell(row, column)
         if role == clipboard_text_role:
-            f = self.m_framesQueue[row][column]
+            f = self.cached_cell(row, column)
             return f"[{f}]" if column == ReceivedFramesModelColumns.DLC else f
         return None
 
+    """
+    返回第 row 行 column 列格式化后的字符串。
+
+    只有视图真正请求的（可见的）单元格才会被格式化，结果放入有上限的 LRU 缓存，
+    滚动和重绘时不必重复格式化。
+    """
+    def cached_cell(self, row, column):
+        if row < 0 or row >= len(self.m_frames):
+            return None
+        key = (int(self.m_frames.number[self.m_frames.physical(row)]), column)
+        cache = self.m_formatCache
+        text = cache.get(key)
+        if text is not None:
+            cache.move_to_end(key)
+            return text
+        text = self.format_cell(row, column)
+        cache[key] = text
+        if len(cache) > self.m_formatCacheLimit:
+            cache.popitem(last=False) # 淘汰最久没有使用的一项
+        return text
+
+    """
+    直接从列式存储中读取第 row 行的原始数据，并格式化为 column 列要显示的字符串。
+    """
+    def format_cell(self, row, column):
+        frames = self.m_frames
+        p = frames.physical(row) # 逻辑行号 -> 环形缓冲区中的物理行号
+        if column == ReceivedFramesModelColumns.number:
+            return f"{frames.number[p]}"
+        if column == ReceivedFramesModelColumns.timestamp:
+            return format_timestamp(frames.timestamp[p])
+        if column == ReceivedFramesModelColumns.flags:
+            return format_flags(frames.flags[p])
+        if column == ReceivedFramesModelColumns.can_id:
+            return f"{frames.can_id[p]:x}"
+        if column == ReceivedFramesModelColumns.DLC:
+            return f"{frames.dlc[p]}"
+        if column == ReceivedFramesModelColumns.data:
+            if frames.flags[p] & FLAG_ERROR_FRAME:
+                text = frames.error_text(frames.number[p])
+                if text is not None:
+                    return text
+            return format_payload(frames.payload[p], frames.dlc[p])
+        return None
+
+    """
+    返回第 row 行的报文键（CAN ID 和帧格式，见 framestore.id_key），行号无效时返回 None。
+    """
+    def row_key(self, row):
+        if row < 0 or row >= len(self.m_frames):
+            return None
+        p = self.m_frames.physical(row)
+        return id_key(self.m_frames.can_id[p], self.m_frames.flags[p])
+
+    """
+    返回第 row 行的绝对位置：它是第几个被追加到模型中的帧（从 0 开始）。
+    环形缓冲区淘汰旧行后逻辑行号会变，绝对位置不变，适合保存搜索结果等长期引用。
+    """
+    def absolute_position(self, row):
+        return row + self.m_idIndex.m_evicted
+
+    """
+    返回 row 之后（forward 为 True）或之前与第 row 行同 ID 的最近一行，没有则返回 -1。
+    """
+    def find_same_id(self, row, forward=True):
+        key = self.row_key(row)
+        if key is None:
+            return -1
+        if forward:
+            return self.m_idIndex.next_row(key, row)
+        return self.m_idIndex.previous_row(key, row)
+
+    """
+    返回第 row 行的时间戳（微秒）。
+    """
+    def timestamp(self, row):
+        return int(self.m_frames.timestamp[self.m_frames.physical(row)])
+
+    """
+    返回时间戳比前一行小的所有逻辑行号，即各个单调递增区间（第一个除外）的起始行。
+    """
+    def timestamp_breaks(self):
+        return self.m_timeIndex.break_rows()
+
+    """
+    按时间定位：返回第一个时间戳 >= timestamp 的行。
+
+    时间戳不单调时（见 timestamp_breaks）依次在每个单调区间内二分查找，
+    返回第一个包含不早于 timestamp 的帧的区间中的结果；都比 timestamp 早时返回最后一行，没有数据时返回 -1。
+    """
+    def row_at_time(self, timestamp):
+        for start, stop in self.m_timeIndex.runs():
+            if self.timestamp(stop - 1) >= timestamp:
+                return self.m_frames.search_timestamp(start, stop, timestamp)
+        return len(self.m_frames) - 1
+
+    """
+    返回时间戳在 [first, last] 之内的所有行，每个单调区间最多一段，形式为 [(起始行, 结束行), ...]（含结束行）。
+    """
+    def rows_in_time_window(self, first, last):
+        result = []
+        for start, stop in self.m_timeIndex.runs():
+            begin = self.m_frames.search_timestamp(start, stop, first)
+            end = self.m_frames.search_timestamp(start, stop, last, "right")
+            if begin < end:
+                result.append((begin, end - 1))
+        return result
+
     """
     返回表格模型中的行数。
 
     参数:
     -父索引有效，则返回 0。
-    - 否则，返回 m_framesQueue 列表的长度。
+    - 否则，返回 m_frames 中的帧数。
     """
     def rowCount(self, parent=QModelIndex()):
-        return 0 if parent.isValid() else len(self.m_framesQueue)
+        return 0 if parent.isValid() else len(self.m_frames)
 
     """
     返回表格模型中的列数。
@@ -152,13 +309,21 @@ class ReceivedFramesModel(QAbstractTableModel):
         return 0 if parent.isValid() else ReceivedFramesModelColumns.count
 
     """
-    将 slvector 中的帧数据追加到 m_framesAccumulator 中。
+    将一批帧数据追加到 m_framesAccumulator 中，等到 update() 时再整批插入表格模型。
 
     参数:
-    - slvector: 帧数据序列。
+    - slvector: 列式的帧数据（FrameBatch）。
     """
     def append_frames(self, slvector):
-        self.m_framesAccumulator.extend(slvector)
+        if len(slvector):
+            self.m_framesAccumulator.append(slvector)
+            self.m_accumulatedFrames += len(slvector)
+            # 视图暂停刷新（例如窗口最小化）时 update() 可能很久不被调用，
+            # 环形缓冲区模式下丢弃肯定会被挤出队列的最旧批次，使累积的数据量保持有界
+            accumulator = self.m_framesAccumulator
+            if self.m_queueLimit:
+                while self.m_accumulatedFrames - len(accumulator[0]) >= self.m_queueLimit:
+                    self.m_accumulatedFrames -= len(accumulator.pop(0))
 
     """
     返回是否需要更新表格模型。
@@ -176,16 +341,42 @@ class ReceivedFramesModel(QAbstractTableModel):
     如果 m_framesAccumulator 中有积累的数据，则将数据追加到表格模型中，并清空 m_framesAccumulator。
 
     如果启用了队列限制（m_queueLimit 不为 0），则根据限制进行处理，添加或删除数据行。
+    超过队列限制、还没显示就会被挤出环形缓冲区的批次不会被拼接。
     """
     def update(self):
         if not self.m_framesAccumulator:
             return
-
+        with metrics.timed("model.update"):
+            batch = self._update()
+        metrics.count("frames.displayed", len(batch))
+
+        # 从接收线程读出这些帧到模型更新完成的延迟；
+        # 设备时间戳与本机时钟一致时（例如 SocketCAN），另外统计帧时间戳到显示的延迟
+        if batch.received_at is not None:
+            metrics.record("display_latency", time.perf_counter() - batch.received_at)
+        if len(batch):
+            age = time.time() - batch.timestamp[-1] / 1000000
+            if 0 <= age < 60:
+                metrics.record("frame_timestamp_latency", age)
+
+    def _update(self):
+        batches = self.m_framesAccumulator
         if self.m_queueLimit:
-            self.append_frames_ring_buffer(self.m_framesAccumulator)
+            # 从最新的批次往前数，只保留最后 m_queueLimit 帧所在的批次
+            kept = 0
+            first = len(batches)
+            while first > 0 and kept < self.m_queueLimit:
+                first -= 1
+                kept += len(batches[first])
+            batches = batches[first:]
+        batch = FrameBatch.concatenate(batches)
+        self.m_framesAccumulator = []
+        self.m_accumulatedFrames = 0
+        if self.m_queueLimit:
+            self.append_frames_ring_buffer(batch)
         else:
-            self.append_frames_unlimited(self.m_framesAccumulator)
-        self.m_framesAccumulator.clear()
+            self.append_frames_unlimited(batch)
+        return batch
 
     """
     将 slvector 中的帧数据追加到表格模型中，以环形缓冲区的方式处理。
@@ -193,55 +384,56 @@ class ReceivedFramesModel(QAbstractTableModel):
     如果帧数量超过了队列限制，根据情况移除多余的数据行。
 
     参数:
-    - slvector: 帧数据序列。
+    - slvector: 列式的帧数据（FrameBatch）。
     """
     def append_frames_ring_buffer(self, slvector):
         slvector_len = len(slvector)
-        row_count = self.rowCount()
 
-        # 如果帧数量超过队列限制，根据情况移除多余的数据行
-        if self.m_queueLimit <= row_count + slvector_len:
-            if slvector_len < self.m_queueLimit:
-                self.remove_rows(0, row_count + slvector_len - self.m_queueLimit + 1)
-            else:
-                self.clear()
-
-        # 在表格模型的末尾插入数据行
-        self.beginInsertRows(QModelIndex(), row_count, row_count + slvector_len - 1)
-        if slvector_len < self.m_queueLimit:
-            self.m_framesQueue.extend(slvector)
-        else:
-            self.m_framesQueue.extend(slvector[slvector_len - self.m_queueLimit:])
-        self.endInsertRows()
+        # 新数据本身就超过队列限制时，只保留最新的 m_queueLimit 帧
+        if slvector_len > self.m_queueLimit:
+            slvector = slvector.slice(slvector_len - self.m_queueLimit, slvector_len)
+            slvector_len = self.m_queueLimit
 
-    """
-    将单个帧数据追加到表格模型中。
+        # 如果帧数量超过队列限制，先从头部移除最旧的数据行（只移动环形缓冲区的头指针）
+        overflow = self.rowCount() + slvector_len - self.m_queueLimit
+        if overflow > 0:
+            self.remove_rows(0, overflow)
 
-    参数:
-    - slist: 单个帧数据。
-    """
-    def append_frame(self, slist):
-        self.append_frames([slist])
+        # 在表格模型的末尾插入数据行，新数据写入环形缓冲区中被释放出来的位置
+        self.insert_rows(slvector)
 
     """
     将 slvector 中的帧数据追加到表格模型中，不进行队列限制处理。
 
     参数:
-    - slvector: 帧数据序列。
+    - slvector: 列式的帧数据（FrameBatch）。
     """
     def append_frames_unlimited(self, slvector):
+        self.insert_rows(slvector)
+
+    """
+    在表格模型的末尾插入 slvector 中的帧，同时更新按 ID 的行索引和时间戳索引。
+    """
+    def insert_rows(self, slvector):
         row_count = self.rowCount()
         self.beginInsertRows(QModelIndex(), row_count, row_count + len(slvector) - 1)
-        self.m_framesQueue.extend(slvector)
+        self.m_frames.append(slvector)
+        self.m_idIndex.append(slvector)
+        backwards = self.m_timeIndex.append(slvector)
         self.endInsertRows()
+        if backwards:
+            self.timestamps_went_backwards.emit(backwards[0] - self.m_timeIndex.m_evicted)
 
     """
     清空表格模型数据。
     """
     def clear(self):
-        if self.m_framesQueue:
+        if self.m_frames:
             self.beginResetModel()
-            self.m_framesQueue.clear()
+            self.m_frames.clear()
+            self.m_idIndex.clear()
+            self.m_timeIndex.clear()
+            self.m_formatCache.clear()
             self.endResetModel()
 
     """
@@ -254,6 +446,8 @@ class ReceivedFramesModel(QAbstractTableModel):
     """
     def set_queue_limit(self, limit):
         self.m_queueLimit = limit
-        frame_queue_len = len(self.m_framesQueue)
+        frame_queue_len = len(self.m_frames)
         if limit and frame_queue_len > limit:
             self.remove_rows(0, frame_queue_len - limit)
+        # 环形缓冲区的容量就是队列限制，写满之前按需扩容，写满之后新数据覆盖最旧的数据
+        self.m_frames.set_limit(limit)
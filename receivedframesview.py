@@ -1,17 +1,37 @@
 # Copyright (C) 2022 The Qt Company Ltd.
 # SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
 
-from PySide6.QtCore import QPoint, Qt, Slot
+import re
+
+from PySide6.QtCore import QItemSelection, QItemSelectionModel, QPoint, Qt, Signal, Slot
 from PySide6.QtGui import QAction, QKeySequence
-from PySide6.QtWidgets import QApplication, QMenu, QTableView
+from PySide6.QtWidgets import QAbstractItemView, QApplication, QInputDialog, QMenu, QTableView
 # QPoint是用于表示平面上的点的类，Qt是Qt框架的核心模块，Slot是一个装饰器，用于声明一个槽函数
 # QAction是用于创建菜单、工具栏和快捷键的动作的类，QKeySequence是用于表示键盘快捷键的类。
 
-from receivedframesmodel import clipboard_text_role
+from receivedframesmodel import clipboard_text_role, format_timestamp, parse_timestamp
+from framestore import ID_KEY_ERROR, ID_KEY_EXTENDED
+from framefilterproxymodel import FrameFilterProxyModel
+from instrumentation import metrics
+
+
+# 把报文键格式化为菜单中显示的 ID，例如 "1A0"、"18FF0001 (ext)"
+def format_id_key(key):
+    text = f"{key & 0x1FFFFFFF:X}"
+    if key & ID_KEY_EXTENDED:
+        text += " (ext)"
+    if key & ID_KEY_ERROR:
+        text += " (error)"
+    return text
 
 
 class ReceivedFramesView(QTableView):
 
+    # 请求只显示某个 ID 的帧，参数为报文键；为 None 时恢复显示所有帧
+    id_filter_requested = Signal(object)
+    # 需要在状态栏中显示的消息，例如按时间定位的结果
+    status_message = Signal(str)
+
     def __init__(self, parent):
         super().__init__(parent)
         self.setContextMenuPolicy(Qt.CustomContextMenu) # 设置表格视图的上下文菜单策略为Qt.CustomContextMenu
@@ -25,6 +45,37 @@ class ReceivedFramesView(QTableView):
             copy_action.triggered.connect(self.copy_row) # 将其triggered信号连接到copy_row槽函数
             context_menu.addAction(copy_action) # 将"copy_action"添加到右键菜单context_menu中
 
+        # 按 ID 跳转和过滤，只对支持行索引的模型（滚动日志和它的代理）有效
+        model = self.model()
+        row = self.currentIndex().row()
+        key = model.row_key(row) if hasattr(model, "row_key") else None
+        id_filtered = isinstance(model, FrameFilterProxyModel) and model.key() is not None
+        if key is not None:
+            next_action = QAction("Next Frame with Same ID", self)
+            next_action.setShortcut(QKeySequence(Qt.Key_F3))
+            next_action.triggered.connect(self.next_same_id)
+            context_menu.addAction(next_action)
+            previous_action = QAction("Previous Frame with Same ID", self)
+            previous_action.setShortcut(QKeySequence(Qt.SHIFT | Qt.Key_F3))
+            previous_action.triggered.connect(self.previous_same_id)
+            context_menu.addAction(previous_action)
+            if not id_filtered:
+                only_action = QAction(f"Show Only ID {format_id_key(key)}", self)
+                only_action.triggered.connect(lambda: self.id_filter_requested.emit(key))
+                context_menu.addAction(only_action)
+        if id_filtered:
+            all_action = QAction("Show All IDs", self)
+            all_action.triggered.connect(lambda: self.id_filter_requested.emit(None))
+            context_menu.addAction(all_action)
+        if self._time_models()[1] is not None:
+            go_to_action = QAction("Go to Time...", self)
+            go_to_action.triggered.connect(self.go_to_time)
+            context_menu.addAction(go_to_action)
+            window_action = QAction("Select Time Window...", self)
+            window_action.triggered.connect(self.select_time_window)
+            context_menu.addAction(window_action)
+        context_menu.addSeparator()
+
         select_all_action = QAction("Select all", self)
         select_all_action.triggered.connect(self.selectAll)
         context_menu.addAction(select_all_action) #  将"select_all_action"添加到右键菜单context_menu中
@@ -42,6 +93,13 @@ class ReceivedFramesView(QTableView):
             size = model.headerData(i, Qt.Horizontal, Qt.SizeHintRole) # 获取标题的大小提示
             self.setColumnWidth(i, size.width()) # 设置每列的宽度
 
+    """
+    绘制事件处理函数，统计视图重绘的耗时。
+    """
+    def paintEvent(self, event):
+        with metrics.timed("view.paint"):
+            super().paintEvent(event)
+
     """
     键盘按键事件处理函数。
 
@@ -55,9 +113,123 @@ class ReceivedFramesView(QTableView):
             self.copy_row()
         elif event.matches(QKeySequence.SelectAll):
             self.selectAll()
+        elif event.key() == Qt.Key_F3:
+            self.jump_same_id(not event.modifiers() & Qt.ShiftModifier)
         else:
             super().keyPressEvent(event)
 
+    """
+    跳转到与当前行同 ID 的下一帧（forward 为 True）或上一帧，由模型的行索引直接给出行号。
+    """
+    def jump_same_id(self, forward=True):
+        model = self.model()
+        current = self.currentIndex()
+        if model is None or not current.isValid() or not hasattr(model, "find_same_id"):
+            return
+        row = model.find_same_id(current.row(), forward)
+        if row < 0:
+            QApplication.beep()
+            return
+        index = model.index(row, current.column())
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
+
+    @Slot()
+    def next_same_id(self):
+        self.jump_same_id(True)
+
+    @Slot()
+    def previous_same_id(self):
+        self.jump_same_id(False)
+
+    # 返回 (代理模型, 接收模型)：视图显示接收模型时代理为 None；模型不支持按时间查找时都为 None
+    def _time_models(self):
+        model = self.model()
+        if isinstance(model, FrameFilterProxyModel):
+            return model, model.sourceModel()
+        if hasattr(model, "row_at_time"):
+            return None, model
+        return None, None
+
+    # 当前行的时间戳文本，用作输入框的默认值
+    def _current_time_text(self):
+        proxy, model = self._time_models()
+        current = self.currentIndex()
+        if not current.isValid():
+            return ""
+        row = proxy.mapToSource(current).row() if proxy else current.row()
+        return format_timestamp(model.timestamp(row)).strip()
+
+    def _report_breaks(self, model):
+        breaks = model.timestamp_breaks()
+        if breaks:
+            self.status_message.emit(f"Timestamps go backwards {len(breaks)} time(s), first at row {breaks[0]}; "
+                                     f"each monotonic section is searched separately")
+
+    """
+    跳转到第一个时间戳不早于输入时间的帧（格式与 Timestamp 列相同，单位秒），
+    由接收模型在各个单调区间内二分查找，与行数的对数成正比。
+    """
+    @Slot()
+    def go_to_time(self):
+        proxy, model = self._time_models()
+        if model is None or not model.rowCount():
+            return
+        text, ok = QInputDialog.getText(self, "Go to Time", "Timestamp (seconds):",
+                                        text=self._current_time_text())
+        if not ok:
+            return
+        timestamp = parse_timestamp(text)
+        if timestamp is None:
+            self.status_message.emit(f"Invalid timestamp '{text}'")
+            return
+        row = model.row_at_time(timestamp)
+        if proxy is not None:
+            row = min(proxy.lower_bound(row), proxy.rowCount() - 1)
+        if row < 0:
+            return
+        column = max(self.currentIndex().column(), 0)
+        index = self.model().index(row, column)
+        self.setCurrentIndex(index)
+        self.scrollTo(index, QAbstractItemView.PositionAtCenter)
+        self._report_breaks(model)
+
+    """
+    选中时间戳在 [T1, T2] 之内的所有帧，输入格式为 "T1 T2" 或 "T1 - T2"。
+    """
+    @Slot()
+    def select_time_window(self):
+        proxy, model = self._time_models()
+        if model is None or not model.rowCount():
+            return
+        current = self._current_time_text()
+        text, ok = QInputDialog.getText(self, "Select Time Window", "From - to (seconds):",
+                                        text=f"{current} - {current}" if current else "")
+        if not ok:
+            return
+        times = [parse_timestamp(part) for part in re.findall(r"\d+(?:\.\d*)?", text)]
+        if len(times) != 2 or None in times:
+            self.status_message.emit(f"Invalid time window '{text}'")
+            return
+        first, last = sorted(times)
+        selection = QItemSelection()
+        last_column = self.model().columnCount() - 1
+        count = 0
+        for begin, end in model.rows_in_time_window(first, last):
+            if proxy is not None:
+                begin, end = proxy.lower_bound(begin), proxy.lower_bound(end + 1) - 1
+            if begin <= end:
+                selection.select(self.model().index(begin, 0), self.model().index(end, last_column))
+                count += end - begin + 1
+        self.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        if count:
+            top = selection.first().topLeft()
+            self.selectionModel().setCurrentIndex(top, QItemSelectionModel.NoUpdate)
+            self.scrollTo(top, QAbstractItemView.PositionAtTop)
+        self.status_message.emit(f"{count} frames between {format_timestamp(first).strip()} "
+                                 f"and {format_timestamp(last).strip()}")
+        self._report_breaks(model)
+
     """
     复制选中行的内容到剪贴板。(复制选中的行的内容 并 粘贴到 其他地方)
     """
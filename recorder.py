@@ -0,0 +1,279 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+import struct
+from threading import Condition, Thread
+from time import monotonic, time
+
+import numpy as np
+
+from framestore import MAX_PAYLOAD_FD, FrameBatch
+from instrumentation import metrics
+
+# 磁盘记录器：把接收到的每一帧追加到日志文件中，与模型的环形缓冲区大小无关。
+# 默认写入下面的紧凑二进制格式，也可以换成其它编码器（见 logcodecs 中的 candump 和 ASC 格式）。
+#
+# 二进制格式（小端）：
+#   文件头 HEADER_SIZE 字节：魔数 "CANLOG\r\n"、版本、每条记录的字节数、保留字段、开始记录的时间（Unix 微秒）
+#   之后是定长记录 RECORD_DTYPE，每帧 78 字节：时间戳（微秒）、ID、标志位（见 framestore）、DLC、64 字节有效载荷
+# 记录是定长的，第 i 帧位于 HEADER_SIZE + i * 78，可以直接用 numpy.memmap 打开（见 open_log）。
+# 帧序号就是记录的下标加一，不单独保存；错误帧的解释文本可以由有效载荷重新得到，也不保存。
+#
+# 接收线程只调用 record()：在锁内把批次（FrameBatch）的引用追加到前台列表，与批次的大小无关，不做任何拷贝或 IO。
+# 写线程把前台列表和后台列表交换（双缓冲），在锁外用编码器把后台的批次逐批编码后写入文件，
+# 再按 fsync 策略同步到磁盘。写线程跟不上时前台最多积累 max_buffered 帧，超过后丢弃新的帧并计数，
+# 绝不阻塞接收线程。
+
+LOG_MAGIC = b"CANLOG\r\n"
+LOG_VERSION = 1
+_HEADER = struct.Struct("<8sHHIq")
+HEADER_SIZE = _HEADER.size
+
+RECORD_DTYPE = np.dtype([("timestamp", "<i8"), ("can_id", "<u4"), ("flags", "u1"),
+                         ("dlc", "u1"), ("payload", "u1", (MAX_PAYLOAD_FD,))])
+
+FLUSH_INTERVAL = 0.2  # 写线程最长的写入间隔，单位秒
+WRITE_FRAMES = 16384  # 前台积累到这么多帧时提前唤醒写线程
+MAX_BUFFERED_FRAMES = 2000000  # 前台最多积累的帧数，约 150 MB
+
+# fsync 策略
+FSYNC_NEVER = "never"  # 只写入操作系统的缓存，由操作系统决定何时落盘
+FSYNC_INTERVAL = "interval"  # 每隔 fsync_interval 秒 fsync 一次
+FSYNC_ALWAYS = "always"  # 每次写入后都 fsync
+
+
+class LogFormatError(ValueError):
+    pass
+
+
+# 把一批帧转换为记录数组；out 为预先分配的记录数组时写入 out 并返回它
+def batch_to_records(batch, out=None):
+    records = np.empty(len(batch), RECORD_DTYPE) if out is None else out
+    records["timestamp"] = batch.timestamp
+    records["can_id"] = batch.can_id
+    records["flags"] = batch.flags
+    records["dlc"] = batch.dlc
+    records["payload"] = batch.payload
+    return records
+
+
+# 把记录数组（例如 open_log 返回的 memmap 的切片）转换为 FrameBatch，first_number 为第一帧的序号
+def records_to_batch(records, first_number):
+    count = len(records)
+    return FrameBatch(np.arange(first_number, first_number + count, dtype=np.int64),
+                      np.array(records["timestamp"], np.int64), np.array(records["can_id"], np.uint32),
+                      np.array(records["flags"], np.uint8), np.array(records["dlc"], np.uint8),
+                      np.ascontiguousarray(records["payload"]))
+
+
+def read_header(f):
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise LogFormatError("file is too short")
+    magic, version, record_size, _, start_time = _HEADER.unpack(data)
+    if magic != LOG_MAGIC:
+        raise LogFormatError("not a CAN log file")
+    if version != LOG_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise LogFormatError(f"unsupported log version {version}")
+    return {"version": version, "record_size": record_size, "start_time": start_time}
+
+
+# 以只读 memmap 的方式打开日志文件，返回 (文件头, 记录数组)。
+# 文件末尾不完整的记录（例如记录过程中断电）被忽略
+def open_log(file_name):
+    with open(file_name, "rb") as f:
+        header = read_header(f)
+    count = (os.path.getsize(file_name) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if not count:
+        return header, np.empty(0, RECORD_DTYPE)
+    return header, np.memmap(file_name, RECORD_DTYPE, "r", HEADER_SIZE, (count,))
+
+
+class BinaryLogEncoder():
+    """二进制日志格式的编码器。
+
+    编码器的接口：begin() 返回文件开头的内容，encode(batch) 返回一批帧编码后的内容，
+    end() 返回文件结尾的内容，都是 bytes 或支持缓冲区协议的对象。编码器只在写线程中使用。
+    需要在结束时改写文件头的编码器（例如 blf.BlfEncoder）还可以提供 finish(file)，在 end() 的内容写入后调用。
+    """
+
+    def begin(self):
+        return _HEADER.pack(LOG_MAGIC, LOG_VERSION, RECORD_DTYPE.itemsize, 0, int(time() * 1000000))
+
+    def encode(self, batch):
+        return batch_to_records(batch).view(np.uint8)
+
+    def end(self):
+        return b""
+
+
+class LogRecorder():
+    """把帧写入日志文件的记录器，编码和写文件在自己的线程中进行。
+
+    record() 可以在任何线程中调用（通常是接收线程），start()/stop()/statistics() 在 GUI 线程中调用。
+    """
+
+    def __init__(self, file_name, encoder=None, fsync=FSYNC_INTERVAL, fsync_interval=1.0,
+                 flush_interval=FLUSH_INTERVAL, max_buffered=MAX_BUFFERED_FRAMES):
+        self.m_fileName = file_name
+        self.m_encoder = encoder if encoder is not None else BinaryLogEncoder()
+        self.m_fsync = fsync
+        self.m_fsyncInterval = fsync_interval
+        self.m_flushInterval = flush_interval
+        self.m_maxBuffered = max_buffered
+        self.m_file = None
+        self.m_thread = None
+        self.m_lastSync = 0.0  # 上次 fsync 的时间，只在写线程中使用
+
+        # 以下成员由 m_condition 的锁保护
+        self.m_condition = Condition()
+        self.m_front = []  # 接收线程正在追加的批次
+        self.m_frontFrames = 0
+        self.m_stopping = False
+        self.m_droppedFrames = 0
+        self.m_writtenFrames = 0
+        self.m_writtenBytes = 0
+        self.m_error = ""
+
+    def file_name(self):
+        return self.m_fileName
+
+    # 创建文件并写入文件头，启动写线程；文件无法创建时抛出 OSError
+    def start(self):
+        self.m_writtenBytes = self._open()
+        self.m_thread = Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self.m_thread.start()
+
+    # 写完已经收到的帧后关闭文件，返回最终的统计
+    def stop(self):
+        with self.m_condition:
+            self.m_stopping = True
+            self.m_condition.notify()
+        if self.m_thread is not None:
+            self.m_thread.join()
+            self.m_thread = None
+        return self.statistics()
+
+    # 记录一批帧，只在锁内追加引用，不会阻塞调用者
+    def record(self, batch):
+        count = len(batch)
+        if not count:
+            return
+        with self.m_condition:
+            if self.m_stopping:
+                if self.m_error:
+                    # 写线程出错后记录器仍然挂在接收线程上，直到用户停止记录；这些帧没有记录，计为丢弃
+                    self.m_droppedFrames += count
+                    metrics.count("recorder.dropped", count)
+                return
+            if self.m_frontFrames + count > self.m_maxBuffered:
+                self.m_droppedFrames += count
+                metrics.count("recorder.dropped", count)
+                return
+            self.m_front.append(batch)
+            self.m_frontFrames += count
+            if self.m_frontFrames >= WRITE_FRAMES:
+                self.m_condition.notify()
+
+    def statistics(self):
+        with self.m_condition:
+            return {"file": self.m_fileName,
+                    "written": self.m_writtenFrames,
+                    "bytes": self.m_writtenBytes,
+                    "buffered": self.m_frontFrames,
+                    "dropped": self.m_droppedFrames,
+                    "error": self.m_error}
+
+    # 无缓冲的文件对象一次 write() 可能只写入一部分；返回写入的字节数
+    def _write_all(self, data):
+        view = memoryview(data).cast("B")
+        size = len(view)
+        while len(view):
+            view = view[self.m_file.write(view):]
+        return size
+
+    # 以下几个方法是写入目标的实现，写到别处的记录器（例如 capturedb.SqliteRecorder）改写它们，
+    # 出错时抛出异常（通常是 OSError），写线程捕获任何异常后停止记录。_open() 在 start() 中调用，其它的在写线程中调用
+
+    # 打开目标，返回写入的字节数
+    def _open(self):
+        self.m_file = open(self.m_fileName, "wb", buffering=0)
+        try:
+            return self._write_all(self.m_encoder.begin())
+        except OSError:
+            self.m_file.close()
+            raise
+
+    # 写入一组批次，按 fsync 策略同步，返回写入的字节数
+    def _write(self, batches):
+        written = 0
+        for batch in batches:
+            written += self._write_all(self.m_encoder.encode(batch))
+        now = monotonic()
+        if self.m_fsync == FSYNC_ALWAYS or \
+                (self.m_fsync == FSYNC_INTERVAL and now - self.m_lastSync >= self.m_fsyncInterval):
+            os.fsync(self.m_file.fileno())
+            self.m_lastSync = now
+        return written
+
+    # 没有新的帧时写线程每 flush_interval 秒调用一次，例如用于按时间关闭文件。返回写入的字节数
+    def _idle(self):
+        return 0
+
+    # 结束记录并关闭目标；ok 为 False 时写入已经出错，只关闭。返回写入的字节数
+    def _close(self, ok):
+        try:
+            if not ok:
+                return 0
+            written = self._write_all(self.m_encoder.end())
+            if hasattr(self.m_encoder, "finish"):
+                self.m_encoder.finish(self.m_file)
+            if self.m_fsync != FSYNC_NEVER:
+                os.fsync(self.m_file.fileno())
+            return written
+        finally:
+            self.m_file.close()
+
+    # 写线程
+    def _run(self):
+        back = []
+        self.m_lastSync = monotonic()
+        stopping = False
+        while not stopping:
+            with self.m_condition:
+                self.m_condition.wait_for(lambda: self.m_stopping or self.m_frontFrames >= WRITE_FRAMES,
+                                          self.m_flushInterval)
+                # 交换前后台，接收线程接着往空的列表中追加
+                self.m_front, back = back, self.m_front
+                count = self.m_frontFrames
+                self.m_frontFrames = 0
+                stopping = self.m_stopping
+            try:
+                if not count:
+                    written = self._idle()
+                else:
+                    with metrics.timed("recorder.write"):
+                        written = self._write(back)
+            except Exception as e:
+                # 例如磁盘已满或者编码出错：停止记录，由 GUI 线程通过 statistics() 显示错误
+                with self.m_condition:
+                    self.m_error = str(e) or type(e).__name__
+                    self.m_stopping = True
+                    self.m_droppedFrames += count + self.m_frontFrames
+                    self.m_front.clear()
+                    self.m_frontFrames = 0
+                break
+            finally:
+                back.clear()
+            metrics.count("recorder.frames", count)
+            with self.m_condition:
+                self.m_writtenFrames += count
+                self.m_writtenBytes += written
+        try:
+            written = self._close(not self.m_error)
+            with self.m_condition:
+                self.m_writtenBytes += written
+        except Exception as e:
+            with self.m_condition:
+                self.m_error = str(e) or type(e).__name__
@@ -0,0 +1,120 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from time import perf_counter
+
+from PySide6.QtCore import QObject, QTimer, Slot
+
+# 自适应的界面刷新调度器，替代固定 350 ms 的追加定时器。
+#
+# - 没有新帧时不刷新，定时器停止；新帧到达后最多等 min_interval 就刷新一次，
+#   这段时间内到达的其它帧合并到同一次刷新中（突发合并）。
+# - 每次刷新都测量回调（模型更新 + 视图滚动）的耗时和这次合并的帧数，把刷新代价估计为
+#   固定代价 + 每帧代价 * 帧数（对最近的刷新做指数加权的线性回归）。
+#   间隔为 T 毫秒、帧速率为 rate 时，一次刷新合并 rate * T / 1000 帧，占用 GUI 线程的比例为
+#   (固定代价 + 每帧代价 * rate * T / 1000) / T，取使它不超过 frame_budget 的最短间隔：
+#   T = 固定代价 / (frame_budget - 每帧代价 * rate / 1000)。
+#   拉长间隔只能摊薄固定代价，所以刷新便宜时即使总线满载也保持 min_interval；
+#   每帧代价 * rate 本身就超过 frame_budget 时（GUI 线程跟不上），间隔为 max_interval，每次刷新合并尽量多的帧。
+# - 窗口隐藏或最小化时 suspend()，完全停止刷新视图，接收和累积照常进行；resume() 后立即刷新一次。
+
+DEFAULT_FRAME_BUDGET = 0.25  # 刷新最多占用 GUI 线程 25% 的时间
+DEFAULT_MIN_INTERVAL = 30  # 毫秒
+DEFAULT_MAX_INTERVAL = 1000  # 毫秒
+COST_SMOOTHING = 0.2  # 刷新代价的指数移动平均系数
+
+
+class RefreshScheduler(QObject):
+
+    def __init__(self, callback, parent=None, frame_budget=DEFAULT_FRAME_BUDGET,
+                 min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        super().__init__(parent)
+        self.m_callback = callback
+        self.m_frameBudget = frame_budget
+        self.m_minInterval = min_interval
+        self.m_maxInterval = max_interval
+        self.m_suspended = False
+        self.m_pendingFrames = 0  # 上次刷新后到达的帧数
+        self.m_cost = 0.0  # 刷新代价的移动平均值，单位毫秒
+        # 刷新代价对帧数的回归用到的指数加权矩：帧数、帧数的平方、帧数 * 代价
+        self.m_frames = 0.0
+        self.m_framesSquared = 0.0
+        self.m_framesCost = 0.0
+        self.m_rate = 0.0  # 最近一次刷新周期内的帧速率，帧/秒
+        self.m_lastRefresh = perf_counter()
+
+        self.m_timer = QTimer(self)
+        self.m_timer.setSingleShot(True)
+        self.m_timer.timeout.connect(self._refresh)
+
+    def set_frame_budget(self, frame_budget):
+        self.m_frameBudget = frame_budget
+
+    def frame_budget(self):
+        return self.m_frameBudget
+
+    # 刷新代价的估计 (固定代价毫秒, 每帧代价毫秒)。帧数没有变化、无法区分两者时全部算作固定代价
+    def cost_model(self):
+        variance = self.m_framesSquared - self.m_frames * self.m_frames
+        if variance <= 1e-6 * self.m_framesSquared:
+            return self.m_cost, 0.0
+        per_frame = (self.m_framesCost - self.m_frames * self.m_cost) / variance
+        per_frame = min(max(per_frame, 0.0), self.m_cost / self.m_frames)
+        return self.m_cost - per_frame * self.m_frames, per_frame
+
+    # 下一次刷新的间隔（毫秒）：按当前帧速率预计的刷新代价不超过 frame_budget 的最短间隔
+    def interval(self):
+        fixed, per_frame = self.cost_model()
+        spare = self.m_frameBudget - per_frame * self.m_rate / 1000
+        wanted = fixed / spare if spare > 0 else self.m_maxInterval
+        return round(min(max(wanted, self.m_minInterval), self.m_maxInterval))
+
+    # 返回调度器的当前状态，用于显示和调试
+    def statistics(self):
+        fixed, per_frame = self.cost_model()
+        return {"interval_ms": self.interval(), "cost_ms": round(self.m_cost, 3),
+                "fixed_cost_ms": round(fixed, 3), "frame_cost_us": round(per_frame * 1000, 3),
+                "frame_rate": round(self.m_rate, 1), "suspended": self.m_suspended}
+
+    # 通知调度器有 count 帧到达；如果还没有安排刷新，就安排一次
+    def frames_arrived(self, count):
+        self.m_pendingFrames += count
+        if not self.m_suspended and not self.m_timer.isActive():
+            self.m_timer.start(self.interval())
+
+    def suspend(self):
+        self.m_suspended = True
+        self.m_timer.stop()
+
+    def resume(self):
+        if not self.m_suspended:
+            return
+        self.m_suspended = False
+        if self.m_pendingFrames:
+            self.m_timer.start(0)
+
+    def is_suspended(self):
+        return self.m_suspended
+
+    # 记录一次合并了 frames 帧、耗时 cost 毫秒的刷新
+    def record_cost(self, frames, cost):
+        self.m_cost += COST_SMOOTHING * (cost - self.m_cost)
+        self.m_frames += COST_SMOOTHING * (frames - self.m_frames)
+        self.m_framesSquared += COST_SMOOTHING * (frames * frames - self.m_framesSquared)
+        self.m_framesCost += COST_SMOOTHING * (frames * cost - self.m_framesCost)
+
+    @Slot()
+    def _refresh(self):
+        now = perf_counter()
+        elapsed = now - self.m_lastRefresh
+        self.m_rate = self.m_pendingFrames / elapsed if elapsed > 0 else 0.0
+        self.m_lastRefresh = now
+        frames = self.m_pendingFrames
+        self.m_pendingFrames = 0
+
+        self.m_callback()
+        self.record_cost(frames, (perf_counter() - now) * 1000)
+
+        # 刷新期间又有新帧到达时，按新的间隔安排下一次刷新；否则定时器保持停止
+        if self.m_pendingFrames and not self.m_suspended:
+            self.m_timer.start(self.interval())
@@ -0,0 +1,243 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from collections import deque
+from threading import Condition, Thread
+from time import perf_counter, sleep
+
+import numpy as np
+
+from framereader import batch_to_frames
+from framestore import FLAG_ERROR_FRAME
+from instrumentation import LatencyHistogram, metrics
+from logcodecs import read_log_file
+
+# 日志回放：把日志文件中的帧按原来的帧间隔重新发送到已连接的设备上，用于在台架上复现现场的问题。
+#
+# 调度在自己的线程（threading.Thread）中进行。每一帧的发送时刻 = 开始时刻 + 相对于第一帧的时间偏移 / speed，
+# speed 为 1 时按原速，为 N 时按 N 倍速，为 0 时不等待，尽可能快地发送。
+# 离发送时刻还远时线程睡眠（并利用这段空闲把后面的帧转换为 QCanBusFrame，每次只转换空闲时间内来得及转换的帧数），
+# 最后 SPIN_TIME 秒内忙等，
+# 忙等时每次循环都调用 sleep(0) 让出 GIL，不会拖慢接收线程和 GUI 线程。
+#
+# 设备由接收线程拥有（见 framereader），到时间的帧通过 FrameReader.write_frames() 交给接收线程写出。
+# writeFrame() 只是把帧放入后端的发送队列，设备报告 framesWritten 时帧才真正发送；接收线程把其中属于回放的帧
+# 交还给回放器（发送框和周期发送的帧不算在内），这时的时刻与要求的发送时刻之差就是定时误差。
+# 背压：已交给接收线程但设备还没有报告发送的帧数达到 MAX_IN_FLIGHT 时，调度线程等待；
+# 接收线程也在后端的发送队列（包括其它来源的帧）达到 MAX_IN_FLIGHT 帧时暂停写出回放的帧，
+# 尽快发送时不会把后端的发送队列塞满。因此而推迟的帧会计入定时误差。
+#
+# 时间戳回退（见 frameindex.TimestampIndex）的地方按间隔为 0 处理。错误帧不能发送，跳过并计数。
+# 设备拒绝写入某一帧（例如发送队列已满或设备已断开）时停止回放。
+
+SPIN_TIME = 0.002  # 离发送时刻不到这么多秒时忙等
+MAX_IN_FLIGHT = 256  # 已交给接收线程但还没有发送的帧数上限，也是后端发送队列的上限
+SEND_GROUP = 64  # 每次交给接收线程的最多帧数
+LOOKAHEAD = 4096  # 提前转换好的帧数
+PREPARE_FRAMES = 256  # 每次转换的最多帧数
+MIN_PREPARE = 16  # 空闲时间只够转换更少的帧时不转换
+LATE_THRESHOLD = 0.001  # 定时误差超过这么多秒的帧计为迟到
+DRAIN_TIMEOUT = 2.0  # 回放结束后等待设备发送完最后的帧的最长时间
+
+
+class LogReplayer():
+    """按原来的时间间隔把日志文件中的帧写到设备上的回放器。
+
+    start()/stop()/statistics() 在 GUI 线程中调用，写出的结果由接收线程回调。
+    """
+
+    def __init__(self, file_name, reader, speed=1.0):
+        self.m_fileName = file_name
+        self.m_reader = reader
+        self.m_speed = speed
+        self.m_thread = None
+        self.m_ready = deque()  # 已转换的帧：(相对于第一帧的偏移秒数, QCanBusFrame)
+        self.m_batches = None  # read_log_file() 返回的生成器，只在调度线程中使用
+        self.m_batch = None  # 正在转换的批次
+        self.m_position = 0
+        self.m_lastTimestamp = None
+        self.m_offset = 0  # 下一帧相对于第一帧的偏移，单位微秒
+        self.m_prepareCost = 0.00002  # 转换一帧的平均耗时（秒），用于估计空闲时间内能转换多少帧
+
+        # 以下成员由 m_condition 的锁保护
+        self.m_condition = Condition()
+        self.m_stopping = False
+        self.m_running = False
+        self.m_handed = 0  # 交给接收线程的帧数
+        self.m_sent = 0  # 设备报告已经发送的帧数
+        self.m_dues = deque()  # 已交给接收线程、还没有发送的帧的发送时刻，按顺序
+        self.m_failed = 0  # 设备拒绝或设备已断开而没有写出的帧数
+        self.m_skipped = 0  # 跳过的错误帧
+        self.m_late = 0
+        self.m_errors = LatencyHistogram()  # 定时误差的分布
+        self.m_startTime = 0.0
+        self.m_lastSent = 0.0
+        self.m_requested = 0.0  # 已发送的帧按要求应占用的时间
+        self.m_error = ""
+
+    def file_name(self):
+        return self.m_fileName
+
+    def speed(self):
+        return self.m_speed
+
+    def start(self):
+        self.m_running = True
+        self.m_thread = Thread(target=self._run, name="LogReplayer", daemon=True)
+        self.m_thread.start()
+
+    # 停止回放并等待调度线程结束，返回最终的统计
+    def stop(self):
+        with self.m_condition:
+            self.m_stopping = True
+            self.m_condition.notify()
+        if self.m_thread is not None:
+            self.m_thread.join()
+            self.m_thread = None
+        return self.statistics()
+
+    def is_running(self):
+        with self.m_condition:
+            return self.m_running
+
+    def _in_flight(self):
+        return max(self.m_handed - self.m_sent - self.m_failed, 0)
+
+    def statistics(self):
+        with self.m_condition:
+            elapsed = (self.m_lastSent - self.m_startTime) if self.m_sent else 0.0
+            return {"file": self.m_fileName,
+                    "speed": self.m_speed,
+                    "running": self.m_running,
+                    "sent": self.m_sent,
+                    "skipped": self.m_skipped,
+                    "failed": self.m_failed,
+                    "in_flight": self._in_flight(),
+                    "requested_s": round(self.m_requested, 6),
+                    "elapsed_s": round(elapsed, 6),
+                    "rate_fps": round(self.m_sent / elapsed) if elapsed > 0 else 0,
+                    "late": self.m_late,
+                    "timing_error": self.m_errors.snapshot(),
+                    "error": self.m_error}
+
+    # 从日志中再转换最多 count 帧放入 m_ready，日志已经读完时返回 False
+    def _prepare(self, count):
+        started = perf_counter()
+        while True:
+            if self.m_batch is not None and self.m_position < len(self.m_batch):
+                break
+            self.m_batch = next(self.m_batches, None)
+            self.m_position = 0
+            if self.m_batch is None:
+                return False
+        batch = self.m_batch.slice(self.m_position, self.m_position + count)
+        self.m_position += len(batch)
+        # 每一帧相对于第一帧的偏移：累加帧间隔，回退的间隔按 0 计算
+        timestamps = batch.timestamp
+        previous = timestamps[0] if self.m_lastTimestamp is None else self.m_lastTimestamp
+        gaps = np.maximum(np.diff(timestamps, prepend=previous), 0)
+        offsets = self.m_offset + np.cumsum(gaps)
+        self.m_offset = int(offsets[-1])
+        self.m_lastTimestamp = int(timestamps[-1])
+        sendable = (batch.flags & FLAG_ERROR_FRAME) == 0
+        skipped = len(batch) - int(sendable.sum())
+        if skipped:
+            with self.m_condition:
+                self.m_skipped += skipped
+            batch = batch.select(sendable)
+            offsets = offsets[sendable]
+        self.m_ready.extend(zip((offsets / 1000000).tolist(), batch_to_frames(batch)))
+        self.m_prepareCost += 0.2 * ((perf_counter() - started) / count - self.m_prepareCost)
+        return True
+
+    # 调度线程
+    def _run(self):
+        try:
+            self.m_batches = read_log_file(self.m_fileName)
+            self._schedule()
+        except (OSError, ValueError) as e:
+            with self.m_condition:
+                self.m_error = str(e)
+        finally:
+            if self.m_batches is not None:
+                self.m_batches.close()
+            # 等待设备发送完已经交给它的帧
+            with self.m_condition:
+                self.m_condition.wait_for(lambda: self.m_stopping or not self._in_flight(), DRAIN_TIMEOUT)
+                self.m_running = False
+
+    def _schedule(self):
+        ready = self.m_ready
+        speed = self.m_speed
+        start = None
+        while True:
+            while not ready: # 一段日志可能全是错误帧
+                if not self._prepare(PREPARE_FRAMES):
+                    return
+            if start is None:
+                start = perf_counter()
+                with self.m_condition:
+                    self.m_startTime = start
+            due = start + ready[0][0] / speed if speed > 0 else perf_counter()
+            wait = due - perf_counter()
+            if wait > SPIN_TIME:
+                # 离发送时刻还远：先利用空闲转换后面的帧，没有可做的再睡眠
+                count = min(int((wait - SPIN_TIME) / self.m_prepareCost), PREPARE_FRAMES)
+                if len(ready) < LOOKAHEAD and count >= MIN_PREPARE and self._prepare(count):
+                    continue
+                with self.m_condition:
+                    if self.m_condition.wait_for(lambda: self.m_stopping, wait - SPIN_TIME):
+                        return
+                continue
+            while perf_counter() < due:
+                sleep(0) # 让出 GIL
+            with self.m_condition:
+                self.m_condition.wait_for(lambda: self.m_stopping or self._in_flight() < MAX_IN_FLIGHT)
+                if self.m_stopping:
+                    return
+                room = min(MAX_IN_FLIGHT - self._in_flight(), SEND_GROUP)
+            # 取出所有已经到时间的帧（落后时一次多交几帧）
+            now = perf_counter()
+            dues = []
+            frames = []
+            while ready and len(frames) < room:
+                frame_due = start + ready[0][0] / speed if speed > 0 else now
+                if frame_due > now:
+                    break
+                dues.append(frame_due)
+                frames.append(ready.popleft()[1])
+                if not ready and len(frames) < room and not self._prepare(PREPARE_FRAMES):
+                    break
+            with self.m_condition:
+                self.m_handed += len(frames)
+                self.m_dues.extend(dues)
+            self.m_reader.write_frames(frames, lambda times, count=len(frames): self._frames_queued(count, times),
+                                       self._frames_written, MAX_IN_FLIGHT)
+
+    # 接收线程中调用：一次请求的 count 帧中前 len(times) 帧进入了后端的发送队列，其余的被设备拒绝
+    def _frames_queued(self, count, times):
+        if len(times) == count:
+            return
+        with self.m_condition:
+            self.m_failed += count - len(times)
+            self.m_error = "the device did not accept a frame"
+            self.m_stopping = True
+            self.m_dues.clear()  # 被拒绝的帧之后的发送时刻对不上了，不再计算定时误差
+            self.m_condition.notify()
+
+    # 接收线程中调用：设备在 time 时刻报告又发送了 count 帧回放的帧
+    def _frames_written(self, count, time):
+        with self.m_condition:
+            self.m_sent += count
+            self.m_lastSent = time
+            dues = self.m_dues
+            for _ in range(min(count, len(dues))):
+                due = dues.popleft()
+                if self.m_speed > 0:
+                    self.m_requested = due - self.m_startTime
+                    error = time - due
+                    self.m_errors.record(error)
+                    if error > LATE_THRESHOLD:
+                        self.m_late += 1
+            self.m_condition.notify()
+        metrics.count("replay.frames", count)
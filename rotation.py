@@ -0,0 +1,322 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from time import monotonic, time
+
+from logcodecs import encoder_for_file
+from recorder import LogRecorder
+
+# 分段记录：无人值守的长时间记录按大小或时间切换到新的日志文件（段），旧的段在后台压缩，总占用超过上限时删除最旧的段。
+#
+# 用户选择的文件名 "capture.canlog" 作为基本名，段依次为 "capture-00001.canlog"、"capture-00002.canlog"……
+# 当前段写入的字节数达到 max_bytes，或者打开已经超过 interval 秒时，写线程在下一次写入之前关闭当前段并打开新的段。
+# 总线空闲时写线程不写入，也就不切换。
+#
+# 关闭的段交给进程池用 gzip 压缩为 "<段>.gz"，压缩完成后删除原文件。压缩在其它进程中进行，不与接收线程争夺 GIL；
+# 进程池用 spawn 方式启动，不会 fork 带有 Qt 线程的 GUI 进程。BLF 和 Parquet 格式本身已经压缩，不再压缩。
+# logcodecs.read_log_file() 可以直接读取压缩后的段。
+#
+# 清单 "capture.manifest.json" 列出所有的段：文件名、状态、帧数、字节数和帧的时间范围（Unix 微秒），
+# 按时间查找时先用 segments_in_time_window() 选出时间范围相交的段，只打开这些段。
+# 清单只由写线程更新（打开新段、压缩完成、删除段时，以及正在记录的段有新的帧时每 MANIFEST_INTERVAL 秒一次），
+# 写入临时文件后改名，读取者看到的总是完整的清单。记录中断（例如断电）时清单中正在记录的段最多落后这么多秒。
+# 再次用同一个基本名记录时按磁盘上实际的文件核对清单：已经压缩完成的段改为 .gz，文件已经不存在的段从清单中去掉，
+# 压缩被中断的段重新压缩。
+#
+# 保留策略：所有段的大小（已压缩的段按压缩后的大小）之和超过 max_total_bytes 时，从最旧的段开始删除，
+# 正在记录和正在压缩的段不删除。正在压缩的段按已经压缩完的段的压缩比估计压缩后的大小，
+# 不会为了压缩马上就会腾出来的空间删除旧的段；还没有任何段压缩完、不知道压缩比时，有段正在压缩就先不删除，
+# 等压缩完成后（_collect）再按实际大小检查。
+
+MANIFEST_SUFFIX = ".manifest.json"
+COMPRESSED_SUFFIX = ".gz"
+COMPRESSION_LEVEL = 6
+COMPRESSION_WORKERS = 1
+MANIFEST_INTERVAL = 5.0  # 正在记录的段有新的帧时保存清单的间隔，单位秒
+UNCOMPRESSED_FORMATS = (".blf", ".parquet")  # 本身已经压缩的格式
+
+# 段的状态
+SEGMENT_RECORDING = "recording"
+SEGMENT_COMPRESSING = "compressing"
+SEGMENT_CLOSED = "closed"
+
+
+def manifest_name(file_name):
+    return os.path.splitext(file_name)[0] + MANIFEST_SUFFIX
+
+
+# 在进程池中执行：把 file_name 压缩为 file_name.gz，成功后删除原文件，返回压缩后的字节数
+def compress_segment(file_name, level=COMPRESSION_LEVEL):
+    temporary = file_name + COMPRESSED_SUFFIX + ".tmp"
+    with open(file_name, "rb") as source, gzip.open(temporary, "wb", compresslevel=level) as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+    os.replace(temporary, file_name + COMPRESSED_SUFFIX)
+    os.remove(file_name)
+    return os.path.getsize(file_name + COMPRESSED_SUFFIX)
+
+
+def load_manifest(file_name):
+    with open(file_name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 返回清单中可能含有时间戳在 [first, last] 之内的帧的段，文件名为相对于清单所在目录的名字
+def segments_in_time_window(manifest, first, last):
+    return [segment for segment in manifest["segments"]
+            if segment["frames"] and segment["first_timestamp"] <= last and segment["last_timestamp"] >= first]
+
+
+class RotatingRecorder(LogRecorder):
+    """分段记录的记录器，接口与 LogRecorder 相同，每段的格式由基本名的扩展名决定（见 logcodecs.encoder_for_file）。
+
+    max_bytes、interval 和 max_total_bytes 为 0 时不按这一项切换或删除。
+    """
+
+    def __init__(self, file_name, max_bytes=0, interval=0.0, max_total_bytes=0, compress=True, **kwargs):
+        super().__init__(file_name, **kwargs)
+        self.m_maxBytes = max_bytes
+        self.m_interval = interval
+        self.m_maxTotalBytes = max_total_bytes
+        base, self.m_extension = os.path.splitext(file_name)
+        self.m_base = base
+        self.m_compress = compress and self.m_extension.lower() not in UNCOMPRESSED_FORMATS
+        self.m_pool = None
+        self.m_pending = {}  # 正在压缩的段 -> Future
+
+        # 以下成员只在写线程中使用（start() 之后）
+        self.m_segments = []  # 清单中的段，最后一个是正在记录的段
+        self.m_index = 0
+        self.m_opened = 0.0
+        self.m_compressedFrom = 0  # 已压缩的段压缩前和压缩后的字节数，用于估计压缩比
+        self.m_compressedTo = 0
+        self.m_manifestSaved = 0.0  # 上次保存清单的时间
+        self.m_manifestDirty = False  # 正在记录的段在上次保存清单之后有新的帧
+
+        # 以下成员由 m_condition 的锁保护，供 statistics() 读取
+        self.m_segmentName = ""
+        self.m_segmentCount = 0
+        self.m_compressing = 0
+        self.m_compressError = ""
+        self.m_deleted = 0
+
+    def manifest_name(self):
+        return manifest_name(self.m_fileName)
+
+    def statistics(self):
+        stats = super().statistics()
+        with self.m_condition:
+            stats.update(segment=self.m_segmentName, segments=self.m_segmentCount,
+                         compressing=self.m_compressing, deleted=self.m_deleted,
+                         compress_error=self.m_compressError)
+        return stats
+
+    def _segment_path(self, name):
+        return os.path.join(os.path.dirname(self.m_fileName), name)
+
+    # 打开下一段并写入文件头，返回写入的字节数。跳过磁盘上已经存在的（清单中没有的）段，不覆盖
+    def _open_segment(self):
+        self.m_index += 1
+        name = f"{self.m_base}-{self.m_index:05d}{self.m_extension}"
+        while os.path.exists(name) or os.path.exists(name + COMPRESSED_SUFFIX):
+            self.m_index += 1
+            name = f"{self.m_base}-{self.m_index:05d}{self.m_extension}"
+        self.m_encoder = encoder_for_file(name)
+        self.m_file = open(name, "wb", buffering=0)
+        try:
+            written = self._write_all(self.m_encoder.begin())
+        except OSError:
+            self.m_file.close()
+            raise
+        self.m_opened = monotonic()
+        self.m_segments.append({"file": os.path.basename(name), "index": self.m_index, "state": SEGMENT_RECORDING,
+                                "started": int(time() * 1000000), "frames": 0, "bytes": written,
+                                "first_timestamp": 0, "last_timestamp": 0})
+        with self.m_condition:
+            self.m_segmentName = name
+            self.m_segmentCount = len(self.m_segments)
+        return written
+
+    def _open(self):
+        # 同一个基本名再次记录时接着已有的段编号，不覆盖以前的段
+        try:
+            self.m_segments = load_manifest(self.manifest_name())["segments"]
+            self.m_index = max((segment["index"] for segment in self.m_segments), default=0)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.m_segments = []
+        interrupted = self._reconcile()
+        if self.m_compress:
+            self.m_pool = ProcessPoolExecutor(COMPRESSION_WORKERS, multiprocessing.get_context("spawn"))
+            for segment in interrupted:
+                self._compress(segment)
+        written = self._open_segment()
+        self._save_manifest()
+        return written
+
+    # 按磁盘上的文件核对上次记录留下的清单，返回压缩被中断、需要重新压缩的段
+    def _reconcile(self):
+        segments = []
+        interrupted = []
+        for segment in self.m_segments:
+            name = self._segment_path(segment["file"])
+            state = segment["state"]
+            segment["state"] = SEGMENT_CLOSED
+            if not name.endswith(COMPRESSED_SUFFIX) and os.path.exists(name + COMPRESSED_SUFFIX):
+                # 压缩已经完成（.gz 改名后才删除原文件），只是清单没有更新
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+                segment["file"] += COMPRESSED_SUFFIX
+                name += COMPRESSED_SUFFIX
+            elif state == SEGMENT_COMPRESSING:
+                try:
+                    os.remove(name + COMPRESSED_SUFFIX + ".tmp")
+                except FileNotFoundError:
+                    pass
+                if os.path.exists(name):
+                    interrupted.append(segment)
+            try:
+                segment["bytes"] = os.path.getsize(name)
+            except OSError:
+                continue  # 文件已经不存在
+            segments.append(segment)
+        self.m_segments = segments
+        return interrupted if self.m_compress else []
+
+    def _rotation_due(self):
+        segment = self.m_segments[-1]
+        return (segment["frames"] and ((self.m_maxBytes and segment["bytes"] >= self.m_maxBytes)
+                                       or (self.m_interval and monotonic() - self.m_opened >= self.m_interval)))
+
+    # 结束当前段：写入文件尾、同步、关闭，交给进程池压缩。返回写入的字节数
+    def _close_segment(self, ok):
+        segment = self.m_segments[-1]
+        written = super()._close(ok)
+        segment["bytes"] += written
+        segment["state"] = SEGMENT_CLOSED
+        if self.m_compress and ok:
+            self._compress(segment)
+        return written
+
+    def _compress(self, segment):
+        segment["state"] = SEGMENT_COMPRESSING
+        name = self._segment_path(segment["file"])
+        self.m_pending[segment["file"]] = self.m_pool.submit(compress_segment, name)
+        with self.m_condition:
+            self.m_compressing = len(self.m_pending)
+
+    # 收集已经压缩完成的段，返回清单是否有变化
+    def _collect(self, wait=False):
+        changed = False
+        for file_name, future in list(self.m_pending.items()):
+            if not wait and not future.done():
+                continue
+            del self.m_pending[file_name]
+            segment = next(s for s in self.m_segments if s["file"] == file_name)
+            segment["state"] = SEGMENT_CLOSED
+            try:
+                compressed = future.result()
+                self.m_compressedFrom += segment["bytes"]
+                self.m_compressedTo += compressed
+                segment["bytes"] = compressed
+                segment["file"] = file_name + COMPRESSED_SUFFIX
+            except (OSError, BrokenProcessPool) as e:
+                # 压缩失败时保留未压缩的段
+                with self.m_condition:
+                    self.m_compressError = f"cannot compress {file_name}: {e}"
+            changed = True
+        with self.m_condition:
+            self.m_compressing = len(self.m_pending)
+        return changed
+
+    # 删除最旧的段，直到总大小不超过 max_total_bytes；返回是否删除了段
+    def _apply_retention(self):
+        if not self.m_maxTotalBytes:
+            return False
+        ratio = self.m_compressedTo / self.m_compressedFrom if self.m_compressedFrom else None
+        total = 0
+        for segment in self.m_segments:
+            if segment["state"] != SEGMENT_COMPRESSING:
+                total += segment["bytes"]
+            elif ratio is None:
+                return False  # 还不知道压缩比，等压缩完成
+            else:
+                total += int(segment["bytes"] * ratio)
+        deleted = 0
+        for segment in list(self.m_segments):
+            if total <= self.m_maxTotalBytes:
+                break
+            if segment["state"] != SEGMENT_CLOSED:
+                continue
+            try:
+                os.remove(self._segment_path(segment["file"]))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            total -= segment["bytes"]
+            self.m_segments.remove(segment)
+            deleted += 1
+        with self.m_condition:
+            self.m_segmentCount = len(self.m_segments)
+            self.m_deleted += deleted
+        return deleted > 0
+
+    def _save_manifest(self):
+        temporary = self.manifest_name() + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"base": os.path.basename(self.m_fileName), "segments": self.m_segments}, f, indent=1)
+        os.replace(temporary, self.manifest_name())
+        self.m_manifestSaved = monotonic()
+        self.m_manifestDirty = False
+
+    def _manifest_due(self):
+        return self.m_manifestDirty and monotonic() - self.m_manifestSaved >= MANIFEST_INTERVAL
+
+    def _write(self, batches):
+        changed = self._collect()
+        written = 0
+        if self._rotation_due():
+            written += self._close_segment(True)
+            written += self._open_segment()
+            changed = True
+        segment = self.m_segments[-1]
+        for batch in batches:
+            if len(batch):
+                first = int(batch.timestamp.min())
+                last = int(batch.timestamp.max())
+                segment["first_timestamp"] = first if not segment["frames"] else min(segment["first_timestamp"], first)
+                segment["last_timestamp"] = max(segment["last_timestamp"], last)
+                segment["frames"] += len(batch)
+                self.m_manifestDirty = True
+        bytes_written = super()._write(batches)
+        segment["bytes"] += bytes_written
+        written += bytes_written
+        if self._apply_retention() or changed or self._manifest_due():
+            self._save_manifest()
+        return written
+
+    # 总线空闲时也收集压缩完成的段，并保存正在记录的段最后的帧数和时间范围
+    def _idle(self):
+        if self._collect() or self._manifest_due():
+            self._apply_retention()
+            self._save_manifest()
+        return 0
+
+    # 结束最后一段，等待所有的压缩完成后更新清单
+    def _close(self, ok):
+        try:
+            return self._close_segment(ok)
+        finally:
+            if self.m_pool is not None:
+                self._collect(wait=True)
+                self.m_pool.shutdown()
+            self._apply_retention()
+            self._save_manifest()
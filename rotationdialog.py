@@ -0,0 +1,129 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+
+from PySide6.QtCore import QStandardPaths, Slot
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QFileDialog,
+                               QFormLayout, QHBoxLayout, QLineEdit, QPushButton, QSpinBox)
+
+from recorder import FLUSH_INTERVAL, FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER
+
+# 记录的设置对话框：连接设备时自动开始记录（always-on）和记录到的目录，
+# 分段记录（见 rotation.RotatingRecorder），以及写线程的写入间隔和 fsync 策略（见 recorder.LogRecorder）。
+# 分段的各项为 0 时不按这一项切换或删除，段大小和时间都为 0 时不分段，记录到一个文件中。
+# 自动记录一直在写，默认分段并限制总大小，长时间运行也不会写满磁盘。
+
+
+def default_directory():
+    documents = QStandardPaths.writableLocation(QStandardPaths.DocumentsLocation) or os.path.expanduser("~")
+    return os.path.join(documents, "CAN Recordings")
+
+
+# 设置的默认值：连接时自动记录，每 256 MB 一段，总共最多 4 GB
+default_recording = {"auto_record": True, "directory": default_directory(),
+                     "max_bytes": 256 << 20, "interval": 0.0, "max_total_bytes": 4 << 30, "compress": True,
+                     "flush_interval": FLUSH_INTERVAL, "fsync": FSYNC_INTERVAL, "fsync_interval": 1.0}
+
+
+def rotation_enabled(settings):
+    return bool(settings["max_bytes"] or settings["interval"])
+
+
+# RotatingRecorder 的分段参数
+def rotation_options(settings):
+    return {key: settings[key] for key in ("max_bytes", "interval", "max_total_bytes", "compress")}
+
+
+# 所有记录器共用的写线程参数
+def writer_options(settings):
+    return {key: settings[key] for key in ("flush_interval", "fsync", "fsync_interval")}
+
+
+class RotationDialog(QDialog):
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Recording Options")
+
+        self.m_autoBox = QCheckBox("Start recording when a device is connected", self)
+        self.m_autoBox.setChecked(settings["auto_record"])
+        self.m_directoryEdit = QLineEdit(settings["directory"], self)
+        self.m_directoryEdit.setMinimumWidth(300)
+        self.m_browseButton = QPushButton("&Browse...", self)
+        self.m_sizeBox = QSpinBox(self)
+        self.m_sizeBox.setRange(0, 1000000)
+        self.m_sizeBox.setSuffix(" MB")
+        self.m_sizeBox.setSpecialValueText("Off")
+        self.m_sizeBox.setValue(settings["max_bytes"] >> 20)
+        self.m_intervalBox = QDoubleSpinBox(self)
+        self.m_intervalBox.setRange(0, 100000)
+        self.m_intervalBox.setDecimals(1)
+        self.m_intervalBox.setSuffix(" min")
+        self.m_intervalBox.setSpecialValueText("Off")
+        self.m_intervalBox.setValue(settings["interval"] / 60)
+        self.m_retentionBox = QDoubleSpinBox(self)
+        self.m_retentionBox.setRange(0, 100000)
+        self.m_retentionBox.setDecimals(1)
+        self.m_retentionBox.setSuffix(" GB")
+        self.m_retentionBox.setSpecialValueText("Unlimited")
+        self.m_retentionBox.setValue(settings["max_total_bytes"] / (1 << 30))
+        self.m_compressBox = QCheckBox("Compress closed segments (gzip)", self)
+        self.m_compressBox.setChecked(settings["compress"])
+        self.m_flushBox = QSpinBox(self)
+        self.m_flushBox.setRange(10, 10000)
+        self.m_flushBox.setSuffix(" ms")
+        self.m_flushBox.setValue(round(settings["flush_interval"] * 1000))
+        self.m_fsyncBox = QComboBox(self)
+        self.m_fsyncBox.addItem("Never (leave it to the operating system)", FSYNC_NEVER)
+        self.m_fsyncBox.addItem("Periodically", FSYNC_INTERVAL)
+        self.m_fsyncBox.addItem("After every write", FSYNC_ALWAYS)
+        self.m_fsyncBox.setCurrentIndex(self.m_fsyncBox.findData(settings["fsync"]))
+        self.m_fsyncIntervalBox = QDoubleSpinBox(self)
+        self.m_fsyncIntervalBox.setRange(0.1, 3600)
+        self.m_fsyncIntervalBox.setDecimals(1)
+        self.m_fsyncIntervalBox.setSuffix(" s")
+        self.m_fsyncIntervalBox.setValue(settings["fsync_interval"])
+
+        directory = QHBoxLayout()
+        directory.addWidget(self.m_directoryEdit, 1)
+        directory.addWidget(self.m_browseButton)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout = QFormLayout(self)
+        layout.addRow(self.m_autoBox)
+        layout.addRow("Record to folder", directory)
+        layout.addRow("Start a new file every", self.m_sizeBox)
+        layout.addRow("or every", self.m_intervalBox)
+        layout.addRow("Delete oldest files above", self.m_retentionBox)
+        layout.addRow(self.m_compressBox)
+        layout.addRow("Write to disk every", self.m_flushBox)
+        layout.addRow("Flush to disk (fsync)", self.m_fsyncBox)
+        layout.addRow("fsync every", self.m_fsyncIntervalBox)
+        layout.addRow(buttons)
+
+        self.m_browseButton.clicked.connect(self._browse)
+        self.m_fsyncBox.currentIndexChanged.connect(self._fsync_changed)
+        self._fsync_changed()
+
+    @Slot()
+    def _browse(self):
+        directory = QFileDialog.getExistingDirectory(self, "Record to Folder", self.m_directoryEdit.text())
+        if directory:
+            self.m_directoryEdit.setText(directory)
+
+    @Slot()
+    def _fsync_changed(self):
+        self.m_fsyncIntervalBox.setEnabled(self.m_fsyncBox.currentData() == FSYNC_INTERVAL)
+
+    def settings(self):
+        return {"auto_record": self.m_autoBox.isChecked(),
+                "directory": self.m_directoryEdit.text() or default_directory(),
+                "max_bytes": self.m_sizeBox.value() << 20,
+                "interval": self.m_intervalBox.value() * 60,
+                "max_total_bytes": int(self.m_retentionBox.value() * (1 << 30)),
+                "compress": self.m_compressBox.isChecked(),
+                "flush_interval": self.m_flushBox.value() / 1000,
+                "fsync": self.m_fsyncBox.currentData(),
+                "fsync_interval": self.m_fsyncIntervalBox.value()}
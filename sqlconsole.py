@@ -0,0 +1,172 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import sqlite3
+from pathlib import Path
+from threading import Thread
+from time import perf_counter
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, Signal, Slot
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import (QHBoxLayout, QLabel, QPlainTextEdit, QPushButton, QTableView,
+                               QVBoxLayout, QWidget)
+
+# SQL 控制台：对 SQLite 捕获库（见 capturedb）执行任意的查询，结果显示在表格中。
+#
+# 查询在自己的线程中用只读连接执行，数据库在 WAL 模式下，记录可以同时继续；长的查询可以用 Stop 中断。
+# 结果最多显示 MAX_RESULT_ROWS 行，BLOB（例如 payload 列）显示为十六进制。
+
+MAX_RESULT_ROWS = 100000
+DEFAULT_QUERY = "SELECT * FROM frames ORDER BY number DESC LIMIT 1000"
+
+
+def format_value(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bytes):
+        return value.hex(" ").upper()
+    return str(value)
+
+
+class QueryResultModel(QAbstractTableModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_columns = []
+        self.m_rows = []
+
+    def set_result(self, columns, rows):
+        self.beginResetModel()
+        self.m_columns = columns
+        self.m_rows = rows
+        self.endResetModel()
+
+    def headerData(self, section, orientation, role):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.m_columns[section]
+        return section + 1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.m_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.m_columns)
+
+    def data(self, index, role):
+        if role == Qt.DisplayRole:
+            return format_value(self.m_rows[index.row()][index.column()])
+        if role == Qt.TextAlignmentRole:
+            if isinstance(self.m_rows[index.row()][index.column()], (int, float)):
+                return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+
+class SqlConsoleWindow(QWidget):
+
+    # 查询线程发来的结果：(列名列表, 行列表, 是否截断, 耗时秒数, 错误信息)
+    _query_finished = Signal(object)
+
+    def __init__(self, file_name, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle(f"SQL Console - {Path(file_name).name}")
+        self.resize(800, 500)
+        self.m_fileName = file_name
+        self.m_thread = None
+        self.m_connection = None  # 正在执行查询的连接，用于中断
+
+        self.m_queryEdit = QPlainTextEdit(DEFAULT_QUERY, self)
+        self.m_queryEdit.setToolTip("frames(number, timestamp, can_id, flags, dlc, payload); "
+                                    "index on (can_id, timestamp). Ctrl+Return runs the query")
+        self.m_queryEdit.setMaximumHeight(100)
+        self.m_runButton = QPushButton("&Run", self)
+        self.m_stopButton = QPushButton("&Stop", self)
+        self.m_stopButton.setEnabled(False)
+        self.m_model = QueryResultModel(self)
+        self.m_view = QTableView(self)
+        self.m_view.setModel(self.m_model)
+        self.m_status = QLabel(self)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(self.m_runButton)
+        buttons.addWidget(self.m_stopButton)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.m_queryEdit)
+        layout.addLayout(buttons)
+        layout.addWidget(self.m_view)
+        layout.addWidget(self.m_status)
+
+        self.m_runButton.clicked.connect(self.run_query)
+        self.m_stopButton.clicked.connect(self.stop_query)
+        QShortcut(QKeySequence("Ctrl+Return"), self, self.run_query)
+        self._query_finished.connect(self._show_result)
+
+    @Slot()
+    def run_query(self):
+        if self.m_thread is not None:
+            return
+        query = self.m_queryEdit.toPlainText().strip()
+        if not query:
+            return
+        self.m_runButton.setEnabled(False)
+        self.m_stopButton.setEnabled(True)
+        self.m_status.setText("Running...")
+        self.m_thread = Thread(target=self._execute, args=(query,), name="SqlConsole", daemon=True)
+        self.m_thread.start()
+
+    @Slot()
+    def stop_query(self):
+        connection = self.m_connection
+        if connection is not None:
+            connection.interrupt()
+
+    # 查询线程
+    def _execute(self, query):
+        started = perf_counter()
+        columns = []
+        rows = []
+        truncated = False
+        error = ""
+        try:
+            connection = sqlite3.connect(Path(self.m_fileName).absolute().as_uri() + "?mode=ro", uri=True,
+                                         check_same_thread=False)
+            self.m_connection = connection
+            try:
+                cursor = connection.execute(query)
+                if cursor.description is not None:
+                    columns = [column[0] for column in cursor.description]
+                    rows = cursor.fetchmany(MAX_RESULT_ROWS + 1)
+                    truncated = len(rows) > MAX_RESULT_ROWS
+                    del rows[MAX_RESULT_ROWS:]
+            finally:
+                self.m_connection = None
+                connection.close()
+        except sqlite3.Error as e:
+            error = str(e)
+        self._query_finished.emit((columns, rows, truncated, perf_counter() - started, error))
+
+    @Slot(object)
+    def _show_result(self, result):
+        columns, rows, truncated, elapsed, error = result
+        if self.m_thread is None:  # 窗口已经关闭
+            return
+        self.m_thread.join()
+        self.m_thread = None
+        self.m_runButton.setEnabled(True)
+        self.m_stopButton.setEnabled(False)
+        if error:
+            self.m_status.setText(f"Error: {error}")
+            return
+        self.m_model.set_result(columns, rows)
+        more = f" (only the first {MAX_RESULT_ROWS} shown)" if truncated else ""
+        self.m_status.setText(f"{len(rows)} rows{more} in {elapsed * 1000:.1f} ms")
+
+    def closeEvent(self, event):
+        if self.m_thread is not None:
+            self.stop_query()
+            self.m_thread.join()
+            self.m_thread = None
+        super().closeEvent(event)
@@ -0,0 +1,22 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from framestore import MAX_PAYLOAD_FD, FrameBatch  # noqa: E402
+
+
+# 合成的一批帧：序号从 first_number 开始，每帧间隔 step 微秒，ID 在 can_ids 中轮流取值
+def make_batch(first_number, count, can_ids=(0x100,), step=1000):
+    number = np.arange(first_number, first_number + count, dtype=np.int64)
+    can_id = np.array(can_ids, np.uint32)[number % len(can_ids)]
+    payload = np.zeros((count, MAX_PAYLOAD_FD), np.uint8)
+    payload[:, 0] = number % 256
+    return FrameBatch(number, number * step, can_id, np.zeros(count, np.uint8), np.full(count, 8, np.uint8),
+                      payload)
@@ -0,0 +1,106 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+
+from blf import CONTAINER_SIZE, BlfEncoder, BlfReader
+from conftest import make_batch
+from framestore import (FLAG_BITRATE_SWITCH, FLAG_ERROR_FRAME, FLAG_ERROR_STATE, FLAG_EXTENDED,
+                        FLAG_FLEXIBLE_DATA_RATE, FLAG_LOCAL_ECHO, FLAG_REMOTE, FD_LENGTHS, FrameBatch)
+
+COUNT = 6000
+START = 1600000000000123  # 第一帧的时间戳（微秒），不在整毫秒上
+
+
+# 各种帧轮流出现：经典帧、带 BRS/ESI 的 CAN FD 帧、扩展帧、远程帧、发送回显、错误帧。
+# 经典帧 48 字节、CAN FD 帧 116 字节，6000 帧超过 3 个容器，对象会跨越容器的边界
+def _frames():
+    batch = make_batch(1, COUNT, step=137)
+    batch.timestamp += START
+    kind = batch.number % 6
+    rng = np.random.default_rng(1)
+    batch.payload[:] = rng.integers(0, 256, batch.payload.shape, np.uint8)
+    batch.can_id[:] = rng.integers(0, 0x800, COUNT)
+
+    fd = kind == 1
+    batch.flags[fd] = FLAG_FLEXIBLE_DATA_RATE | FLAG_BITRATE_SWITCH
+    batch.flags[fd & (batch.number % 4 == 1)] |= FLAG_ERROR_STATE
+    batch.dlc[fd] = np.array(FD_LENGTHS, np.uint8)[batch.number[fd] % len(FD_LENGTHS)]
+    extended = kind == 2
+    batch.flags[extended] = FLAG_EXTENDED
+    batch.can_id[extended] = rng.integers(0x800, 0x20000000, int(extended.sum()))
+    batch.flags[kind == 3] = FLAG_REMOTE
+    batch.dlc[kind == 3] = 0
+    batch.flags[kind == 4] = FLAG_LOCAL_ECHO
+    batch.dlc[kind == 4] = batch.number[kind == 4] % 9
+    batch.flags[kind == 5] = FLAG_ERROR_FRAME
+    # dlc 之后的字节读出为 0
+    batch.payload[np.arange(batch.payload.shape[1]) >= batch.dlc[:, None]] = 0
+    return batch
+
+
+def _write(file_name, batch):
+    encoder = BlfEncoder()
+    with open(file_name, "wb") as f:
+        f.write(encoder.begin())
+        for start in range(0, len(batch), 700):
+            f.write(encoder.encode(batch.slice(start, start + 700)))
+        f.write(encoder.end())
+        encoder.finish(f)
+
+
+def _assert_same(read, expected):
+    assert read.number.tolist() == expected.number.tolist()
+    assert read.timestamp.tolist() == expected.timestamp.tolist()
+    assert read.can_id.tolist() == expected.can_id.tolist()
+    assert read.flags.tolist() == expected.flags.tolist()
+    assert read.dlc.tolist() == expected.dlc.tolist()
+    assert np.array_equal(read.payload, expected.payload)
+
+
+# 顺序读取整个文件得到原来的帧，包括标志位、扩展 ID 和 CAN FD 的长度
+def test_round_trip(tmp_path):
+    file_name = str(tmp_path / "log.blf")
+    frames = _frames()
+    _write(file_name, frames)
+    reader = BlfReader(file_name)
+    try:
+        assert len(reader.m_containers) > 2
+        assert reader.start_time() == START - START % 1000
+        batches = list(reader.batches())
+        assert len(batches) == len(reader.m_containers)
+        _assert_same(FrameBatch.concatenate(batches), frames)
+    finally:
+        reader.close()
+
+
+# 按需浏览：fetch_more() 每次解析一个容器，batch() 读取跨越容器边界的行，
+# 缓存被清空后按记下的跨容器字节重新解析
+def test_lazy_decode(tmp_path):
+    file_name = str(tmp_path / "log.blf")
+    frames = _frames()
+    _write(file_name, frames)
+    reader = BlfReader(file_name)
+    try:
+        assert reader.row_count() == 0
+        assert reader.can_fetch_more()
+        first = reader.fetch_more(1)
+        assert 0 < first < CONTAINER_SIZE // 48
+        assert reader.row_count() == first
+        assert len(reader.batch(first - 10, first + 10)) == 10
+
+        second = reader.fetch_more(1)
+        assert second > 0
+        assert reader.row_count() == first + second
+        _assert_same(reader.batch(first - 10, first + 10), frames.slice(first - 10, first + 10))
+        _assert_same(reader.batch(first + 5, first + second), frames.slice(first + 5, first + second))
+
+        reader.m_cache.clear()
+        _assert_same(reader.batch(first, first + second), frames.slice(first, first + second))
+
+        while reader.can_fetch_more():
+            reader.fetch_more()
+        assert reader.row_count() == COUNT
+        _assert_same(reader.batch(0, COUNT), frames)
+    finally:
+        reader.close()
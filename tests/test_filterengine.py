@@ -0,0 +1,135 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+import pytest
+
+from conftest import make_batch
+from filterengine import FilterSyntaxError, compile_filter
+from framestore import FLAG_ERROR_FRAME, FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_REMOTE
+
+
+# 每帧的 ID 依次为 can_ids；dlc、第 0 个数据字节和标志位不给出时分别为 8、序号、0
+def _batch(can_ids, dlc=None, data0=None, flags=None):
+    batch = make_batch(0, len(can_ids))
+    batch.can_id[:] = can_ids
+    if dlc is not None:
+        batch.dlc[:] = dlc
+    if data0 is not None:
+        batch.payload[:, 0] = data0
+    if flags is not None:
+        batch.flags[:] = flags
+    return batch
+
+
+def _match(text, batch):
+    return compile_filter(text).mask(batch).tolist()
+
+
+def test_empty_filter():
+    assert compile_filter("") is None
+    assert compile_filter("   ") is None
+    assert compile_filter(" id 1 ").text() == " id 1 "
+
+
+# ! 先于 &&，&& 先于 ||；括号改变结合
+def test_precedence():
+    batch = _batch([1, 2, 2, 3], dlc=[8, 0, 8, 0])
+    assert _match("id 1 || id 2 && dlc 0", batch) == [True, True, False, False]
+    assert _match("(id 1 || id 2) && dlc 0", batch) == [False, True, False, False]
+    assert _match("id 2 && dlc 0 || id 1", batch) == [True, True, False, False]
+    assert _match("!id 2 && dlc 0", batch) == [False, False, False, True]
+    assert _match("!(id 2 && dlc 0)", batch) == [True, False, True, True]
+    assert _match("!id 1 || id 1", batch) == [True, True, True, True]
+    assert _match("!!id 3", batch) == [False, False, False, True]
+    assert _match("id 1 || id 3 && !dlc 0 || id 2 && !dlc 8", batch) == [True, True, False, False]
+
+
+# 闭区间的两种写法，逗号分隔的多个条件，比较运算
+def test_id_ranges_and_lists():
+    batch = _batch([0x0ff, 0x100, 0x150, 0x1ff, 0x200, 0x7ff])
+    assert _match("id 0x100..0x1ff", batch) == [False, True, True, True, False, False]
+    assert _match("id 0x100-0x1ff", batch) == [False, True, True, True, False, False]
+    assert _match("id 256..511", batch) == [False, True, True, True, False, False]
+    assert _match("id 0xff, 0x200..0x7ff", batch) == [True, False, False, False, True, True]
+    assert _match("id >= 0x1ff", batch) == [False, False, False, True, True, True]
+    assert _match("id < 0x100", batch) == [True, False, False, False, False, False]
+    assert _match("id != 0x150", batch) == [True, True, False, True, True, True]
+
+
+# ID/掩码：(ID & mask) == (value & mask)
+def test_id_mask():
+    batch = _batch([0x100, 0x10f, 0x110, 0x200, 0x18fabc00], flags=[0, 0, 0, 0, FLAG_EXTENDED])
+    assert _match("id 0x100/0x7f0", batch) == [True, True, False, False, False]
+    assert _match("id 0x105/0x7f0", batch) == [True, True, False, False, False]
+    assert _match("id 0x100/0x100", batch) == [True, True, True, False, False]
+    assert _match("id 0xfabc00/0xffff00 && ext", batch) == [False, False, False, False, True]
+    assert _match("id 0x200/0x7ff, 0x110/0x7ff", batch) == [False, False, True, True, False]
+
+
+# data[i] 的取值、掩码和比较；帧不够长时不匹配
+def test_data_predicates():
+    batch = _batch([1] * 5, dlc=[8, 8, 8, 1, 0], data0=[0x12, 0x1f, 0x80, 0x12, 0x12])
+    batch.payload[:, 5] = [0, 1, 2, 3, 4]
+    assert _match("data[0] 0x12", batch) == [True, False, False, True, False]
+    assert _match("data[0] 0x10/0xf0", batch) == [True, True, False, True, False]
+    assert _match("data[0] 0/0x80", batch) == [True, True, False, True, False]
+    assert _match("!(data[0] 0/0x80)", batch) == [False, False, True, False, True]
+    assert _match("data[0] > 0x12", batch) == [False, True, True, False, False]
+    assert _match("data[5] 1..3", batch) == [False, True, True, False, False]
+    assert _match("data[5] 0", batch) == [True, False, False, False, False]
+
+
+def test_dlc_comparisons():
+    batch = _batch([1] * 6, dlc=[0, 1, 4, 8, 12, 64], flags=[0, 0, 0, 0, FLAG_FLEXIBLE_DATA_RATE,
+                                                             FLAG_FLEXIBLE_DATA_RATE])
+    assert _match("dlc 8", batch) == [False, False, False, True, False, False]
+    assert _match("dlc > 4", batch) == [False, False, False, True, True, True]
+    assert _match("dlc <= 4", batch) == [True, True, True, False, False, False]
+    assert _match("dlc == 0, 64", batch) == [True, False, False, False, False, True]
+    assert _match("dlc 1..8 && !fd", batch) == [False, True, True, True, False, False]
+    assert _match("dlc > 8 && fd", batch) == [False, False, False, False, True, True]
+
+
+def test_frame_types():
+    batch = _batch([1, 2, 3], flags=[0, FLAG_REMOTE, FLAG_ERROR_FRAME])
+    assert _match("type data", batch) == [True, False, False]
+    assert _match("type remote", batch) == [False, True, False]
+    assert _match("type error || std && id 1", batch) == [True, False, True]
+
+
+# 语法错误给出出错位置
+@pytest.mark.parametrize("text, position", [
+    ("id", 2),
+    ("id 0x100 &&", 11),
+    ("(id 1", 5),
+    ("id 1)", 4),
+    ("id 1 id 2", 5),
+    ("id 0x20000000", 3),
+    ("dlc 65", 4),
+    ("data[64] 1", 5),
+    ("data 1", 5),
+    ("data[0] 0x100", 8),
+    ("id 1..", 6),
+    ("id 0x100/", 9),
+    ("speed 5", 0),
+    ("type frame", 5),
+    ("id 1 $ id 2", 5),
+    ("id 1 && || id 2", 8),
+])
+def test_syntax_errors(text, position):
+    with pytest.raises(FilterSyntaxError) as error:
+        compile_filter(text)
+    assert error.value.position == position
+    assert isinstance(error.value, ValueError)
+
+
+# 编译后的过滤器对空批次和整批匹配的批次不复制
+def test_apply():
+    batch = _batch([1, 2, 1])
+    frame_filter = compile_filter("id 1")
+    assert frame_filter.apply(batch).number.tolist() == [0, 2]
+    assert compile_filter("id 1, 2").apply(batch) is batch
+    empty = batch.slice(0, 0)
+    assert frame_filter.apply(empty) is empty
+    assert np.array_equal(frame_filter.mask(empty), np.zeros(0, bool))
@@ -0,0 +1,21 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from conftest import make_batch
+from fixedtracemodel import MAX_ACCUMULATED_FRAMES, FixedTraceModel, FixedTraceModelColumns
+
+
+# 刷新暂停（update() 不被调用）时一直追加，累积的帧数不超过上限，计数仍然完整
+def test_append_while_suspended_stays_bounded():
+    model = FixedTraceModel()
+    ids = (0x100, 0x200, 0x300)
+    total = 0
+    for _ in range(200):
+        model.append_frames(make_batch(total + 1, 4096, ids))
+        total += 4096
+        assert sum(len(batch) for batch in model.m_framesAccumulator) < MAX_ACCUMULATED_FRAMES
+    model.update()
+    assert model.rowCount() == len(ids)
+    counts = [int(model.format_cell(row, FixedTraceModelColumns.count)) for row in range(model.rowCount())]
+    assert sum(counts) == total
+    assert model.format_cell(0, FixedTraceModelColumns.period) == "3.0"
@@ -0,0 +1,57 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from framereader import FrameReader
+
+
+class _BufferedDevice():
+    """把写出的帧放入发送队列、调用 send() 时才报告 framesWritten 的后端。"""
+
+    def __init__(self, reader):
+        self.m_reader = reader
+        self.m_queue = []
+
+    def writeFrame(self, frame):
+        self.m_queue.append(frame)
+        return True
+
+    def framesToWrite(self):
+        return len(self.m_queue)
+
+    def send(self, count):
+        del self.m_queue[:count]
+        self.m_reader._frames_written(count)
+
+
+def _reader():
+    reader = FrameReader()
+    device = _BufferedDevice(reader)
+    reader.m_can_device = device
+    return reader, device
+
+
+# 发送完成的帧只交还给写出它们的请求者，发送框写的帧不算在内
+def test_written_frames_go_to_their_owner():
+    reader, device = _reader()
+    written = []
+    reader._write_frame("box")
+    reader._write_frames(["a", "b"], None, lambda count, time: written.append(count), 0)
+    reader._write_frame("box")
+    reader._write_frames(["c"], None, lambda count, time: written.append(count), 0)
+    device.send(2)
+    assert written == [1]
+    device.send(3)
+    assert written == [1, 1, 1]
+
+
+# 后端的发送队列达到 max_queued 时暂停请求，发送出去后再继续，写完所有帧后才调用 callback
+def test_request_waits_for_queue_space():
+    reader, device = _reader()
+    done = []
+    reader._write_frames(list(range(10)), done.append, None, 4)
+    assert device.framesToWrite() == 4 and not done
+    reader._write_frames(["cyclic"], done.append, None, 0)  # 不限制队列长度的请求不被挡住
+    assert device.m_queue[-1] == "cyclic" and len(done) == 1
+    while device.m_queue:
+        device.send(len(device.m_queue))
+    assert len(done) == 2 and len(done[1]) == 10
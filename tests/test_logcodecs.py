@@ -0,0 +1,28 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import io
+
+from logcodecs import read_candump
+
+
+def _read(text):
+    return list(read_candump(io.BytesIO(text.encode("ascii"))))
+
+
+# 数据中带 "." 分隔符的行与没有分隔符的行在同一块中时，逐行处理
+def test_candump_dotted_payload():
+    batches = _read("(1600000000.000100) can0 123#11.22.33\n"
+                    "(1600000000.000200) can0 456#1122\n")
+    assert sum(len(batch) for batch in batches) == 2
+    batch = batches[0]
+    assert batch.can_id.tolist() == [0x123, 0x456]
+    assert batch.dlc.tolist() == [3, 2]
+    assert bytes(batch.payload[0, :3]) == b"\x11\x22\x33"
+    assert bytes(batch.payload[1, :2]) == b"\x11\x22"
+
+
+def test_candump_plain_payload():
+    batch = _read("(1600000000.000100) can0 123#1122334455667788\n")[0]
+    assert batch.timestamp.tolist() == [1600000000000100]
+    assert bytes(batch.payload[0, :8]) == bytes.fromhex("1122334455667788")
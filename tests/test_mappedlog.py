@@ -0,0 +1,24 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from conftest import make_batch
+from logcodecs import export_log
+from mappedlog import MappedLog
+
+
+# 损坏的索引文件被忽略，索引重新建立并覆盖它
+def test_corrupt_index_is_rebuilt(tmp_path):
+    file_name = str(tmp_path / "capture.canlog")
+    export_log(file_name, [make_batch(1, 1000)])
+    with open(file_name + ".idx", "wb") as f:
+        f.write(b"PK\x03\x04" + b"\0" * 20)
+
+    log = MappedLog(file_name)
+    assert log.indexed_rows() == 0
+    log.index_more()
+    assert log.index_complete()
+    log.close()
+
+    log = MappedLog(file_name)
+    assert log.indexed_rows() == 1000
+    log.close()
@@ -0,0 +1,111 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import numpy as np
+import pytest
+
+from conftest import make_batch
+from framestore import FrameBatch
+from parquetlog import ParquetEncoder, ParquetReader
+
+GROUP_ROWS = 100
+GROUPS = 10
+
+
+# 1000 帧，每个行组 100 帧；第 k 个行组的帧 ID 都是 0x100 + k，时间戳为序号 * 1000
+def _frames():
+    batch = make_batch(1, GROUP_ROWS * GROUPS)
+    batch.can_id[:] = 0x100 + (batch.number - 1) // GROUP_ROWS
+    batch.dlc[:] = (batch.number % 9).astype(np.uint8)
+    batch.payload[:, 1] = 0xa5
+    return batch
+
+
+# 分几次交给编码器，批次的边界与行组的边界不对齐
+def _write(file_name, batch, compression_level=6):
+    encoder = ParquetEncoder(row_group_rows=GROUP_ROWS, compression_level=compression_level)
+    with open(file_name, "wb") as f:
+        f.write(encoder.begin())
+        for start in range(0, len(batch), 130):
+            f.write(encoder.encode(batch.slice(start, start + 130)))
+        f.write(encoder.end())
+
+
+def _assert_same(read, expected):
+    assert read.number.tolist() == expected.number.tolist()
+    assert read.timestamp.tolist() == expected.timestamp.tolist()
+    assert read.can_id.tolist() == expected.can_id.tolist()
+    assert read.flags.tolist() == expected.flags.tolist()
+    assert read.dlc.tolist() == expected.dlc.tolist()
+    # dlc 之后的字节不写入文件，读出为 0
+    for row in range(len(expected)):
+        dlc = int(expected.dlc[row])
+        assert bytes(read.payload[row, :dlc]) == bytes(expected.payload[row, :dlc])
+        assert not read.payload[row, dlc:].any()
+
+
+# 写出若干个行组再读回，顺序读取和按行号读取（跨行组）都得到原来的帧
+@pytest.mark.parametrize("level", [0, 6])
+def test_round_trip(tmp_path, level):
+    file_name = str(tmp_path / "log.parquet")
+    frames = _frames()
+    _write(file_name, frames, level)
+    reader = ParquetReader(file_name)
+    try:
+        assert reader.row_group_count() == GROUPS
+        assert reader.row_count() == len(frames)
+        _assert_same(FrameBatch.concatenate(list(reader.batches())), frames)
+        _assert_same(reader.batch(150, 420), frames.slice(150, 420))
+        assert next(reader.batches(first_number=11)).number[0] == 11
+    finally:
+        reader.close()
+
+
+# 元数据中每个列块的最小值和最大值
+def test_statistics(tmp_path):
+    file_name = str(tmp_path / "log.parquet")
+    _write(file_name, _frames())
+    reader = ParquetReader(file_name)
+    try:
+        for k in range(GROUPS):
+            first = k * GROUP_ROWS + 1
+            last = first + GROUP_ROWS - 1
+            assert reader.statistics(k, "timestamp") == (first * 1000, last * 1000)
+            assert reader.statistics(k, "can_id") == (0x100 + k, 0x100 + k)
+            assert reader.statistics(k, "dlc") == (0, 8)
+            assert reader.statistics(k, "flags") == (0, 0)
+    finally:
+        reader.close()
+
+
+# 按时间和 ID 过滤时只解码统计上可能符合条件的行组，返回的帧保留原来的序号
+def test_row_group_skipping(tmp_path):
+    file_name = str(tmp_path / "log.parquet")
+    frames = _frames()
+    _write(file_name, frames)
+    reader = ParquetReader(file_name)
+    decoded = []
+    decode = reader._decode
+    reader._decode = lambda k: decoded.append(k) or decode(k)
+    try:
+        window = (250500, 420000)  # 第 250 帧之后到第 420 帧
+        assert reader.row_groups(time_range=window) == [2, 3, 4]
+        assert reader.row_groups(can_ids=[0x103, 0x107, 0x200]) == [3, 7]
+        assert reader.row_groups(time_range=window, can_ids=[0x107]) == []
+        assert reader.row_groups(time_range=(0, 500)) == []
+
+        batch = FrameBatch.concatenate(list(reader.batches(time_range=window)))
+        assert decoded == [2, 3, 4]
+        assert batch.number.tolist() == list(range(251, 421))
+
+        decoded.clear()
+        batch = FrameBatch.concatenate(list(reader.batches(time_range=window, can_ids=[0x102, 0x104])))
+        assert decoded == [2, 4]
+        assert batch.number.tolist() == list(range(251, 301)) + list(range(401, 421))
+        assert set(batch.can_id.tolist()) == {0x102, 0x104}
+
+        decoded.clear()
+        assert list(reader.batches(can_ids=[0x300])) == []
+        assert decoded == []
+    finally:
+        reader.close()
@@ -0,0 +1,51 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from PySide6.QtWidgets import QApplication, QTableView
+
+from conftest import make_batch
+from payloadsearch import PayloadSearchBar, parse_hex_pattern, search_payload
+from receivedframesmodel import ReceivedFramesModel
+
+_app = QApplication.instance() or QApplication([])
+
+
+# 在环形缓冲区的一段逻辑行中搜索，与整体搜索的结果一致
+def test_search_range_matches_full_search():
+    model = ReceivedFramesModel()
+    model.set_queue_limit(3000)
+    for first in range(1, 5001, 1000):
+        model.append_frames(make_batch(first, 1000))
+        model.update()
+    store = model.m_frames
+    assert len(store.segments()) == 2
+    values, masks = parse_hex_pattern("07")
+    rows = search_payload(store, values, masks, False)
+    assert len(rows) and (store.payload[[store.physical(int(row)) for row in rows], 0] == 7).all()
+    parts = [search_payload(store, values, masks, False, first, first + 700) for first in range(0, 3000, 700)]
+    assert rows.tolist() == [int(row) for part in parts for row in part]
+
+
+# 搜索之后追加的帧也参与跳转
+def test_search_follows_appended_rows():
+    model = ReceivedFramesModel()
+    model.set_queue_limit(2000)
+    view = QTableView()
+    view.setModel(model)
+    bar = PayloadSearchBar(view, model)
+    bar.m_patternEdit.setText("07")
+    bar.m_anyOffsetBox.setChecked(False)
+    model.append_frames(make_batch(1, 1000))
+    model.update()
+    bar.find_next()
+    assert len(bar.m_hits) == 4
+    for first in (1001, 2001):
+        model.append_frames(make_batch(first, 1000))
+        model.update()
+    assert len(bar.m_hits) == 12
+    view.setCurrentIndex(model.index(model.rowCount() - 300, 0))
+    bar.find_next()
+    assert model.m_frames.payload[model.m_frames.physical(view.currentIndex().row()), 0] == 7
+    assert view.currentIndex().row() > model.rowCount() - 300
+    model.clear()
+    assert not bar.m_searched
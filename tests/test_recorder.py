@@ -0,0 +1,25 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from conftest import make_batch
+from recorder import BinaryLogEncoder, LogRecorder
+
+
+class _FailingEncoder(BinaryLogEncoder):
+
+    def encode(self, batch):
+        raise ValueError("cannot encode")
+
+
+# 编码器抛出的不是 OSError 时写线程也停止记录并报告错误，stop() 不会挂起
+def test_encoder_error_stops_recording(tmp_path):
+    recorder = LogRecorder(str(tmp_path / "log.bin"), encoder=_FailingEncoder(), flush_interval=0.01)
+    recorder.start()
+    recorder.record(make_batch(1, 100))
+    recorder.m_thread.join(5)
+    assert not recorder.m_thread.is_alive()
+    recorder.record(make_batch(101, 50))  # 出错之后收到的帧也计为丢弃
+    stats = recorder.stop()
+    assert stats["error"] == "cannot encode"
+    assert stats["dropped"] == 150
+    assert stats["written"] == 0
@@ -0,0 +1,36 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from refreshscheduler import RefreshScheduler
+
+
+def _scheduler(rate, fixed, per_frame):
+    scheduler = RefreshScheduler(lambda: None)
+    scheduler.m_rate = rate
+    for frames in (100, 4000, 800, 20000, 2000, 9000) * 10:
+        scheduler.record_cost(frames, fixed + per_frame * frames)
+    return scheduler
+
+
+# 刷新便宜时，总线满载也不拉长间隔
+def test_cheap_refresh_stays_at_min_interval():
+    scheduler = _scheduler(100000, 0.5, 0.0001)
+    fixed, per_frame = scheduler.cost_model()
+    assert abs(fixed - 0.5) < 0.01 and abs(per_frame - 0.0001) < 1e-6
+    assert scheduler.interval() == scheduler.m_minInterval
+
+
+# 固定代价按 frame_budget 摊薄：20 ms 的刷新在 25% 的预算下每 80 ms 一次
+def test_fixed_cost_sets_the_interval():
+    assert _scheduler(1000, 20.0, 0.0).interval() == 80
+
+
+# 每帧代价越高，留给固定代价的预算越少
+def test_frame_cost_stretches_the_interval():
+    assert _scheduler(50000, 5.0, 0.004).interval() == 100  # 5 / (0.25 - 0.2)
+
+
+# 每帧代价 * 帧速率超过预算时（跟不上），间隔为 max_interval
+def test_saturated_gui_uses_max_interval():
+    scheduler = _scheduler(100000, 1.0, 0.01)
+    assert scheduler.interval() == scheduler.m_maxInterval
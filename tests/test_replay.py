@@ -0,0 +1,51 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import time
+from threading import Lock
+
+from conftest import make_batch
+from logcodecs import export_log
+from replay import MAX_IN_FLIGHT, LogReplayer
+
+
+class _SlowBus():
+    """代替 FrameReader：写出的帧进入发送队列，由测试线程按自己的速度“发送”。"""
+
+    def __init__(self):
+        self.m_lock = Lock()
+        self.m_queue = []  # (written 回调, 帧数)
+        self.m_queued = 0
+        self.m_maxQueued = 0
+
+    def write_frames(self, frames, callback=None, written=None, max_queued=0):
+        with self.m_lock:
+            self.m_queue.append((written, len(frames)))
+            self.m_queued += len(frames)
+            self.m_maxQueued = max(self.m_maxQueued, self.m_queued)
+        callback([time.perf_counter()] * len(frames))
+
+    def send(self):
+        with self.m_lock:
+            queue = self.m_queue
+            self.m_queue = []
+            self.m_queued = 0
+        for written, count in queue:
+            written(count, time.perf_counter())
+
+
+# 尽快回放时，已交给设备但还没有发送的帧数不超过 MAX_IN_FLIGHT，发送完成才计入 sent
+def test_replay_waits_for_the_bus(tmp_path):
+    file_name = str(tmp_path / "replay.canlog")
+    export_log(file_name, [make_batch(1, 5000)])
+    bus = _SlowBus()
+    replayer = LogReplayer(file_name, bus, speed=0)
+    replayer.start()
+    deadline = time.monotonic() + 10
+    while replayer.is_running() and time.monotonic() < deadline:
+        time.sleep(0.002)
+        bus.send()
+    stats = replayer.stop()
+    assert stats["sent"] == 5000
+    assert stats["failed"] == 0 and not stats["error"]
+    assert bus.m_maxQueued <= MAX_IN_FLIGHT
@@ -0,0 +1,86 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import gzip
+import json
+import time
+
+import rotation
+from conftest import make_batch
+from rotation import SEGMENT_CLOSED, SEGMENT_COMPRESSING, SEGMENT_RECORDING, RotatingRecorder, load_manifest
+
+
+# 记录过程中清单定期保存，正在记录的段的帧数和时间范围不必等到切换或停止
+def test_manifest_saved_while_recording(tmp_path, monkeypatch):
+    monkeypatch.setattr(rotation, "MANIFEST_INTERVAL", 0.0)
+    recorder = RotatingRecorder(str(tmp_path / "capture.canlog"), compress=False, flush_interval=0.01)
+    recorder.start()
+    try:
+        recorder.record(make_batch(1, 100))
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            segment = load_manifest(recorder.manifest_name())["segments"][-1]
+            if segment["frames"]:
+                break
+            time.sleep(0.01)
+        assert segment["state"] == SEGMENT_RECORDING
+        assert segment["frames"] == 100
+        assert (segment["first_timestamp"], segment["last_timestamp"]) == (1000, 100000)
+    finally:
+        recorder.stop()
+
+
+def _segment(index, file_name, state):
+    return {"file": file_name, "index": index, "state": state, "started": 0, "frames": 10, "bytes": 1,
+            "first_timestamp": 0, "last_timestamp": 0}
+
+
+# 再次记录时按磁盘上的文件核对上次中断时留下的清单
+def test_reopen_reconciles_segments(tmp_path):
+    (tmp_path / "capture-00001.canlog.gz").write_bytes(gzip.compress(b"x" * 100))
+    (tmp_path / "capture-00003.canlog").write_bytes(b"x" * 100)
+    (tmp_path / "capture-00004.canlog").write_bytes(b"x" * 100)  # 不在清单中的段
+    segments = [_segment(1, "capture-00001.canlog", SEGMENT_COMPRESSING),
+                _segment(2, "capture-00002.canlog.gz", SEGMENT_CLOSED),
+                _segment(3, "capture-00003.canlog", SEGMENT_RECORDING)]
+    (tmp_path / "capture.manifest.json").write_text(json.dumps({"segments": segments}))
+
+    recorder = RotatingRecorder(str(tmp_path / "capture.canlog"), compress=False)
+    recorder.start()
+    recorder.stop()
+    segments = load_manifest(recorder.manifest_name())["segments"]
+    assert [segment["file"] for segment in segments] == \
+        ["capture-00001.canlog.gz", "capture-00003.canlog", "capture-00005.canlog"]
+    assert all(segment["state"] == SEGMENT_CLOSED for segment in segments)
+    assert segments[0]["bytes"] == (tmp_path / "capture-00001.canlog.gz").stat().st_size
+    assert segments[1]["bytes"] == 100
+    assert (tmp_path / "capture-00004.canlog").read_bytes() == b"x" * 100
+
+
+def _retention_recorder(tmp_path, states):
+    recorder = RotatingRecorder(str(tmp_path / "capture.canlog"), max_total_bytes=1000)
+    for index, (state, size) in enumerate(states, 1):
+        segment = _segment(index, f"capture-{index:05d}.canlog", state)
+        segment["bytes"] = size
+        (tmp_path / segment["file"]).write_bytes(b"x" * size)
+        recorder.m_segments.append(segment)
+    return recorder
+
+
+# 还不知道压缩比时，有段正在压缩就不删除旧的段
+def test_retention_waits_for_the_first_compression(tmp_path):
+    recorder = _retention_recorder(tmp_path, [(SEGMENT_CLOSED, 400), (SEGMENT_COMPRESSING, 2000),
+                                              (SEGMENT_RECORDING, 100)])
+    assert not recorder._apply_retention()
+    assert len(recorder.m_segments) == 3
+
+
+# 正在压缩的段按已知的压缩比计算，只删除压缩之后仍然放不下的部分
+def test_retention_estimates_compressed_size(tmp_path):
+    recorder = _retention_recorder(tmp_path, [(SEGMENT_CLOSED, 400), (SEGMENT_CLOSED, 400),
+                                              (SEGMENT_COMPRESSING, 2000), (SEGMENT_RECORDING, 100)])
+    recorder.m_compressedFrom, recorder.m_compressedTo = 10000, 1000  # 压缩比 0.1
+    # 400 + 400 + 200 + 100 = 1100：删除最旧的一段就够了（按压缩前的大小会把两段都删除）
+    assert recorder._apply_retention()
+    assert [segment["index"] for segment in recorder.m_segments] == [2, 3, 4]
+    assert not (tmp_path / "capture-00001.canlog").exists()
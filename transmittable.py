@@ -0,0 +1,350 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from itertools import count
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, Signal, Slot
+from PySide6.QtWidgets import (QCheckBox, QHBoxLayout, QLabel, QLineEdit, QPushButton, QSpinBox, QTableView,
+                               QVBoxLayout, QWidget)
+
+from cyclictransmit import JITTER_LIMIT, CyclicTransmitter, new_message
+from framestore import FLAG_BITRATE_SWITCH, FLAG_EXTENDED, FLAG_FLEXIBLE_DATA_RATE, FLAG_REMOTE
+from sendframebox import (MAX_EXTENDED_ID, MAX_PAYLOAD, MAX_PAYLOAD_FD, MAX_STANDARD_ID, HexIntegerValidator,
+                          HexStringValidator, format_hex_data, is_even_hex)
+
+# 周期发送表窗口：每一行是一帧和它的周期，由 cyclictransmit.CyclicTransmitter 在自己的线程中调度发送。
+# ID、有效载荷和周期可以在表格中直接修改，第一列的复选框启用或停用一行；发送中的修改立即生效。
+# 每行显示发送次数和实测的周期抖动（p99、最大值）以及抖动超过 JITTER_LIMIT 的次数。
+# 发送在 Python 线程中调度，GUI 繁忙时抖动可能超过 JITTER_LIMIT（见 cyclictransmit），窗口中说明这一限制。
+# 设备没有连接时不能开始发送。
+
+STATISTICS_INTERVAL = 500  # 刷新统计的间隔，单位毫秒
+TIMING_NOTE = (f"Frames are scheduled by a Python thread: the period jitter usually stays below "
+               f"{JITTER_LIMIT * 1000:g} ms, but can reach several ms while the GUI is busy. "
+               f"Use the device's own cyclic transmission when the timing must be guaranteed.")
+
+# 列
+COLUMN_ENABLED = 0
+COLUMN_ID = 1
+COLUMN_FLAGS = 2
+COLUMN_PAYLOAD = 3
+COLUMN_PERIOD = 4
+COLUMN_SENT = 5
+COLUMN_JITTER_P99 = 6
+COLUMN_JITTER_MAX = 7
+COLUMN_LATE = 8
+_HEADERS = ["On", "CAN-ID", "Flags", "Payload", "Period (ms)", "Sent", "Jitter p99 (ms)", "Jitter max (ms)", "Late"]
+_EDITABLE = (COLUMN_ID, COLUMN_PAYLOAD, COLUMN_PERIOD)
+
+
+# 发送表中的帧格式：扩展帧（X）、FD（F）、比特率切换（B）、远程帧（R）
+def _format_flags(flags):
+    return (("X" if flags & FLAG_EXTENDED else "-") + ("F" if flags & FLAG_FLEXIBLE_DATA_RATE else "-")
+            + ("B" if flags & FLAG_BITRATE_SWITCH else "-") + ("R" if flags & FLAG_REMOTE else "-"))
+
+
+# 解析表格中输入的 ID，超出范围或不是十六进制时返回 None
+def _parse_id(text, flags):
+    try:
+        value = int(text, 16)
+    except ValueError:
+        return None
+    return value if 0 <= value < (MAX_EXTENDED_ID if flags & FLAG_EXTENDED else MAX_STANDARD_ID) else None
+
+
+def _parse_payload(text, flags):
+    data = text.replace(" ", "")
+    limit = MAX_PAYLOAD_FD if flags & FLAG_FLEXIBLE_DATA_RATE else MAX_PAYLOAD
+    if not is_even_hex(data) or len(data) > 2 * limit:
+        return None
+    try:
+        return bytes.fromhex(data)
+    except ValueError:
+        return None
+
+
+class TransmitTableModel(QAbstractTableModel):
+
+    # 发送表被修改（增删行、编辑、启用或停用）
+    messages_changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_messages = []
+        self.m_statistics = {}  # key -> CyclicTransmitter.statistics() 中每条报文的统计
+        self.m_keys = count(1)
+
+    def messages(self):
+        return self.m_messages
+
+    def add_message(self, frame_id, payload, flags, period):
+        row = len(self.m_messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.m_messages.append(new_message(next(self.m_keys), frame_id, payload, flags, period))
+        self.endInsertRows()
+        self.messages_changed.emit()
+
+    def remove_rows(self, rows):
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.m_messages[row]
+            self.endRemoveRows()
+        self.messages_changed.emit()
+
+    def set_statistics(self, statistics):
+        self.m_statistics = statistics
+        if self.m_messages:
+            self.dataChanged.emit(self.index(0, COLUMN_SENT),
+                                  self.index(len(self.m_messages) - 1, COLUMN_LATE), [Qt.DisplayRole])
+
+    def headerData(self, section, orientation, role):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return _HEADERS[section]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.m_messages)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(_HEADERS)
+
+    def flags(self, index):
+        result = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == COLUMN_ENABLED:
+            result |= Qt.ItemIsUserCheckable
+        elif index.column() in _EDITABLE:
+            result |= Qt.ItemIsEditable
+        return result
+
+    def data(self, index, role):
+        message = self.m_messages[index.row()]
+        column = index.column()
+        if role == Qt.CheckStateRole and column == COLUMN_ENABLED:
+            return Qt.Checked if message["enabled"] else Qt.Unchecked
+        if role == Qt.TextAlignmentRole and column >= COLUMN_PERIOD:
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        if column == COLUMN_ID:
+            return f"{message['frame_id']:x}"
+        if column == COLUMN_FLAGS:
+            return _format_flags(message["flags"])
+        if column == COLUMN_PAYLOAD:
+            return "Remote Request" if message["flags"] & FLAG_REMOTE and role == Qt.DisplayRole \
+                else message["payload"].hex(" ").upper()
+        if column == COLUMN_PERIOD:
+            return f"{message['period'] * 1000:g}"
+        stats = self.m_statistics.get(message["key"])
+        if stats is None or column == COLUMN_ENABLED:
+            return None
+        if column == COLUMN_SENT:
+            return stats["sent"]
+        if column == COLUMN_JITTER_P99:
+            return f"{stats['jitter']['p99_ms']:.3f}"
+        if column == COLUMN_JITTER_MAX:
+            return f"{stats['jitter']['max_ms']:.3f}"
+        return stats["late"]
+
+    def setData(self, index, value, role):
+        message = self.m_messages[index.row()]
+        column = index.column()
+        if role == Qt.CheckStateRole and column == COLUMN_ENABLED:
+            message["enabled"] = Qt.CheckState(value) == Qt.Checked
+        elif role == Qt.EditRole and column == COLUMN_ID:
+            frame_id = _parse_id(str(value), message["flags"])
+            if frame_id is None:
+                return False
+            message["frame_id"] = frame_id
+        elif role == Qt.EditRole and column == COLUMN_PAYLOAD:
+            payload = _parse_payload(str(value), message["flags"])
+            if payload is None:
+                return False
+            message["payload"] = payload
+        elif role == Qt.EditRole and column == COLUMN_PERIOD:
+            try:
+                period = float(value) / 1000
+            except ValueError:
+                return False
+            message["period"] = new_message(0, period=period)["period"]
+        else:
+            return False
+        self.dataChanged.emit(index, index, [role])
+        self.messages_changed.emit()
+        return True
+
+
+class TransmitTableWindow(QWidget):
+
+    def __init__(self, reader, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("Cyclic Transmit")
+        self.resize(900, 400)
+        self.m_reader = reader
+        self.m_transmitter = None
+
+        # 新行的编辑栏，与 SendFrameBox 使用相同的验证器
+        self.m_idEdit = QLineEdit(self)
+        self.m_idEdit.setPlaceholderText("123")
+        self.m_idValidator = HexIntegerValidator(self)
+        self.m_idEdit.setValidator(self.m_idValidator)
+        self.m_payloadEdit = QLineEdit(self)
+        self.m_payloadEdit.setPlaceholderText("01 02 03 04")
+        self.m_payloadValidator = HexStringValidator(self)
+        self.m_payloadEdit.setValidator(self.m_payloadValidator)
+        self.m_periodBox = QSpinBox(self)
+        self.m_periodBox.setRange(1, 3600000)
+        self.m_periodBox.setSuffix(" ms")
+        self.m_periodBox.setValue(100)
+        self.m_extendedBox = QCheckBox("Extended", self)
+        self.m_fdBox = QCheckBox("FD", self)
+        self.m_brsBox = QCheckBox("BRS", self)
+        self.m_brsBox.setEnabled(False)
+        self.m_remoteBox = QCheckBox("Remote", self)
+        self.m_addButton = QPushButton("&Add", self)
+        self.m_removeButton = QPushButton("&Remove", self)
+        self.m_startButton = QPushButton("&Start", self)
+        self.m_startButton.setCheckable(True)
+        self.m_startButton.setToolTip(TIMING_NOTE)
+
+        self.m_model = TransmitTableModel(self)
+        self.m_view = QTableView(self)
+        self.m_view.setModel(self.m_model)
+        self.m_view.setSelectionBehavior(QTableView.SelectRows)
+        self.m_view.horizontalHeader().setStretchLastSection(True)
+        self.m_status = QLabel(TIMING_NOTE, self)
+        self.m_status.setWordWrap(True)
+        self.m_statisticsTimer = QTimer(self)
+        self.m_statisticsTimer.setInterval(STATISTICS_INTERVAL)
+
+        editor = QHBoxLayout()
+        editor.addWidget(QLabel("ID", self))
+        editor.addWidget(self.m_idEdit)
+        editor.addWidget(QLabel("Payload", self))
+        editor.addWidget(self.m_payloadEdit, 1)
+        editor.addWidget(self.m_periodBox)
+        editor.addWidget(self.m_extendedBox)
+        editor.addWidget(self.m_fdBox)
+        editor.addWidget(self.m_brsBox)
+        editor.addWidget(self.m_remoteBox)
+        editor.addWidget(self.m_addButton)
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.m_removeButton)
+        buttons.addStretch()
+        buttons.addWidget(self.m_startButton)
+        layout = QVBoxLayout(self)
+        layout.addLayout(editor)
+        layout.addWidget(self.m_view)
+        layout.addLayout(buttons)
+        layout.addWidget(self.m_status)
+
+        self.m_extendedBox.toggled.connect(self._extended_toggled)
+        self.m_fdBox.toggled.connect(self._fd_toggled)
+        self.m_remoteBox.toggled.connect(self._remote_toggled)
+        self.m_addButton.clicked.connect(self._add_message)
+        self.m_idEdit.returnPressed.connect(self._add_message)
+        self.m_payloadEdit.returnPressed.connect(self._add_message)
+        self.m_removeButton.clicked.connect(self._remove_messages)
+        self.m_startButton.toggled.connect(self._start_toggled)
+        self.m_model.messages_changed.connect(self._messages_changed)
+        self.m_statisticsTimer.timeout.connect(self._show_statistics)
+
+    @Slot(bool)
+    def _extended_toggled(self, checked):
+        self.m_idValidator.set_maximum(MAX_EXTENDED_ID if checked else MAX_STANDARD_ID)
+
+    @Slot(bool)
+    def _fd_toggled(self, checked):
+        self.m_payloadValidator.set_max_length(MAX_PAYLOAD_FD if checked else MAX_PAYLOAD)
+        self.m_brsBox.setEnabled(checked)
+        if checked:
+            self.m_remoteBox.setChecked(False)
+        else:
+            self.m_brsBox.setChecked(False)
+
+    @Slot(bool)
+    def _remote_toggled(self, checked):
+        if checked:
+            self.m_fdBox.setChecked(False)
+        self.m_payloadEdit.setEnabled(not checked)
+
+    @Slot()
+    def _add_message(self):
+        flags = 0
+        if self.m_extendedBox.isChecked():
+            flags |= FLAG_EXTENDED
+        if self.m_fdBox.isChecked():
+            flags |= FLAG_FLEXIBLE_DATA_RATE
+            if self.m_brsBox.isChecked():
+                flags |= FLAG_BITRATE_SWITCH
+        if self.m_remoteBox.isChecked():
+            flags |= FLAG_REMOTE
+        frame_id = _parse_id(self.m_idEdit.text(), flags)
+        payload = b"" if flags & FLAG_REMOTE else _parse_payload(self.m_payloadEdit.text(), flags)
+        if frame_id is None or payload is None:
+            self.m_status.setText("Enter a valid CAN-ID and an even number of payload hex digits")
+            return
+        self.m_payloadEdit.setText(format_hex_data(payload.hex()))
+        self.m_model.add_message(frame_id, payload, flags, self.m_periodBox.value() / 1000)
+
+    @Slot()
+    def _remove_messages(self):
+        rows = {index.row() for index in self.m_view.selectionModel().selectedRows()}
+        if rows:
+            self.m_model.remove_rows(rows)
+
+    @Slot()
+    def _messages_changed(self):
+        if self.m_transmitter is not None:
+            self.m_transmitter.set_messages(self.m_model.messages())
+
+    @Slot(bool)
+    def _start_toggled(self, checked):
+        if not checked:
+            self.stop_transmit()
+            return
+        self.m_transmitter = CyclicTransmitter(self.m_reader)
+        self.m_transmitter.set_messages(self.m_model.messages())
+        self.m_transmitter.start()
+        self.m_startButton.setText("&Stop")
+        self.m_statisticsTimer.start()
+
+    # 设备连接或断开时由主窗口调用，断开时停止发送
+    def set_device_connected(self, connected):
+        if not connected:
+            self.stop_transmit()
+        self.m_startButton.setEnabled(connected)
+
+    # 停止发送
+    def stop_transmit(self):
+        transmitter = self.m_transmitter
+        if transmitter is None:
+            return
+        self.m_transmitter = None
+        self.m_statisticsTimer.stop()
+        self._show_statistics(transmitter.stop())
+        self.m_startButton.setText("&Start")
+        self.m_startButton.setChecked(False)
+
+    @Slot()
+    def _show_statistics(self, stats=None):
+        if stats is None:
+            if self.m_transmitter is None:
+                return
+            stats = self.m_transmitter.statistics()
+        self.m_model.set_statistics(stats["messages"])
+        text = f"sent {stats['sent']} frames"
+        late = sum(message["late"] for message in stats["messages"].values())
+        if late:
+            text += f", {late} with more than {JITTER_LIMIT * 1000:g} ms jitter"
+        missed = sum(message["missed"] for message in stats["messages"].values())
+        if missed:
+            text += f", {missed} periods missed"
+        if stats["overruns"]:
+            text += f", {stats['overruns']} frames not sent because the device fell behind"
+        if stats["failed"]:
+            text += f", {stats['failed']} failed: {stats['error']}"
+        self.m_status.setText(text)
+
+    def closeEvent(self, event):
+        self.stop_transmit()
+        super().closeEvent(event)
@@ -0,0 +1,181 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+import os
+from collections import deque
+from time import monotonic
+
+from logcodecs import encoder_for_file
+from recorder import LogRecorder
+
+# 触发记录：一直在内存中保留最近 pre_trigger 秒的帧，触发条件满足时把这段触发前的帧和之后 post_trigger 秒的帧
+# 写入一个日志文件，长时间运行中只保存罕见故障前后的数据，而不是全部的记录。
+#
+# 触发条件：
+#   过滤表达式（见 filterengine），例如 "id 0x123"、"data[0] 0x80/0xf0"、"type error"，对每批帧整列求值
+#   trigger()，例如主窗口在总线状态（bus_status）改变时调用，触发时刻为最后收到的帧的时间戳
+# 每次触发写一个文件 "<基本名>-trigger-0001.<扩展名>"，格式由扩展名决定（见 logcodecs.encoder_for_file）。
+# 文件包含时间戳在 [触发时刻 - pre_trigger, 触发时刻 + post_trigger] 内的帧；触发后的窗口内再次满足的条件不另外触发，
+# 窗口结束后的下一次触发写新的文件，两个文件的时间范围可以重叠。max_events 不为 0 时，触发这么多次后不再触发。
+#
+# 与 recorder.LogRecorder 相同，接收线程只在锁内追加批次的引用，条件求值、环形缓冲区和写文件都在写线程中。
+# 环形缓冲区保存批次本身（列式的 FrameBatch，与模型共享，不复制），按时间和 max_ring_frames 丢弃最旧的批次。
+# 窗口按帧的时间戳计算；总线异常时可能不再收到帧，所以触发后超过 post_trigger + WALL_SLACK 秒（墙上时间）也结束窗口。
+
+MAX_RING_FRAMES = 4000000  # 环形缓冲区最多保存的帧数，约 330 MB
+WALL_SLACK = 1.0  # 按墙上时间结束窗口时额外等待的秒数
+
+
+class TriggerCapture(LogRecorder):
+    """触发记录器，接口与 LogRecorder 相同。frame_filter 为 filterengine.FrameFilter 或 None（只用 trigger()）。
+
+    statistics() 中的 written 为检查过的帧数，captured 为写入文件的帧数。trigger() 可以在任何线程中调用。
+    """
+
+    def __init__(self, file_name, frame_filter=None, pre_trigger=10.0, post_trigger=10.0, max_events=0,
+                 max_ring_frames=MAX_RING_FRAMES, **kwargs):
+        super().__init__(file_name, **kwargs)
+        self.m_filter = frame_filter
+        self.m_pre = int(pre_trigger * 1000000)
+        self.m_post = int(post_trigger * 1000000)
+        self.m_maxEvents = max_events
+        self.m_maxRingFrames = max_ring_frames
+        self.m_base, self.m_extension = os.path.splitext(file_name)
+
+        # 以下成员只在写线程中使用
+        self.m_ring = deque()
+        self.m_ringFrames = 0
+        self.m_lastTimestamp = 0
+        self.m_deadline = None  # 正在写的窗口的结束时刻（帧时间戳），None 表示没有在写
+        self.m_wallDeadline = 0.0
+
+        # 以下成员由 m_condition 的锁保护
+        self.m_triggerReason = ""  # trigger() 请求的、还没有处理的触发
+        self.m_events = 0
+        self.m_captured = 0
+        self.m_eventName = ""
+        self.m_lastReason = ""
+        self.m_ringStatistics = (0, 0.0)  # 环形缓冲区中的帧数和秒数
+
+    def trigger(self, reason):
+        with self.m_condition:
+            if not self.m_triggerReason:
+                self.m_triggerReason = reason
+            self.m_condition.notify()
+
+    def statistics(self):
+        stats = super().statistics()
+        with self.m_condition:
+            ring_frames, ring_seconds = self.m_ringStatistics
+            stats.update(events=self.m_events, captured=self.m_captured, capturing=self.m_eventName,
+                         reason=self.m_lastReason, ring_frames=ring_frames, ring_seconds=round(ring_seconds, 3))
+        return stats
+
+    def _open(self):
+        return 0
+
+    def _armed(self):
+        return not self.m_maxEvents or self.m_events < self.m_maxEvents
+
+    # 开始一个窗口：打开新文件，写入环形缓冲区中时间戳不早于 timestamp - pre_trigger 的帧和 pending 中的帧
+    def _start_event(self, timestamp, reason, pending=()):
+        with self.m_condition:
+            self.m_events += 1
+            name = f"{self.m_base}-trigger-{self.m_events:04d}{self.m_extension}"
+            self.m_eventName = name
+            self.m_lastReason = reason
+        self.m_encoder = encoder_for_file(name)
+        self.m_file = open(name, "wb", buffering=0)
+        self.m_deadline = timestamp + self.m_post
+        written = self._write_all(self.m_encoder.begin())
+        self.m_wallDeadline = monotonic() + self.m_post / 1000000 + WALL_SLACK
+        first = timestamp - self.m_pre
+        before = []
+        for batch in list(self.m_ring) + list(pending):
+            if len(batch) and batch.timestamp.max() >= first:
+                before.append(batch.select(batch.timestamp >= first))
+        return written + self._capture(before)
+
+    def _end_event(self, ok=True):
+        self.m_deadline = None
+        with self.m_condition:
+            self.m_eventName = ""
+        return super()._close(ok)
+
+    def _capture(self, batches):
+        count = sum(len(batch) for batch in batches)
+        if not count:
+            return 0
+        written = super()._write(batches)
+        with self.m_condition:
+            self.m_captured += count
+        return written
+
+    def _take_trigger(self):
+        with self.m_condition:
+            reason = self.m_triggerReason
+            self.m_triggerReason = ""
+        return reason
+
+    def _write(self, batches):
+        written = 0
+        for batch in batches:
+            written += self._process(batch)
+            self.m_ring.append(batch)
+            self.m_ringFrames += len(batch)
+        self._trim_ring()
+        return written
+
+    # 处理一批帧：写入窗口内的部分，在窗口外找下一次触发
+    def _process(self, batch):
+        written = 0
+        reason = self._take_trigger()
+        if reason and self.m_deadline is None and self._armed():
+            written += self._start_event(self.m_lastTimestamp or int(batch.timestamp[0]), reason)
+        timestamps = batch.timestamp
+        matches = self.m_filter.mask(batch) if self.m_filter is not None else None
+        position = 0
+        while position < len(batch):
+            if self.m_deadline is not None:
+                after = (timestamps[position:] > self.m_deadline).nonzero()[0]
+                end = position + int(after[0]) if len(after) else len(batch)
+                written += self._capture([batch.slice(position, end)])
+                position = end
+                if end < len(batch) or monotonic() > self.m_wallDeadline:
+                    written += self._end_event()
+                continue
+            if matches is None or not self._armed():
+                break
+            hits = matches[position:].nonzero()[0]
+            if not len(hits):
+                break
+            row = position + int(hits[0])
+            reason = f"frame {int(batch.can_id[row]):x} matched '{self.m_filter.text()}'"
+            written += self._start_event(int(timestamps[row]), reason, [batch.slice(0, row)])
+            position = row
+        self.m_lastTimestamp = int(timestamps[-1])
+        return written
+
+    def _trim_ring(self):
+        ring = self.m_ring
+        first = self.m_lastTimestamp - self.m_pre
+        while ring and (self.m_ringFrames > self.m_maxRingFrames
+                        or (len(ring[0]) and int(ring[0].timestamp.max()) < first)):
+            self.m_ringFrames -= len(ring.popleft())
+        seconds = (self.m_lastTimestamp - int(ring[0].timestamp[0])) / 1000000 if ring and len(ring[0]) else 0.0
+        with self.m_condition:
+            self.m_ringStatistics = (self.m_ringFrames, seconds)
+
+    # 没有新的帧：处理 trigger() 的请求，按墙上时间结束窗口
+    def _idle(self):
+        written = 0
+        reason = self._take_trigger()
+        if reason and self.m_deadline is None and self._armed():
+            written += self._start_event(self.m_lastTimestamp, reason)
+        if self.m_deadline is not None and monotonic() > self.m_wallDeadline:
+            written += self._end_event()
+        return written
+
+    # 停止时结束正在写的窗口，窗口中还没有收到的帧不再等待
+    def _close(self, ok):
+        return self._end_event(ok) if self.m_deadline is not None else 0
@@ -0,0 +1,79 @@
+# Copyright (C) 2022 The Qt Company Ltd.
+# SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
+
+from PySide6.QtWidgets import (QCheckBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QFormLayout, QLabel,
+                               QLineEdit, QSpinBox)
+
+from filterengine import FilterSyntaxError, compile_filter
+
+# 触发记录（见 triggercapture.TriggerCapture）的设置对话框。触发条件为过滤表达式和/或总线状态的改变，
+# 两者都没有时不能开始。
+
+# 设置的默认值
+default_trigger = {"filter": "type error", "bus_status": True, "pre_trigger": 10.0, "post_trigger": 10.0,
+                   "max_events": 0}
+
+
+class TriggerDialog(QDialog):
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Trigger Capture")
+        self.m_filter = None
+
+        self.m_filterEdit = QLineEdit(settings["filter"], self)
+        self.m_filterEdit.setPlaceholderText("e.g. id 0x123, data[0] 0x80/0xf0 or type error")
+        self.m_filterEdit.setMinimumWidth(300)
+        self.m_busStatusBox = QCheckBox("Trigger when the bus status changes", self)
+        self.m_busStatusBox.setChecked(settings["bus_status"])
+        self.m_preBox = QDoubleSpinBox(self)
+        self.m_preBox.setRange(0, 3600)
+        self.m_preBox.setDecimals(1)
+        self.m_preBox.setSuffix(" s")
+        self.m_preBox.setValue(settings["pre_trigger"])
+        self.m_postBox = QDoubleSpinBox(self)
+        self.m_postBox.setRange(0, 3600)
+        self.m_postBox.setDecimals(1)
+        self.m_postBox.setSuffix(" s")
+        self.m_postBox.setValue(settings["post_trigger"])
+        self.m_eventsBox = QSpinBox(self)
+        self.m_eventsBox.setRange(0, 1000000)
+        self.m_eventsBox.setSpecialValueText("Unlimited")
+        self.m_eventsBox.setValue(settings["max_events"])
+        self.m_error = QLabel(self)
+        self.m_error.setStyleSheet("QLabel { color: red; }")
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout = QFormLayout(self)
+        layout.addRow("Trigger on frames matching", self.m_filterEdit)
+        layout.addRow(self.m_busStatusBox)
+        layout.addRow("Keep before the trigger", self.m_preBox)
+        layout.addRow("Keep after the trigger", self.m_postBox)
+        layout.addRow("Stop after events", self.m_eventsBox)
+        layout.addRow(self.m_error)
+        layout.addRow(buttons)
+
+    # 过滤表达式有错误或者没有任何触发条件时不关闭对话框
+    def accept(self):
+        try:
+            self.m_filter = compile_filter(self.m_filterEdit.text())
+        except FilterSyntaxError as e:
+            self.m_error.setText(f"Filter error: {e}")
+            return
+        if self.m_filter is None and not self.m_busStatusBox.isChecked():
+            self.m_error.setText("Enter a filter or trigger on the bus status")
+            return
+        super().accept()
+
+    def settings(self):
+        return {"filter": self.m_filterEdit.text(),
+                "bus_status": self.m_busStatusBox.isChecked(),
+                "pre_trigger": self.m_preBox.value(),
+                "post_trigger": self.m_postBox.value(),
+                "max_events": self.m_eventsBox.value()}
+
+    # 编译好的过滤表达式，表达式为空时为 None
+    def frame_filter(self):
+        return self.m_filter